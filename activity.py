@@ -0,0 +1,83 @@
+"""Учёт активности пользователей.
+
+ActivityMiddleware на каждое сообщение и нажатие кнопки запоминает в памяти
+время, username и имя пользователя. Раз в ACTIVITY_FLUSH_INTERVAL секунд
+накопленное пишется в users одним executemany в одной транзакции: обращения
+одного пользователя между сбросами схлопываются в одну строку, а если имя
+не менялось, last_active обновляется не чаще раза в ACTIVITY_MIN_INTERVAL
+секунд. Так сегменты рассылки active/inactive и имена в админке актуальны,
+а на каждое обновление не приходится отдельной записи в БД.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import ACTIVITY_FLUSH_INTERVAL, ACTIVITY_MIN_INTERVAL, ACTIVITY_MAX_TRACKED
+from async_db import save_user_activity
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    def __init__(self, flush_interval: float = ACTIVITY_FLUSH_INTERVAL, min_interval: int = ACTIVITY_MIN_INTERVAL,
+                 max_tracked: int = ACTIVITY_MAX_TRACKED):
+        self.flush_interval = flush_interval
+        self.min_interval = min_interval
+        self.max_tracked = max_tracked
+        self._dirty = {}             # user_id -> (username, full_name, epoch), ещё не записано
+        self._saved = OrderedDict()  # user_id -> то же, что последним записано в БД (LRU)
+        self._task = None
+        self._closed = False
+
+    def record(self, user):
+        if user is None or user.is_bot:
+            return
+        now = int(time.time())
+        saved = self._saved.get(user.id)
+        if (user.id not in self._dirty and saved and saved[:2] == (user.username, user.full_name)
+                and now - saved[2] < self.min_interval):
+            return
+        self._dirty[user.id] = (user.username, user.full_name, now)
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await save_user_activity([(user_id, *entry) for user_id, entry in batch.items()])
+        except Exception:
+            # вернём в очередь, если пользователь не успел отметиться заново
+            for user_id, entry in batch.items():
+                self._dirty.setdefault(user_id, entry)
+            raise
+        for user_id, entry in batch.items():
+            self._saved[user_id] = entry
+            self._saved.move_to_end(user_id)
+        while len(self._saved) > self.max_tracked:
+            self._saved.popitem(last=False)
+
+    async def forget_saved(self):
+        """Забывает, что записано в БД (после восстановления из бэкапа), чтобы
+        следующее обращение пользователя снова записало его имя и время"""
+        self._saved.clear()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка записи активности пользователей")
+
+    async def close(self):
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+activity_tracker = ActivityTracker()
@@ -0,0 +1,232 @@
+"""Асинхронные обёртки над database.py.
+
+Запросы выполняются в пуле потоков, чтобы медленный SELECT или fsync
+не останавливал цикл событий aiogram. Все записи идут через один поток
+(SQLite всё равно допускает одного писателя), чтения — параллельно.
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from config import DB_READ_WORKERS, DB_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+_pending = None  # семафор создаётся лениво, внутри работающего цикла событий
+_saturation_logged_at = 0.0
+
+async def _run(executor, func, *args, **kwargs):
+    global _pending, _saturation_logged_at
+    if _pending is None:
+        _pending = asyncio.Semaphore(DB_MAX_PENDING)
+    if _pending.locked() and time.monotonic() - _saturation_logged_at > 10:
+        _saturation_logged_at = time.monotonic()
+        logger.warning("⏳ Очередь запросов к БД заполнена, хендлеры ожидают")
+    async with _pending:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+def _reader(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await _run(_read_executor, func, *args, **kwargs)
+    return wrapper
+
+def _writer(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await _run(_write_executor, func, *args, **kwargs)
+    return wrapper
+
+def _settings_reader(func):
+    """Пока кеш admin_settings свежий, чтение идёт прямо из памяти, без пула потоков"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if database.settings_cache_is_fresh():
+            return func(*args, **kwargs)
+        return await _run(_read_executor, func, *args, **kwargs)
+    return wrapper
+
+def _blacklist_reader(func):
+    """Когда автомат чёрного списка уже собран, проверка идёт прямо в цикле событий"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if database.blacklist_matcher_is_ready():
+            return func(*args, **kwargs)
+        return await _run(_read_executor, func, *args, **kwargs)
+    return wrapper
+
+async def run_read(func, *args, **kwargs):
+    """Выполняет произвольную синхронную функцию чтения в пуле читателей"""
+    return await _run(_read_executor, func, *args, **kwargs)
+
+async def run_write(func, *args, **kwargs):
+    """Выполняет произвольную синхронную функцию записи в потоке-писателе"""
+    return await _run(_write_executor, func, *args, **kwargs)
+
+def shutdown():
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    database.close_connections()
+
+# ===== ВРЕМЯ =====
+# чистые функции, в пул потоков не уходят
+now_epoch = database.now_epoch
+epoch_after = database.epoch_after
+format_epoch = database.format_epoch
+
+# ===== БАЗОВЫЕ ФУНКЦИИ =====
+init_db = _writer(database.init_db)
+db_exec = _writer(database.db_exec)
+db_fetch = _reader(database.db_fetch)
+db_fetch_one = _reader(database.db_fetch_one)
+
+# ===== ПОЛЬЗОВАТЕЛИ =====
+create_user = _writer(database.create_user)
+get_user = _reader(database.get_user)
+get_users_by_ids = _reader(database.get_users_by_ids)
+get_user_context = _reader(database.get_user_context)
+get_user_by_username = _reader(database.get_user_by_username)
+save_user_activity = _writer(database.save_user_activity)
+is_banned = _reader(database.is_banned)
+ban_user = _writer(database.ban_user)
+unban_user = _writer(database.unban_user)
+unban_if_expired = _writer(database.unban_if_expired)
+get_upcoming_expiries = _reader(database.get_upcoming_expiries)
+is_vip = _reader(database.is_vip)
+add_vip_days = _writer(database.add_vip_days)
+remove_vip = _writer(database.remove_vip)
+get_user_stats = _reader(database.get_user_stats)
+rebuild_user_stats = _writer(database.rebuild_user_stats)
+get_top_users = _reader(database.get_top_users)
+refresh_rating_cache = _writer(database.refresh_rating_cache)
+get_all_users = _reader(database.get_all_users)
+get_vip_users = _reader(database.get_vip_users)
+get_active_users_count = _reader(database.get_active_users_count)
+get_banned_users = _reader(database.get_banned_users)
+
+# ===== ПРИЗНАНИЯ И ЖАЛОБЫ =====
+create_confession = _writer(database.create_confession)
+get_confession = _reader(database.get_confession)
+get_confessions_by_user = _reader(database.get_confessions_by_user)
+delete_confession = _writer(database.delete_confession)
+delete_old_confessions_batch = _writer(database.delete_old_confessions_batch)
+update_confession_message_id = _writer(database.update_confession_message_id)
+update_reveal_status = _writer(database.update_reveal_status)
+get_total_confessions_count = _reader(database.get_total_confessions_count)
+create_report = _writer(database.create_report)
+delete_report = _writer(database.delete_report)
+delete_old_reports_batch = _writer(database.delete_old_reports_batch)
+delete_orphan_reports_batch = _writer(database.delete_orphan_reports_batch)
+incremental_vacuum = _writer(database.incremental_vacuum)
+enable_incremental_vacuum = _writer(database.enable_incremental_vacuum)
+get_auto_vacuum = _reader(database.get_auto_vacuum)
+checkpoint_wal = _writer(database.checkpoint_wal)
+get_page_size = _reader(database.get_page_size)
+restore_database = _writer(database.restore_database)
+get_pending_reports_count = _reader(database.get_pending_reports_count)
+
+# ===== ПРОМОКОДЫ =====
+create_promo_code = _writer(database.create_promo_code)
+get_promo_codes = _reader(database.get_promo_codes)
+delete_promo_code = _writer(database.delete_promo_code)
+get_promo_code = _reader(database.get_promo_code)
+activate_promo_code = _writer(database.activate_promo_code)
+get_promo_activations = _reader(database.get_promo_activations)
+
+# ===== АДМИНИСТРИРОВАНИЕ =====
+get_user_role = _reader(database.get_user_role)
+add_admin_role = _writer(database.add_admin_role)
+remove_admin_role = _writer(database.remove_admin_role)
+get_all_admins = _reader(database.get_all_admins)
+get_admin_settings = _settings_reader(database.get_admin_settings)
+set_admin_settings = _writer(database.set_admin_settings)
+get_settings_cache_stats = database.get_settings_cache_stats
+add_notification = _writer(database.add_notification)
+add_notifications = _writer(database.add_notifications)
+get_pending_notifications = _reader(database.get_pending_notifications)
+mark_notification_sent = _writer(database.mark_notification_sent)
+claim_notifications = _writer(database.claim_notifications)
+complete_notifications = _writer(database.complete_notifications)
+reap_notification_leases = _writer(database.reap_notification_leases)
+create_notification_job = _writer(database.create_notification_job)
+get_notification_job_status = _reader(database.get_notification_job_status)
+finish_notification_jobs = _writer(database.finish_notification_jobs)
+add_admin_log = _writer(database.add_admin_log)
+get_admin_logs = _reader(database.get_admin_logs)
+set_maintenance = _writer(database.set_maintenance)
+is_maintenance = _settings_reader(database.is_maintenance)
+
+# ===== МОДЕРАЦИЯ =====
+add_blacklist_word = _writer(database.add_blacklist_word)
+remove_blacklist_word = _writer(database.remove_blacklist_word)
+get_blacklist_words = _reader(database.get_blacklist_words)
+check_text_blacklist = _blacklist_reader(database.check_text_blacklist)
+add_warn = _writer(database.add_warn)
+remove_warn = _writer(database.remove_warn)
+get_warns = _reader(database.get_warns)
+
+# ===== ДОСТИЖЕНИЯ =====
+create_achievement = _writer(database.create_achievement)
+delete_achievement = _writer(database.delete_achievement)
+get_all_achievements = _reader(database.get_all_achievements)
+get_achievement = _reader(database.get_achievement)
+award_achievement = _writer(database.award_achievement)
+remove_achievement = _writer(database.remove_achievement)
+get_user_achievements = _reader(database.get_user_achievements)
+check_achievement_milestones = _writer(database.check_achievement_milestones)
+
+# ===== ИГРА "КТО Я?" =====
+create_whois_game = _writer(database.create_whois_game)
+get_whois_game = _reader(database.get_whois_game)
+get_whois_game_by_creator = _reader(database.get_whois_game_by_creator)
+get_whois_game_by_opponent = _reader(database.get_whois_game_by_opponent)
+set_whois_opponent = _writer(database.set_whois_opponent)
+increment_questions_asked = _writer(database.increment_questions_asked)
+complete_whois_game = _writer(database.complete_whois_game)
+delete_whois_game = _writer(database.delete_whois_game)
+is_whois_enabled = _settings_reader(database.is_whois_enabled)
+
+# ===== АНОНИМНЫЙ БАТЛ =====
+add_battle_participant = _writer(database.add_battle_participant)
+remove_battle_participant = _writer(database.remove_battle_participant)
+get_battle_participants = _reader(database.get_battle_participants)
+clear_battle_participants = _writer(database.clear_battle_participants)
+is_battle_enabled = _settings_reader(database.is_battle_enabled)
+
+# ===== РАССЫЛКИ =====
+BROADCAST_FILTERS = database.BROADCAST_FILTERS
+count_broadcast_recipients = _reader(database.count_broadcast_recipients)
+get_broadcast_recipients = _reader(database.get_broadcast_recipients)
+create_broadcast_job = _writer(database.create_broadcast_job)
+set_broadcast_progress_message = _writer(database.set_broadcast_progress_message)
+save_broadcast_progress = _writer(database.save_broadcast_progress)
+finish_broadcast_job = _writer(database.finish_broadcast_job)
+get_broadcast_job = _reader(database.get_broadcast_job)
+get_running_broadcast_jobs = _reader(database.get_running_broadcast_jobs)
+set_user_blocked_bot = _writer(database.set_user_blocked_bot)
+
+# ===== СОСТОЯНИЯ FSM =====
+load_fsm_state = _reader(database.load_fsm_state)
+save_fsm_states = _writer(database.save_fsm_states)
+delete_expired_fsm_states = _writer(database.delete_expired_fsm_states)
+
+# ===== АНАЛИТИКА =====
+ROLLUP_SOURCES = database.ROLLUP_SOURCES
+get_dashboard_stats = _reader(database.get_dashboard_stats)
+get_rollup_series = _reader(database.get_rollup_series)
+get_activity_by_hour = _reader(database.get_activity_by_hour)
+
+# ===== ЛЕНТА ПРИЗНАНИЙ =====
+get_confession_feed = _reader(database.get_confession_feed)
+count_confession_feed = _reader(database.count_confession_feed)
+
+# ===== ЭКСПОРТ =====
+# генератор со своим соединением, потребляется в потоке экспорта (export.py)
+EXPORT_TABLES = database.EXPORT_TABLES
+iter_export_rows = database.iter_export_rows
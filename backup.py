@@ -0,0 +1,174 @@
+"""Резервные копии базы.
+
+Копия снимается SQLite backup API (Connection.backup) в отдельном потоке,
+шагами по BACKUP_STEP_PAGES страниц. Всё время копирования источник держит
+открытую транзакцию чтения: в режиме WAL она не мешает записи, а снимок
+остаётся согласованным, и копирование не начинается заново из-за новых
+записей. Готовая копия проверяется PRAGMA integrity_check, потоком сжимается
+gzip и кладётся в BACKUP_PATH; хранятся BACKUP_KEEP последних.
+
+Перед восстановлением компоненты с данными в памяти сбрасывают их в базу
+(хуки before из add_restore_hook), иначе они пропали бы из страховой копии
+или записались бы поверх восстановленной базы. После замены файла хуки after
+перечитывают состояние из новой базы.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+from config import (
+    DB_PATH, DB_BUSY_TIMEOUT, BACKUP_PATH, BACKUP_INTERVAL, BACKUP_KEEP,
+    BACKUP_STEP_PAGES, BACKUP_STEP_SLEEP
+)
+from async_db import restore_database
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "confessions_backup_"
+BACKUP_SUFFIX = ".db.gz"
+CHUNK_SIZE = 1024 * 1024
+
+_lock = None  # бэкап и восстановление не выполняются одновременно
+_restore_hooks = []  # (before, after): корутинные функции без аргументов или None
+
+
+class BackupError(Exception):
+    pass
+
+
+def add_restore_hook(before=None, after=None):
+    _restore_hooks.append((before, after))
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+def _snapshot(dest_path: str):
+    src = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    dst = sqlite3.connect(dest_path)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # фиксирует снимок
+        src.backup(dst, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+        src.execute("ROLLBACK")
+    finally:
+        dst.close()
+        src.close()
+
+
+def _verify(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        errors = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    if errors != ["ok"]:
+        raise BackupError(f"Копия повреждена: {'; '.join(errors[:5])}")
+
+
+def _compress(src_path: str, dest_path: str):
+    tmp_path = dest_path + ".tmp"
+    with open(src_path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.replace(tmp_path, dest_path)
+
+
+def _decompress(src_path: str, dest_path: str):
+    with gzip.open(src_path, "rb") as src, open(dest_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def list_backups() -> list:
+    """(имя файла, размер в байтах), новые первыми"""
+    if not os.path.isdir(BACKUP_PATH):
+        return []
+    names = sorted(
+        (name for name in os.listdir(BACKUP_PATH) if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)),
+        reverse=True
+    )
+    return [(name, os.path.getsize(os.path.join(BACKUP_PATH, name))) for name in names]
+
+
+def _rotate():
+    for name, _ in list_backups()[BACKUP_KEEP:]:
+        _remove(os.path.join(BACKUP_PATH, name))
+        logger.info(f"🗑 Удалён старый бэкап {name}")
+
+
+def _make_backup() -> tuple:
+    os.makedirs(BACKUP_PATH, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}{BACKUP_SUFFIX}"
+    path = os.path.join(BACKUP_PATH, name)
+    raw_path = path + ".raw"
+    try:
+        _snapshot(raw_path)
+        _verify(raw_path)
+        _compress(raw_path, path)
+    finally:
+        _remove(raw_path)
+    _rotate()
+    return name, os.path.getsize(path)
+
+
+async def create_backup() -> tuple:
+    """Делает проверенный сжатый бэкап. Возвращает (имя файла, размер в байтах)."""
+    async with _get_lock():
+        loop = asyncio.get_running_loop()
+        name, size = await loop.run_in_executor(None, _make_backup)
+    logger.info(f"💾 Бэкап создан: {name} ({size / 1024 / 1024:.1f} МБ)")
+    return name, size
+
+
+async def restore_backup(name: str) -> str:
+    """Восстанавливает базу из бэкапа name. Перед этим сохраняет бэкап текущей базы
+    и возвращает его имя."""
+    if name not in {backup for backup, _ in list_backups()}:
+        raise BackupError(f"Бэкап {name} не найден")
+    async with _get_lock():
+        loop = asyncio.get_running_loop()
+        raw_path = os.path.join(BACKUP_PATH, name + ".restore")
+        try:
+            await loop.run_in_executor(None, _decompress, os.path.join(BACKUP_PATH, name), raw_path)
+            await loop.run_in_executor(None, _verify, raw_path)
+            try:
+                for before, _ in _restore_hooks:
+                    if before:
+                        # не удалось сбросить данные из памяти — не восстанавливаем
+                        await before()
+                safety_name, _ = await loop.run_in_executor(None, _make_backup)
+                await restore_database(raw_path)
+            finally:
+                for _, after in _restore_hooks:
+                    if after:
+                        try:
+                            await after()
+                        except Exception:
+                            logger.exception("Ошибка перезагрузки данных после восстановления")
+        finally:
+            _remove(raw_path)
+    logger.warning(f"♻️ База восстановлена из {name}, прежняя сохранена в {safety_name}")
+    return safety_name
+
+
+async def backup_scheduler():
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            await create_backup()
+        except Exception:
+            logger.exception("Ошибка автоматического бэкапа")
@@ -0,0 +1,99 @@
+"""Поиск слов из чёрного списка в тексте.
+
+Слова и текст приводятся к одному виду (NFKC, casefold, ё → е, латинские
+буквы-двойники → кириллица в словах, где смешаны алфавиты), после чего все
+слова ищутся за один проход по тексту автоматом Ахо — Корасик. Как и раньше,
+слово находится и внутри других слов («спам» в «спамер»).
+"""
+import re
+import unicodedata
+
+# Латинские буквы, которые в строчном виде неотличимы от кириллических.
+# Заменяются только в словах, где есть и кириллица, и латиница («cпaм»):
+# обычный латинский текст не превращается в кириллицу и не совпадает
+# с кириллическими словами из списка.
+_LOOKALIKES = str.maketrans({
+    "a": "а", "c": "с", "e": "е", "o": "о", "p": "р", "x": "х", "y": "у",
+})
+_WORD = re.compile(r"\w+")
+_CYRILLIC = re.compile(r"[а-я]")
+_LATIN = re.compile(r"[a-z]")
+
+
+def _unify_word(match) -> str:
+    word = match.group()
+    if _CYRILLIC.search(word) and _LATIN.search(word):
+        return word.translate(_LOOKALIKES)
+    return word
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+    return _WORD.sub(_unify_word, text)
+
+
+class BlacklistMatcher:
+    """Автомат Ахо — Корасик над нормализованными словами.
+    Строится один раз, find() проходит текст за O(длина текста + число совпадений)."""
+
+    def __init__(self, words):
+        self.words = []
+        self._goto = [{}]       # переходы по символу для каждого состояния
+        self._fail = [0]        # суффиксная ссылка
+        self._term = [-1]       # индекс слова, которое заканчивается в состоянии
+        self._dict_link = [0]   # ближайшее по суффиксным ссылкам конечное состояние
+        for word in words:
+            self._add(word)
+        self._build()
+
+    def __len__(self):
+        return len(self.words)
+
+    def _add(self, word: str):
+        key = normalize(word).strip()
+        if not key:
+            return
+        state = 0
+        for char in key:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._term.append(-1)
+                self._dict_link.append(0)
+            state = nxt
+        if self._term[state] == -1:
+            self._term[state] = len(self.words)
+            self.words.append(word)
+
+    def _build(self):
+        goto, fail, term, dict_link = self._goto, self._fail, self._term, self._dict_link
+        queue = list(goto[0].values())
+        for state in queue:  # обход в ширину, queue растёт по ходу
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                target = goto[link].get(char, 0)
+                fail[nxt] = target if target != nxt else 0
+                dict_link[nxt] = fail[nxt] if term[fail[nxt]] != -1 else dict_link[fail[nxt]]
+
+    def find(self, text: str) -> list:
+        """Слова из списка, встретившиеся в тексте, в порядке первого вхождения"""
+        if not self.words:
+            return []
+        goto, fail, term, dict_link = self._goto, self._fail, self._term, self._dict_link
+        found = {}
+        state = 0
+        for char in normalize(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if term[state] != -1 else dict_link[state]
+            while match:
+                found.setdefault(term[match], None)
+                match = dict_link[match]
+        return [self.words[i] for i in found]
@@ -0,0 +1,177 @@
+"""Фоновые рассылки.
+
+Рассылка — строка в broadcast_jobs. Получатели читаются из users страницами
+по возрастанию id, после каждой страницы курсор и счётчики сохраняются,
+поэтому после перезапуска бота незавершённые рассылки продолжаются с места
+остановки (повторно может уйти не больше одной страницы).
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.utils.exceptions import (
+    RetryAfter, Unauthorized, ChatNotFound, NetworkError, RestartingTelegram, TelegramAPIError
+)
+
+from config import (
+    BROADCAST_CONCURRENCY, BROADCAST_PAGE_SIZE, BROADCAST_PROGRESS_INTERVAL, MAX_BROADCAST_RETRIES
+)
+from async_db import (
+    count_broadcast_recipients, get_broadcast_recipients, create_broadcast_job,
+    set_broadcast_progress_message, save_broadcast_progress, finish_broadcast_job,
+    get_broadcast_job, get_running_broadcast_jobs
+)
+from ratelimit import telegram_limiter
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_SENT = "sent"
+DELIVERY_BLOCKED = "blocked"
+DELIVERY_FAILED = "failed"
+DELIVERY_RETRY = "retry"  # временная ошибка не прошла за MAX_BROADCAST_RETRIES попыток
+
+_TRANSIENT_ERRORS = (NetworkError, RestartingTelegram, asyncio.TimeoutError)
+
+_tasks = {}  # job_id -> asyncio.Task
+
+
+async def deliver(bot: Bot, chat_id: int, text: str, **kwargs) -> str:
+    """Отправляет сообщение через общий лимитер.
+    RetryAfter и сетевые ошибки повторяются до MAX_BROADCAST_RETRIES раз,
+    после чего возвращается DELIVERY_RETRY."""
+    for attempt in range(MAX_BROADCAST_RETRIES + 1):
+        await telegram_limiter.acquire(chat_id)
+        try:
+            await bot.send_message(chat_id, text, **kwargs)
+            return DELIVERY_SENT
+        except RetryAfter as e:
+            telegram_limiter.retry_after(e.timeout)
+            delay = e.timeout
+        except (Unauthorized, ChatNotFound):
+            return DELIVERY_BLOCKED
+        except _TRANSIENT_ERRORS as e:
+            logger.warning(f"Временная ошибка отправки {chat_id} (попытка {attempt + 1}): {e}")
+            delay = min(2 ** attempt, 30)
+        except TelegramAPIError as e:
+            logger.warning(f"Не удалось отправить сообщение {chat_id}: {e}")
+            return DELIVERY_FAILED
+        if attempt < MAX_BROADCAST_RETRIES:
+            await asyncio.sleep(delay)
+    return DELIVERY_RETRY
+
+
+def _progress_text(job_id: int, total: int, sent: int, failed: int, blocked: int, status: str = "running") -> str:
+    done = sent + failed + blocked
+    title = {
+        "running": "📣 Рассылка #{} идёт",
+        "done": "✅ Рассылка #{} завершена",
+        "cancelled": "⛔ Рассылка #{} остановлена",
+    }[status].format(job_id)
+    return (
+        f"{title}\n"
+        f"Обработано: {done}/{total}\n"
+        f"Доставлено: {sent}\n"
+        f"Заблокировали бота: {blocked}\n"
+        f"Ошибок: {failed}"
+    )
+
+
+async def _show_progress(bot: Bot, job, sent: int, failed: int, blocked: int, status: str = "running"):
+    if not job.progress_message_id:
+        return
+    try:
+        await bot.edit_message_text(
+            _progress_text(job.id, job.total, sent, failed, blocked, status),
+            job.chat_id, job.progress_message_id
+        )
+    except TelegramAPIError:
+        pass
+
+
+async def _run_job(bot: Bot, job):
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    sent, failed, blocked = job.sent, job.failed, job.blocked
+    cursor = job.last_user_id
+    shown_at = time.monotonic()
+
+    async def send_one(user_id: int) -> str:
+        async with semaphore:
+            return await deliver(bot, user_id, job.text)
+
+    try:
+        while True:
+            page = await get_broadcast_recipients(job.filter_type, cursor, BROADCAST_PAGE_SIZE)
+            if not page:
+                break
+            results = await asyncio.gather(*(send_one(uid) for uid in page))
+            blocked_users = [uid for uid, result in zip(page, results) if result == DELIVERY_BLOCKED]
+            sent += results.count(DELIVERY_SENT)
+            failed += results.count(DELIVERY_FAILED) + results.count(DELIVERY_RETRY)
+            blocked += len(blocked_users)
+            cursor = page[-1]
+            await save_broadcast_progress(job.id, cursor, sent, failed, blocked, blocked_users)
+            if time.monotonic() - shown_at >= BROADCAST_PROGRESS_INTERVAL:
+                shown_at = time.monotonic()
+                await _show_progress(bot, job, sent, failed, blocked)
+        if await finish_broadcast_job(job.id, "done"):
+            await _show_progress(bot, job, sent, failed, blocked, "done")
+        logger.info(f"📣 Рассылка #{job.id} завершена: {sent} доставлено, {blocked} заблокировали, {failed} ошибок")
+    except asyncio.CancelledError:
+        # Остановка бота: статус остаётся running, рассылка продолжится после запуска
+        raise
+    except Exception:
+        logger.exception(f"Ошибка рассылки #{job.id}")
+    finally:
+        _tasks.pop(job.id, None)
+
+
+def _spawn(bot: Bot, job):
+    _tasks[job.id] = asyncio.create_task(_run_job(bot, job))
+
+
+async def start_broadcast(bot: Bot, admin_id: int, chat_id: int, filter_type: str, text: str):
+    """Создаёт рассылку и запускает её в фоне. Возвращает id или None, если получателей нет."""
+    total = await count_broadcast_recipients(filter_type)
+    if not total:
+        return None
+    job_id = await create_broadcast_job(admin_id, chat_id, filter_type, text, total)
+    progress = await bot.send_message(chat_id, _progress_text(job_id, total, 0, 0, 0))
+    await set_broadcast_progress_message(job_id, progress.message_id)
+    _spawn(bot, await get_broadcast_job(job_id))
+    return job_id
+
+
+async def resume_broadcasts(bot: Bot):
+    """Продолжает рассылки, прерванные перезапуском бота"""
+    for job in await get_running_broadcast_jobs():
+        if job.id not in _tasks:
+            logger.info(f"📣 Продолжаю рассылку #{job.id} с пользователя {job.last_user_id}")
+            _spawn(bot, job)
+
+
+async def stop_broadcasts():
+    """Прерывает рассылки при остановке бота; статус остаётся running,
+    и после запуска resume_broadcasts продолжит их с сохранённого места"""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def cancel_broadcast(bot: Bot, job_id: int) -> bool:
+    if not await finish_broadcast_job(job_id, "cancelled"):
+        return False
+    task = _tasks.pop(job_id, None)
+    if task:
+        task.cancel()
+    job = await get_broadcast_job(job_id)
+    await _show_progress(bot, job, job.sent, job.failed, job.blocked, "cancelled")
+    return True
+
+
+async def get_broadcast_status(job_id: int):
+    job = await get_broadcast_job(job_id)
+    if not job:
+        return None
+    return _progress_text(job.id, job.total, job.sent, job.failed, job.blocked, job.status)
@@ -8,6 +8,9 @@ OWNER = [1890263091]
 
 # Канал для подписки
 CHANNEL_ID = "@Anonymconfessions"
+SUBSCRIPTION_TTL = 6 * 3600  # сколько помнить, что пользователь подписан, сек
+SUBSCRIPTION_NEGATIVE_TTL = 60  # сколько помнить, что не подписан, сек
+SUBSCRIPTION_CACHE_SIZE = 100000
 
 # ID чата для жалоб
 REPORT_CHAT_ID = -1003371392566
@@ -27,6 +30,72 @@ LOG_PATH = os.path.join(BASE_DIR, "logs", "bot.log")
 DB_PATH = os.path.join(BASE_DIR, "confessions.db")
 BACKUP_PATH = os.path.join(BASE_DIR, "backups")
 
+# База данных
+DB_BUSY_TIMEOUT = 30  # секунды ожидания блокировки записи
+DB_STATEMENT_CACHE_SIZE = 256  # подготовленных запросов на соединение
+DB_CACHE_SIZE_KB = 64 * 1024  # страничный кеш SQLite на соединение
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_SYNCHRONOUS = "NORMAL"  # в режиме WAL безопасно и заметно быстрее FULL
+DB_READ_WORKERS = 4  # потоков для чтения; запись всегда в одном потоке
+DB_MAX_PENDING = 500  # запросов в очереди, после этого хендлеры ждут (backpressure)
+SETTINGS_CACHE_TTL = 30  # секунды; через столько подхватываются правки из другого процесса
+
+# Хранилище состояний FSM
+FSM_CACHE_SIZE = 10000  # состояний в памяти (LRU), остальные читаются из БД
+FSM_FLUSH_INTERVAL = 2  # как часто изменения сбрасываются в БД одной пачкой, сек
+FSM_STATE_TTL = 7 * 24 * 3600  # состояние без изменений дольше этого удаляется, сек
+FSM_CLEANUP_INTERVAL = 3600  # как часто удалять просроченные состояния, сек
+
+# Очистка старых данных (возраст — модификатор SQLite datetime)
+AUTO_DELETE_CONFESSIONS_AGE = "-3 days"  # признания старше удаляются автоматически вместе с жалобами
+CLEANUP_CONFESSIONS_AGE = "-90 days"  # /cleanup
+CLEANUP_REPORTS_AGE = "-30 days"  # /cleanup
+RETENTION_INTERVAL = 24 * 3600  # как часто запускать автоочистку, сек
+RETENTION_BATCH_SIZE = 500  # строк за одну транзакцию
+RETENTION_BATCH_PAUSE = 0.05  # пауза между пачками, чтобы успевали остальные записи, сек
+RETENTION_VACUUM_PAGES = 2000  # страниц, возвращаемых ОС за один шаг incremental_vacuum
+
+# Резервные копии
+BACKUP_INTERVAL = 24 * 3600  # как часто делать бэкап автоматически, сек
+BACKUP_KEEP = 7  # сколько последних бэкапов хранить
+BACKUP_STEP_PAGES = 1024  # страниц за один шаг backup API
+BACKUP_STEP_SLEEP = 0.005  # пауза между шагами, сек
+
+# Аналитика
+ANALYTICS_HOURS_DAYS = 30  # за сколько дней строить активность по часам
+CHART_DEFAULT_DAYS = 14  # период /chart по умолчанию
+CHART_MAX_BARS = 40  # при большем числе дней столбец охватывает несколько суток
+
+# Лента признаний (/feed)
+FEED_PAGE_SIZE = 5
+FEED_COUNT_TTL = 60  # как долго кешируется общее число признаний под фильтром, сек
+
+# Экспорт
+EXPORT_BATCH_SIZE = 1000  # строк, читаемых из БД за раз
+EXPORT_MAX_UPLOAD = 50 * 1024 * 1024  # Telegram не принимает от бота файлы больше 50 МБ
+
+# Учёт активности пользователей
+ACTIVITY_FLUSH_INTERVAL = 5  # как часто накопленная активность пишется в БД, сек
+ACTIVITY_MIN_INTERVAL = 60  # last_active обновляется не чаще, если имя не менялось, сек
+ACTIVITY_MAX_TRACKED = 100000  # пользователей, чьё записанное состояние помним в памяти
+
+# Получение обновлений
+UPDATE_MODE = "polling"  # "polling" или "webhook"
+POLLING_SKIP_UPDATES = False  # False — при запуске разобрать обновления, накопившиеся за время простоя
+WEBHOOK_URL = "https://example.com"  # публичный адрес, на который Telegram шлёт обновления
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = None  # X-Telegram-Bot-Api-Secret-Token; None — новый случайный при каждом запуске
+WEBHOOK_MAX_CONNECTIONS = 40  # одновременных запросов от Telegram
+WEBAPP_HOST = "0.0.0.0"
+WEBAPP_PORT = 8080
+UPDATE_QUEUE_SIZE = 1000  # обновлений в очереди; при переполнении вебхук отвечает 503 и Telegram повторит
+UPDATE_CONCURRENCY = 16  # обработчиков одновременно на всех пользователей; один пользователь — всегда по одному
+UPDATE_DRAIN_TIMEOUT = 30  # сколько при остановке ждать разбора очереди, сек
+UPDATE_DEDUP_SIZE = 10000  # последних update_id, по которым отсекаются повторы
+
+# Данные бота для ссылок
+BOT_IDENTITY_REFRESH = 6 * 3600  # как часто перезапрашивать get_me(), сек
+
 # Лимиты
 MAX_PHOTO_PER_CONFESSION = 1
 MAX_VIDEO_PER_CONFESSION = 1
@@ -37,6 +106,18 @@ VIP_EDIT_TIMEOUT_MINUTES = 5
 MAX_TEXT_LENGTH = 4000
 MAX_USERNAME_LENGTH = 32
 
+# Антиспам: действие -> (сколько раз, за сколько секунд)
+RATE_LIMITS = {
+    "any": (20, 10),  # любое сообщение или нажатие кнопки
+    "ref_link": (2, 60),  # переход по ссылке для признания (/start ref_...)
+    "confession": (3, 60),  # отправка признания
+    "report": (5, 300),  # жалобы
+    "reveal": (5, 300),  # запросы на раскрытие автора
+    "promo": (5, 600),  # попытки ввести промокод
+    "throttle_notice": (1, 10),  # как часто напоминать пользователю о лимите
+}
+RATE_LIMIT_MAX_KEYS = 100000  # пар (пользователь, действие) в памяти
+
 # Баны
 BAN_DURATIONS = {
     "1_day": 1,
@@ -52,7 +133,11 @@ MIN_PROMO_ACTIVATIONS = 1
 MAX_PROMO_ACTIVATIONS = 1000
 
 # Рассылка
-BROADCAST_DELAY = 0.1
+TELEGRAM_GLOBAL_RATE = 25  # сообщений в секунду на весь бот (лимит Telegram ~30)
+TELEGRAM_PER_CHAT_INTERVAL = 1.0  # минимальный интервал между сообщениями в один чат, сек
+BROADCAST_CONCURRENCY = 10  # одновременных запросов к Telegram в рассылке
+BROADCAST_PAGE_SIZE = 500  # получателей на страницу; после каждой сохраняется прогресс
+BROADCAST_PROGRESS_INTERVAL = 5  # как часто обновлять сообщение с прогрессом, сек
 MAX_BROADCAST_RETRIES = 3
 
 # Логирование
@@ -62,6 +147,15 @@ LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 # Уведомления
 NOTIFY_VIP_EXPIRE_DAYS = [7, 3, 1]
+EXPIRY_HORIZON = 24 * 3600  # на сколько вперёд планировщик держит сроки банов/VIP в памяти, сек
 NOTIFY_REPORT = True
 NOTIFY_AUTO_REPORTS = True
+NOTIFY_BATCH_SIZE = 200  # уведомлений, забираемых из очереди за раз
+NOTIFY_CONCURRENCY = 10  # одновременных отправок уведомлений
+NOTIFY_IDLE_DELAY = 5  # пауза опроса пустой очереди, сек
+NOTIFY_WORKERS = 2  # параллельных воркеров очереди
+NOTIFY_LEASE_SECONDS = 300  # аренда пачки; по истечении строки возвращаются в очередь
+NOTIFY_MAX_ATTEMPTS = 5  # после стольких неудач уведомление считается недоставленным
+NOTIFY_RETRY_BASE_DELAY = 30  # задержка повтора: база * 2^(попытка-1), сек
+NOTIFY_RETRY_MAX_DELAY = 3600
 AUTO_REPORT_TIME = "09:00"
@@ -1,16 +1,87 @@
 import sqlite3
 import logging
-from datetime import datetime, timedelta
-from config import DB_PATH, OWNER
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from blacklist import BlacklistMatcher
+from config import (
+    DB_PATH, OWNER, DB_BUSY_TIMEOUT, DB_STATEMENT_CACHE_SIZE,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_SYNCHRONOUS, SETTINGS_CACHE_TTL, FEED_COUNT_TTL
+)
 
 logger = logging.getLogger(__name__)
 
+# ===== ВРЕМЯ =====
+# Сроки (users.ban_until, users.vip_until, confessions.can_edit_until,
+# promo_codes.expires_at) хранятся целыми секундами Unix epoch: проверка
+# срока — сравнение чисел, без разбора строк и без путаницы часовых поясов.
+DAY = 86400
+
+def now_epoch() -> int:
+    return int(time.time())
+
+def epoch_after(days: float = 0, minutes: float = 0) -> int:
+    return now_epoch() + int(days * DAY + minutes * 60)
+
+def epoch_to_datetime(value: Optional[int]) -> Optional[datetime]:
+    """Срок в локальном времени, None остаётся None"""
+    return datetime.fromtimestamp(value) if value is not None else None
+
+def format_epoch(value: Optional[int], fmt: str = '%d.%m.%Y %H:%M') -> Optional[str]:
+    return epoch_to_datetime(value).strftime(fmt) if value is not None else None
+
+# ===== СОЕДИНЕНИЯ =====
+# Одно долгоживущее соединение на поток: sqlite3 кеширует подготовленные
+# запросы внутри соединения, поэтому переоткрывать его на каждый запрос дорого.
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # увеличивается в close_connections, чтобы потоки переоткрыли соединения
+
+def _configure_connection(conn: sqlite3.Connection):
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = {-DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT * 1000}")
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = sqlite3.connect(
+            DB_PATH,
+            timeout=DB_BUSY_TIMEOUT,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False  # закрываются из главного потока в close_connections
+        )
+        _configure_connection(conn)
+        _local.conn = conn
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+def close_connections():
+    """Закрывает соединения всех потоков (вызывается при остановке бота)"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка закрытия соединения с БД: {e}")
+        _connections.clear()
 
 def init_db():
     conn = get_connection()
     cursor = conn.cursor()
+    _init_auto_vacuum(conn)
     
     # Существующие таблицы
     cursor.execute('''
@@ -177,6 +248,10 @@ def init_db():
     
     conn.commit()
     
+    _apply_migrations(conn)
+    if get_auto_vacuum() != AUTO_VACUUM_INCREMENTAL:
+        logger.warning("🗄 auto_vacuum выключен: место после удалений не возвращается ОС. Включить — /vacuum")
+    
     # Добавляем владельцев
     for owner_id in OWNER:
         cursor.execute("INSERT OR IGNORE INTO users (id, username, full_name) VALUES (?, ?, ?)",
@@ -185,34 +260,197 @@ def init_db():
                       (owner_id, "owner", owner_id))
     
     conn.commit()
-    conn.close()
     logger.info("✅ База данных инициализирована")
 
+# ===== МИГРАЦИИ =====
+# Изменения схемы поверх таблиц из init_db. Номер последней применённой миграции
+# хранится в PRAGMA user_version, каждая применяется ровно один раз в своей транзакции.
+# Шаг миграции — SQL-строка или функция, принимающая соединение.
+# Новые миграции добавляются только в конец списка.
+MIGRATIONS = [
+    # 1: вторичные индексы под горячие запросы
+    [
+        "CREATE INDEX IF NOT EXISTS idx_confessions_to_user ON confessions(to_user)",
+        "CREATE INDEX IF NOT EXISTS idx_confessions_from_user ON confessions(from_user)",
+        "CREATE INDEX IF NOT EXISTS idx_confessions_created_at ON confessions(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+        "CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active)",
+        "CREATE INDEX IF NOT EXISTS idx_users_vip_until ON users(vip_until)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_reporter_id ON reports(reporter_id)",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_user_id ON warnings(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_promo_activations_code ON promo_activations(promo_code)",
+        "CREATE INDEX IF NOT EXISTS idx_whois_games_creator ON whois_games(creator_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_whois_games_opponent ON whois_games(opponent_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_admin_logs_created_at ON admin_logs(created_at)",
+    ],
+    # 2: счётчики полученных признаний для топа
+    [
+        """CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            received INTEGER NOT NULL DEFAULT 0
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_user_stats_received ON user_stats(received)",
+        """INSERT OR REPLACE INTO user_stats (user_id, received)
+           SELECT to_user, COUNT(*) FROM confessions WHERE to_user IS NOT NULL GROUP BY to_user""",
+    ],
+    # 3: счётчики отправленных признаний и жалоб для профиля
+    [
+        "ALTER TABLE user_stats ADD COLUMN sent INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_stats ADD COLUMN reports INTEGER NOT NULL DEFAULT 0",
+        lambda conn: _rebuild_user_stats(conn),
+    ],
+    # 4: фоновые рассылки и пометка заблокировавших бота
+    [
+        "ALTER TABLE users ADD COLUMN blocked_bot INTEGER NOT NULL DEFAULT 0",
+        """CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            progress_message_id INTEGER,
+            filter_type TEXT NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME DEFAULT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)",
+    ],
+    # 5: массовые системные уведомления через очередь notifications
+    [
+        """CREATE TABLE IF NOT EXISTS notification_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            message TEXT NOT NULL,
+            admin_id INTEGER,
+            chat_id INTEGER,
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME DEFAULT NULL
+        )""",
+        "ALTER TABLE notifications ADD COLUMN job_id INTEGER DEFAULT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_sent ON notifications(sent, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_job ON notifications(job_id, sent)",
+    ],
+    # 6: аренда, повторы и ошибки для воркера очереди уведомлений
+    [
+        "ALTER TABLE notifications ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE notifications ADD COLUMN next_attempt_at INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE notifications ADD COLUMN lease_until INTEGER DEFAULT NULL",
+        "ALTER TABLE notifications ADD COLUMN last_error TEXT DEFAULT NULL",
+        "DROP INDEX IF EXISTS idx_notifications_sent",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications(sent, next_attempt_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_lease ON notifications(lease_until) WHERE lease_until IS NOT NULL",
+    ],
+    # 7: состояния FSM, переживающие перезапуск
+    [
+        """CREATE TABLE IF NOT EXISTS fsm_states (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)",
+    ],
+    # 8: сроки — целые epoch вместо строк локального времени
+    [
+        "UPDATE users SET ban_until = CAST(strftime('%s', ban_until, 'utc') AS INTEGER) WHERE typeof(ban_until) = 'text'",
+        "UPDATE users SET vip_until = CAST(strftime('%s', vip_until, 'utc') AS INTEGER) WHERE typeof(vip_until) = 'text'",
+        "UPDATE confessions SET can_edit_until = CAST(strftime('%s', can_edit_until, 'utc') AS INTEGER) WHERE typeof(can_edit_until) = 'text'",
+        "UPDATE promo_codes SET expires_at = CAST(strftime('%s', expires_at, 'utc') AS INTEGER) WHERE typeof(expires_at) = 'text'",
+        "CREATE INDEX IF NOT EXISTS idx_users_ban_until ON users(ban_until) WHERE banned = 1",
+        "CREATE INDEX IF NOT EXISTS idx_promo_codes_expires_at ON promo_codes(expires_at)",
+    ],
+    # 9: индексы для пакетной очистки жалоб
+    [
+        "CREATE INDEX IF NOT EXISTS idx_reports_confession_id ON reports(confession_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_created_at ON reports(created_at)",
+    ],
+    # 10: частичные индексы для фильтров ленты признаний
+    [
+        "CREATE INDEX IF NOT EXISTS idx_confessions_vip ON confessions(is_vip_sender) WHERE is_vip_sender = 1",
+        "CREATE INDEX IF NOT EXISTS idx_confessions_media ON confessions(media_type) WHERE media_type IS NOT NULL",
+    ],
+    # 11: почасовые и посуточные счётчики для аналитики
+    [
+        """CREATE TABLE IF NOT EXISTS stats_hourly (
+            hour INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, metric)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS stats_daily (
+            day INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, metric)
+        ) WITHOUT ROWID""",
+        lambda conn: _create_rollups(conn),
+    ],
+]
+
+def _apply_migrations(conn: sqlite3.Connection):
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, steps in enumerate(MIGRATIONS, 1):
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"❌ Ошибка миграции БД #{version}")
+            raise
+        logger.info(f"🗄 Применена миграция БД #{version}")
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+def _init_auto_vacuum(conn: sqlite3.Connection):
+    # Без auto_vacuum удалённые страницы остаются в файле навсегда. Сменить
+    # режим можно только VACUUM: для новой, пустой базы он мгновенный. Для
+    # существующей он перезаписывает весь файл, держа блокировку записи,
+    # поэтому запускается лишь вручную (enable_incremental_vacuum, /vacuum).
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        conn.execute("VACUUM")
+
 # ===== БАЗОВЫЕ ФУНКЦИИ =====
 def db_exec(query: str, params: tuple = ()):
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
-    lastrowid = cur.lastrowid
-    conn.close()
-    return lastrowid
+    with conn:  # commit, а при ошибке rollback — соединение остаётся чистым
+        cur = conn.execute(query, params)
+    return cur.lastrowid
 
 def db_fetch(query: str, params: tuple = ()):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return get_connection().execute(query, params).fetchall()
 
 def db_fetch_one(query: str, params: tuple = ()):
+    return get_connection().execute(query, params).fetchone()
+
+@contextmanager
+def db_transaction():
+    """Несколько запросов записи в одной транзакции: commit в конце, rollback при ошибке"""
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(query, params)
-    row = cur.fetchone()
-    conn.close()
-    return row
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
 
 # ===== СТАРЫЕ ФУНКЦИИ (полностью из исходного bot.py) =====
 
@@ -225,124 +463,183 @@ def create_user(user_id: int, username: str, full_name: str):
 def get_user(user_id: int):
     return db_fetch_one("SELECT * FROM users WHERE id = ?", (user_id,))
 
+def get_users_by_ids(user_ids) -> dict:
+    """Пользователи одним запросом: id -> строка users"""
+    ids = list({user_id for user_id in user_ids if user_id is not None})
+    if not ids:
+        return {}
+    marks = ",".join("?" * len(ids))
+    return {row[0]: row for row in db_fetch(f"SELECT * FROM users WHERE id IN ({marks})", ids)}
+
 def get_user_by_username(username: str):
     return db_fetch_one("SELECT * FROM users WHERE username = ?", (username,))
 
-def update_user_activity(user_id: int):
-    return db_exec(
-        "UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE id = ?",
+def save_user_activity(rows):
+    """rows — (user_id, username, full_name, epoch последней активности).
+    Одной транзакцией создаёт недостающих пользователей, остальным обновляет
+    username, имя и last_active (время в users хранится строкой UTC)."""
+    with db_transaction() as conn:
+        conn.executemany(
+            """INSERT INTO users (id, username, full_name, last_active) VALUES (?, ?, ?, datetime(?, 'unixepoch'))
+               ON CONFLICT(id) DO UPDATE SET
+                   username = excluded.username,
+                   full_name = excluded.full_name,
+                   last_active = MAX(COALESCE(last_active, ''), excluded.last_active)""",
+            rows
+        )
+    return len(rows)
+
+class UserContext(NamedTuple):
+    """Всё, что middleware и хендлерам нужно знать о текущем пользователе"""
+    id: int
+    exists: bool
+    banned: bool
+    ban_until: Optional[int]  # epoch, None — бессрочно
+    ban_reason: Optional[str]
+    vip_until: Optional[int]  # epoch
+    emoji: Optional[str]
+    role: Optional[str]
+    blocked_bot: bool = False
+
+    @property
+    def is_banned(self) -> bool:
+        # истёкший бан снимает планировщик истечений (expiry.py), здесь он просто не действует
+        return self.banned and (self.ban_until is None or time.time() < self.ban_until)
+
+    @property
+    def is_vip(self) -> bool:
+        return self.vip_until is not None and time.time() < self.vip_until
+
+def get_user_context(user_id: int) -> UserContext:
+    """Бан, VIP, эмодзи и роль пользователя одним запросом"""
+    row = db_fetch_one(
+        """SELECT u.id IS NOT NULL, COALESCE(u.banned, 0), u.ban_until, u.ban_reason,
+                  u.vip_until, u.emoji, r.role, COALESCE(u.blocked_bot, 0)
+           FROM (SELECT ? AS id) q
+           LEFT JOIN users u ON u.id = q.id
+           LEFT JOIN admin_roles r ON r.user_id = q.id""",
         (user_id,)
     )
+    return UserContext(user_id, bool(row[0]), row[1] == 1, *row[2:7], row[7] == 1)
 
 def is_banned(user_id: int) -> bool:
-    user = get_user(user_id)
-    if not user:
-        return False
-    if user[3] == 1:
-        ban_until = user[4]
-        if ban_until:
-            try:
-                if isinstance(ban_until, str):
-                    ban_until_dt = datetime.strptime(ban_until, '%Y-%m-%d %H:%M:%S')
-                else:
-                    ban_until_dt = ban_until
-                if datetime.now() > ban_until_dt:
-                    unban_user(user_id)
-                    return False
-                return True
-            except Exception as e:
-                logger.error(f"Ошибка проверки срока бана: {e}")
-                return True
-        return True
-    return False
+    return get_user_context(user_id).is_banned
+
+# --- Хуки изменения сроков ---
+# Планировщик истечений подписывается сюда, чтобы узнавать о новом сроке бана
+# или VIP сразу. Слушатели вызываются в потоке БД: listener(kind, user_id, epoch),
+# kind — "ban" или "vip", epoch None — срока больше нет.
+_deadline_listeners = []
+
+def add_deadline_listener(listener):
+    _deadline_listeners.append(listener)
+
+def remove_deadline_listener(listener):
+    if listener in _deadline_listeners:
+        _deadline_listeners.remove(listener)
+
+def _deadline_changed(kind: str, user_id: int, deadline: Optional[int]):
+    for listener in _deadline_listeners:
+        try:
+            listener(kind, user_id, deadline)
+        except Exception:
+            logger.exception("Ошибка слушателя изменения сроков")
 
 def ban_user(user_id: int, ban_duration_days: int = 0, ban_reason: str = "не указана"):
     try:
-        if ban_duration_days > 0:
-            ban_until = (datetime.now() + timedelta(days=ban_duration_days)).strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            ban_until = None
+        ban_until = epoch_after(days=ban_duration_days) if ban_duration_days > 0 else None
         user = get_user(user_id)
         if not user:
-            return db_exec(
+            result = db_exec(
                 """INSERT INTO users (id, username, full_name, banned, ban_until, ban_reason) 
                    VALUES (?, ?, ?, 1, ?, ?)""",
                 (user_id, None, None, ban_until, ban_reason)
             )
         else:
-            return db_exec(
+            result = db_exec(
                 """UPDATE users SET banned = 1, ban_until = ?, ban_reason = ? WHERE id = ?""",
                 (ban_until, ban_reason, user_id)
             )
+        _deadline_changed("ban", user_id, ban_until)
+        return result
     except Exception as e:
         logger.error(f"Ошибка бана пользователя {user_id}: {e}")
         return None
 
 def unban_user(user_id: int):
-    return db_exec(
+    result = db_exec(
         "UPDATE users SET banned = 0, ban_until = NULL, ban_reason = NULL WHERE id = ?",
         (user_id,)
     )
+    _deadline_changed("ban", user_id, None)
+    return result
+
+def unban_if_expired(user_id: int) -> bool:
+    """Снимает бан, только если его срок действительно истёк (его могли продлить)"""
+    with db_transaction() as conn:
+        cur = conn.execute(
+            """UPDATE users SET banned = 0, ban_until = NULL, ban_reason = NULL
+                WHERE id = ? AND banned = 1 AND ban_until IS NOT NULL AND ban_until <= ?""",
+            (user_id, now_epoch())
+        )
+    return cur.rowcount > 0
+
+def get_upcoming_expiries(until: int, vip_lookahead: int):
+    """Сроки, наступающие до until: баны и VIP (VIP — на vip_lookahead секунд дальше,
+    чтобы успеть напомнить заранее). Возвращает (kind, user_id, epoch)."""
+    bans = db_fetch(
+        """SELECT 'ban', id, ban_until FROM users
+           WHERE banned = 1 AND ban_until IS NOT NULL AND ban_until <= ?""",
+        (until,)
+    )
+    vips = db_fetch(
+        """SELECT 'vip', id, vip_until FROM users
+           WHERE vip_until > ? AND vip_until <= ?""",
+        (now_epoch(), until + vip_lookahead)
+    )
+    return bans + vips
 
 def is_vip(user_id: int) -> bool:
-    user = get_user(user_id)
-    if not user:
-        return False
-    vip_until = user[5]
-    if vip_until:
-        try:
-            if isinstance(vip_until, str):
-                vip_until_dt = datetime.strptime(vip_until, '%Y-%m-%d %H:%M:%S')
-            else:
-                vip_until_dt = vip_until
-            return datetime.now() < vip_until_dt
-        except Exception as e:
-            logger.error(f"Ошибка проверки VIP: {e}")
-            return False
-    return False
+    return get_user_context(user_id).is_vip
 
 def add_vip_days(user_id: int, days: int):
     user = get_user(user_id)
     if user:
-        current_vip = user[5]
-        if current_vip:
-            try:
-                if isinstance(current_vip, str):
-                    current_vip_dt = datetime.strptime(current_vip, '%Y-%m-%d %H:%M:%S')
-                else:
-                    current_vip_dt = current_vip
-                if current_vip_dt > datetime.now():
-                    new_date = current_vip_dt + timedelta(days=days)
-                else:
-                    new_date = datetime.now() + timedelta(days=days)
-            except:
-                new_date = datetime.now() + timedelta(days=days)
-        else:
-            new_date = datetime.now() + timedelta(days=days)
+        # продлеваем от текущего срока, если VIP ещё действует
+        new_until = max(user[5] or 0, now_epoch()) + days * DAY
         db_exec(
             "UPDATE users SET vip_until = ? WHERE id = ?",
-            (new_date.strftime('%Y-%m-%d %H:%M:%S'), user_id)
+            (new_until, user_id)
         )
+        _deadline_changed("vip", user_id, new_until)
         return True
     return False
 
 def remove_vip(user_id: int):
-    return db_exec(
+    result = db_exec(
         "UPDATE users SET vip_until = NULL WHERE id = ?",
         (user_id,)
     )
-
-def create_confession(from_user: int, to_user: int, text: str):
-    is_vip_sender_val = 1 if is_vip(from_user) else 0
-    can_edit_until = (datetime.now() + timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S')
+    _deadline_changed("vip", user_id, None)
+    return result
+
+def create_confession(from_user: int, to_user: int, text: str, is_vip_sender: bool = None):
+    if is_vip_sender is None:
+        is_vip_sender = is_vip(from_user)
+    is_vip_sender_val = 1 if is_vip_sender else 0
+    can_edit_until = epoch_after(minutes=5)
     if text is None:
         text = ""
     logger.info(f"Создание признания: от {from_user} к {to_user}, VIP: {is_vip_sender_val}, текст: {text[:50]}...")
-    return db_exec(
-        """INSERT INTO confessions (from_user, to_user, message_id, text, media_type, media_file_id, is_vip_sender, can_edit_until) 
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (from_user, to_user, None, text, None, None, is_vip_sender_val, can_edit_until)
-    )
+    with db_transaction() as conn:
+        cur = conn.execute(
+            """INSERT INTO confessions (from_user, to_user, message_id, text, media_type, media_file_id, is_vip_sender, can_edit_until) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (from_user, to_user, None, text, None, None, is_vip_sender_val, can_edit_until)
+        )
+        _bump_user_stats(conn, "received", [(to_user, 1)])
+        _bump_user_stats(conn, "sent", [(from_user, 1)])
+    return cur.lastrowid
 
 def get_confession(confession_id: int):
     return db_fetch_one("SELECT * FROM confessions WHERE id = ?", (confession_id,))
@@ -350,8 +647,35 @@ def get_confession(confession_id: int):
 def get_confessions_by_user(user_id: int):
     return db_fetch("SELECT * FROM confessions WHERE from_user = ? OR to_user = ?", (user_id, user_id))
 
+def _delete_confessions(conn: sqlite3.Connection, ids: list) -> tuple:
+    """Удаляет признания вместе с жалобами на них и вычитает всё из счётчиков.
+    Возвращает (признаний, жалоб)."""
+    marks = ",".join("?" * len(ids))
+    for column, user_column in (("received", "to_user"), ("sent", "from_user")):
+        rows = conn.execute(
+            f"SELECT {user_column}, -COUNT(*) FROM confessions WHERE id IN ({marks}) GROUP BY {user_column}",
+            ids
+        ).fetchall()
+        _bump_user_stats(conn, column, rows)
+    report_ids = [row[0] for row in conn.execute(f"SELECT id FROM reports WHERE confession_id IN ({marks})", ids)]
+    reports = _delete_reports(conn, report_ids) if report_ids else 0
+    confessions = conn.execute(f"DELETE FROM confessions WHERE id IN ({marks})", ids).rowcount
+    return confessions, reports
+
 def delete_confession(confession_id: int):
-    return db_exec("DELETE FROM confessions WHERE id = ?", (confession_id,))
+    with db_transaction() as conn:
+        confessions, _ = _delete_confessions(conn, [confession_id])
+    return confessions
+
+def delete_old_confessions_batch(age: str, limit: int) -> tuple:
+    """Одна пачка очистки: до limit самых старых признаний старше age (модификатор
+    SQLite, например '-3 days') вместе с жалобами на них. Возвращает (признаний, жалоб)."""
+    with db_transaction() as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM confessions WHERE created_at < datetime('now', ?) ORDER BY created_at LIMIT ?",
+            (age, limit)
+        )]
+        return _delete_confessions(conn, ids) if ids else (0, 0)
 
 def update_confession_message_id(confession_id: int, message_id: int):
     return db_exec(
@@ -366,15 +690,96 @@ def update_reveal_status(confession_id: int, status: int):
     )
 
 def create_report(confession_id: int, reporter_id: int):
-    return db_exec(
-        "INSERT INTO reports (confession_id, reporter_id) VALUES (?, ?)",
-        (confession_id, reporter_id)
-    )
+    with db_transaction() as conn:
+        cur = conn.execute(
+            "INSERT INTO reports (confession_id, reporter_id) VALUES (?, ?)",
+            (confession_id, reporter_id)
+        )
+        _bump_user_stats(conn, "reports", [(reporter_id, 1)])
+    return cur.lastrowid
+
+def _delete_reports(conn: sqlite3.Connection, ids: list) -> int:
+    marks = ",".join("?" * len(ids))
+    rows = conn.execute(
+        f"SELECT reporter_id, -COUNT(*) FROM reports WHERE id IN ({marks}) GROUP BY reporter_id",
+        ids
+    ).fetchall()
+    _bump_user_stats(conn, "reports", rows)
+    return conn.execute(f"DELETE FROM reports WHERE id IN ({marks})", ids).rowcount
 
 def delete_report(report_id: int):
-    return db_exec("DELETE FROM reports WHERE id = ?", (report_id,))
-
-def create_promo_code(code: str, activations: int, vip_days: int, created_by: int, expires_at: str = None):
+    with db_transaction() as conn:
+        return _delete_reports(conn, [report_id])
+
+def delete_old_reports_batch(age: str, limit: int) -> int:
+    with db_transaction() as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM reports WHERE created_at < datetime('now', ?) ORDER BY created_at LIMIT ?",
+            (age, limit)
+        )]
+        return _delete_reports(conn, ids) if ids else 0
+
+def delete_orphan_reports_batch(limit: int) -> int:
+    """Жалобы на уже удалённые признания (остались от старой очистки без каскада)"""
+    with db_transaction() as conn:
+        ids = [row[0] for row in conn.execute(
+            """SELECT r.id FROM reports r
+               WHERE NOT EXISTS (SELECT 1 FROM confessions c WHERE c.id = r.confession_id)
+               LIMIT ?""",
+            (limit,)
+        )]
+        return _delete_reports(conn, ids) if ids else 0
+
+# --- Обслуживание файла базы ---
+
+def get_auto_vacuum() -> int:
+    return db_fetch_one("PRAGMA auto_vacuum")[0]
+
+def enable_incremental_vacuum() -> int:
+    """Переводит базу в auto_vacuum = INCREMENTAL полным VACUUM. Всё это время
+    записи ждут, а на диске нужно место ещё на одну копию базы.
+    Возвращает размер файла после VACUUM в байтах."""
+    conn = get_connection()
+    conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_count * conn.execute("PRAGMA page_size").fetchone()[0]
+
+def incremental_vacuum(pages: int) -> int:
+    """Возвращает ОС до pages свободных страниц. Возвращает, сколько освобождено.
+    Без auto_vacuum = INCREMENTAL ничего не делает."""
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # execute() делает один шаг, а каждый шаг освобождает одну страницу;
+    # executescript выполняет прагму до конца
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def checkpoint_wal():
+    """Переносит WAL в основной файл и обрезает его, чтобы файл базы действительно уменьшился"""
+    return get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+
+def get_page_size() -> int:
+    return db_fetch_one("PRAGMA page_size")[0]
+
+def restore_database(path: str):
+    """Заменяет содержимое базы копией из файла path через backup API.
+    Выполняется в потоке записи: остальные записи ждут, читатели до конца
+    видят прежние данные. Старая копия доводится до текущей схемы миграциями."""
+    src = sqlite3.connect(path)
+    try:
+        src.backup(get_connection())
+    finally:
+        src.close()
+    invalidate_settings_cache()
+    invalidate_blacklist_matcher()
+    _feed_count_cache.clear()
+    init_db()
+
+def create_promo_code(code: str, activations: int, vip_days: int, created_by: int, expires_at: Optional[int] = None):
     return db_exec(
         """INSERT INTO promo_codes (code, activations, activations_left, vip_days, created_by, expires_at) 
            VALUES (?, ?, ?, ?, ?, ?)""",
@@ -390,8 +795,8 @@ def delete_promo_code(code: str):
 def get_promo_code(code: str):
     # проверяем срок действия
     promo = db_fetch_one(
-        "SELECT * FROM promo_codes WHERE code = ? AND activations_left > 0 AND (expires_at IS NULL OR expires_at > datetime('now'))",
-        (code,)
+        "SELECT * FROM promo_codes WHERE code = ? AND activations_left > 0 AND (expires_at IS NULL OR expires_at > ?)",
+        (code, now_epoch())
     )
     return promo
 
@@ -420,42 +825,111 @@ def activate_promo_code(user_id: int, code: str):
 def get_promo_activations(code: str):
     return db_fetch("SELECT user_id, activated_at FROM promo_activations WHERE promo_code = ? ORDER BY activated_at DESC", (code,))
 
+# --- Счётчики user_stats ---
+# Денормализованные received/sent/reports обновляются в тех же транзакциях,
+# что и сами признания/жалобы; rebuild_user_stats пересчитывает их с нуля.
+USER_STATS_COLUMNS = ("received", "sent", "reports")
+
+def _bump_user_stats(conn: sqlite3.Connection, column: str, deltas):
+    """deltas — пары (user_id, изменение); счётчик не опускается ниже нуля"""
+    if column not in USER_STATS_COLUMNS:
+        raise ValueError(f"Неизвестный счётчик: {column}")
+    conn.executemany(
+        f"""INSERT INTO user_stats (user_id, {column}) VALUES (?, MAX(?, 0))
+            ON CONFLICT(user_id) DO UPDATE SET {column} = MAX({column} + ?, 0)""",
+        [(user_id, delta, delta) for user_id, delta in deltas if user_id is not None]
+    )
+
+def _rebuild_user_stats(conn: sqlite3.Connection) -> int:
+    conn.execute("DELETE FROM user_stats")
+    cur = conn.execute(
+        """INSERT INTO user_stats (user_id, received, sent, reports)
+           SELECT user_id, SUM(received), SUM(sent), SUM(reports) FROM (
+               SELECT to_user AS user_id, COUNT(*) AS received, 0 AS sent, 0 AS reports
+               FROM confessions WHERE to_user IS NOT NULL GROUP BY to_user
+               UNION ALL
+               SELECT from_user, 0, COUNT(*), 0
+               FROM confessions WHERE from_user IS NOT NULL GROUP BY from_user
+               UNION ALL
+               SELECT reporter_id, 0, 0, COUNT(*)
+               FROM reports WHERE reporter_id IS NOT NULL GROUP BY reporter_id
+           ) GROUP BY user_id"""
+    )
+    return cur.rowcount
+
+def rebuild_user_stats() -> int:
+    """Пересчитывает все счётчики из confessions и reports, возвращает число пользователей"""
+    with db_transaction() as conn:
+        return _rebuild_user_stats(conn)
+
 def get_user_stats(user_id: int):
-    received = db_fetch_one(
-        "SELECT COUNT(*) FROM confessions WHERE to_user = ?",
-        (user_id,)
-    )[0] or 0
-    sent = db_fetch_one(
-        "SELECT COUNT(*) FROM confessions WHERE from_user = ?",
+    row = db_fetch_one(
+        "SELECT received, sent, reports FROM user_stats WHERE user_id = ?",
         (user_id,)
-    )[0] or 0
-    reports = db_fetch_one(
-        "SELECT COUNT(*) FROM reports WHERE reporter_id = ?",
-        (user_id,)
-    )[0] or 0
+    )
+    received, sent, reports = row if row else (0, 0, 0)
     return {
         'received': received,
         'sent': sent,
         'reports': reports
     }
 
-def get_top_users(limit: int = 10):
+# --- Топ ---
+RATING_PERIODS = {"day": "-1 day", "week": "-7 days"}
+
+def get_top_users(limit: int = 10, period: str = "all"):
+    """Строки (id, username, count, emoji, role) по убыванию полученных признаний.
+    За всё время — прямо из user_stats по индексу, за day/week — из rating_cache."""
+    if period == "all":
+        return db_fetch(
+            """SELECT u.id, u.username, s.received, u.emoji, r.role
+               FROM user_stats s
+               JOIN users u ON u.id = s.user_id
+               LEFT JOIN admin_roles r ON r.user_id = u.id
+               WHERE u.banned = 0
+               ORDER BY s.received DESC
+               LIMIT ?""",
+            (limit,)
+        )
     return db_fetch(
-        """SELECT u.id, u.username, COUNT(c.id) as confession_count 
-           FROM users u 
-           LEFT JOIN confessions c ON u.id = c.to_user 
-           WHERE u.banned = 0
-           GROUP BY u.id 
-           ORDER BY confession_count DESC 
+        """SELECT rc.user_id, rc.username, rc.count, rc.emoji, r.role
+           FROM rating_cache rc
+           LEFT JOIN admin_roles r ON r.user_id = rc.user_id
+           WHERE rc.period = ?
+           ORDER BY rc.place
            LIMIT ?""",
-        (limit,)
+        (period, limit)
     )
 
+def refresh_rating_cache(limit: int = 10):
+    """Пересчитывает топы за сутки/неделю (и снимок за всё время) в rating_cache"""
+    tops = {"all": [row[:4] for row in get_top_users(limit)]}
+    for period, age in RATING_PERIODS.items():
+        tops[period] = db_fetch(
+            """SELECT c.to_user, u.username, COUNT(*) AS cnt, u.emoji
+               FROM confessions c
+               JOIN users u ON u.id = c.to_user
+               WHERE c.created_at > datetime('now', ?) AND u.banned = 0
+               GROUP BY c.to_user
+               ORDER BY cnt DESC
+               LIMIT ?""",
+            (age, limit)
+        )
+    with db_transaction() as conn:
+        for period, rows in tops.items():
+            conn.execute("DELETE FROM rating_cache WHERE period = ?", (period,))
+            conn.executemany(
+                """INSERT INTO rating_cache (period, place, user_id, username, count, emoji)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(period, place, user_id, username, count, emoji)
+                 for place, (user_id, username, count, emoji) in enumerate(rows, 1)]
+            )
+
 def get_all_users():
     return db_fetch("SELECT id FROM users WHERE banned = 0")
 
 def get_vip_users():
-    return db_fetch("SELECT id, username, vip_until FROM users WHERE vip_until > datetime('now')")
+    return db_fetch("SELECT id, username, vip_until FROM users WHERE vip_until > ?", (now_epoch(),))
 
 def get_active_users_count():
     result = db_fetch_one("SELECT COUNT(*) FROM users WHERE banned = 0")
@@ -495,25 +969,180 @@ def remove_admin_role(user_id: int, role: str, removed_by: int):
 def get_all_admins():
     return db_fetch("SELECT user_id, role FROM admin_roles")
 
+# --- Кеш admin_settings ---
+# Таблица крошечная, а читается на каждом апдейте (техработы, whois, батл),
+# поэтому держим её целиком в памяти. Запись через set_admin_settings сбрасывает
+# кеш сразу, правки из другого процесса подхватываются через SETTINGS_CACHE_TTL.
+_settings_cache = None
+_settings_loaded_at = 0.0
+_settings_version = 0
+_settings_lock = threading.Lock()
+_settings_stats = {"hits": 0, "misses": 0}
+
+def settings_cache_is_fresh() -> bool:
+    return _settings_cache is not None and time.monotonic() - _settings_loaded_at < SETTINGS_CACHE_TTL
+
+def _get_settings_snapshot() -> dict:
+    global _settings_cache, _settings_loaded_at
+    with _settings_lock:
+        if settings_cache_is_fresh():
+            _settings_stats["hits"] += 1
+            return _settings_cache
+        _settings_stats["misses"] += 1
+        version = _settings_version
+    settings = dict(db_fetch("SELECT key, value FROM admin_settings"))
+    with _settings_lock:
+        # пока читали, настройку могли изменить — такой снимок не кешируем
+        if version == _settings_version:
+            _settings_cache = settings
+            _settings_loaded_at = time.monotonic()
+    return settings
+
+def invalidate_settings_cache():
+    global _settings_cache, _settings_version
+    with _settings_lock:
+        _settings_cache = None
+        _settings_version += 1
+
+def get_settings_cache_stats() -> dict:
+    with _settings_lock:
+        return {
+            "hits": _settings_stats["hits"],
+            "misses": _settings_stats["misses"],
+            "keys": len(_settings_cache) if _settings_cache is not None else 0,
+            "age": round(time.monotonic() - _settings_loaded_at) if _settings_cache is not None else None,
+        }
+
 def get_admin_settings(key: str = None):
+    settings = _get_settings_snapshot()
     if key:
-        result = db_fetch_one("SELECT value FROM admin_settings WHERE key = ?", (key,))
-        return result[0] if result else None
+        return settings.get(key)
     else:
-        return db_fetch("SELECT key, value FROM admin_settings")
+        return list(settings.items())
 
 def set_admin_settings(key: str, value: str):
-    db_exec("INSERT OR REPLACE INTO admin_settings (key, value) VALUES (?, ?)", (key, value))
+    try:
+        db_exec("INSERT OR REPLACE INTO admin_settings (key, value) VALUES (?, ?)", (key, value))
+    finally:
+        invalidate_settings_cache()
+
+# notifications.sent: 0 — в очереди, 1 — доставлено, 2 — не доставлено
 
 def add_notification(user_id: int, type: str, message: str):
     db_exec("INSERT INTO notifications (user_id, type, message) VALUES (?, ?, ?)", (user_id, type, message))
 
-def get_pending_notifications():
-    return db_fetch("SELECT * FROM notifications WHERE sent = 0")
+def add_notifications(rows):
+    """rows — тройки (user_id, type, message)"""
+    with db_transaction() as conn:
+        conn.executemany("INSERT INTO notifications (user_id, type, message) VALUES (?, ?, ?)", rows)
+
+def get_pending_notifications(limit: int = 100):
+    """Ожидающие уведомления по порядку; текст массовых берётся из notification_jobs"""
+    return db_fetch(
+        """SELECT n.id, n.user_id, n.type, COALESCE(n.message, j.message), n.job_id
+           FROM notifications n LEFT JOIN notification_jobs j ON j.id = n.job_id
+           WHERE n.sent = 0 ORDER BY n.id LIMIT ?""",
+        (limit,)
+    )
 
 def mark_notification_sent(notification_id: int):
     db_exec("UPDATE notifications SET sent = 1 WHERE id = ?", (notification_id,))
 
+def claim_notifications(limit: int, lease_seconds: int):
+    """Берёт в аренду до limit готовых к отправке уведомлений одним UPDATE ... RETURNING.
+    Пока аренда не истекла, другие воркеры эти строки не видят.
+    Возвращает (id, user_id, type, message, job_id, attempts)."""
+    now = int(time.time())
+    with db_transaction() as conn:
+        return conn.execute(
+            """UPDATE notifications SET lease_until = ?
+               WHERE id IN (
+                   SELECT id FROM notifications
+                   WHERE sent = 0 AND next_attempt_at <= ? AND lease_until IS NULL
+                   ORDER BY next_attempt_at, id LIMIT ?
+               )
+               RETURNING id, user_id, type,
+                         COALESCE(message, (SELECT j.message FROM notification_jobs j WHERE j.id = notifications.job_id)),
+                         job_id, attempts""",
+            (now + lease_seconds, now, limit)
+        ).fetchall()
+
+def complete_notifications(sent_ids=(), failed=(), retry=(), blocked_users=()):
+    """Итог пачки одной транзакцией.
+    failed — пары (id, ошибка) без повторов; retry — тройки (id, ошибка, задержка в секундах)."""
+    now = int(time.time())
+    with db_transaction() as conn:
+        conn.executemany(
+            "UPDATE notifications SET sent = 1, lease_until = NULL WHERE id = ?",
+            [(nid,) for nid in sent_ids]
+        )
+        conn.executemany(
+            "UPDATE notifications SET sent = 2, lease_until = NULL, attempts = attempts + 1, last_error = ? WHERE id = ?",
+            [(error, nid) for nid, error in failed]
+        )
+        conn.executemany(
+            """UPDATE notifications SET lease_until = NULL, attempts = attempts + 1,
+                      next_attempt_at = ?, last_error = ? WHERE id = ?""",
+            [(now + delay, error, nid) for nid, error, delay in retry]
+        )
+        conn.executemany("UPDATE users SET blocked_bot = 1 WHERE id = ?", [(uid,) for uid in blocked_users])
+
+def reap_notification_leases() -> int:
+    """Возвращает в очередь строки с истёкшей арендой (воркер упал или бот перезапущен)"""
+    with db_transaction() as conn:
+        cur = conn.execute(
+            "UPDATE notifications SET lease_until = NULL WHERE lease_until IS NOT NULL AND lease_until < ? AND sent = 0",
+            (int(time.time()),)
+        )
+    return cur.rowcount
+
+def create_notification_job(type: str, message: str, admin_id: int = None, chat_id: int = None,
+                            filter_type: str = "all") -> tuple:
+    """Ставит одно сообщение в очередь всем получателям фильтра рассылки.
+    Текст хранится один раз в notification_jobs. Возвращает (job_id, число получателей)."""
+    with db_transaction() as conn:
+        job_id = conn.execute(
+            "INSERT INTO notification_jobs (type, message, admin_id, chat_id) VALUES (?, ?, ?, ?)",
+            (type, message, admin_id, chat_id)
+        ).lastrowid
+        total = conn.execute(
+            f"""INSERT INTO notifications (user_id, type, job_id)
+                SELECT id, ?, ? FROM users WHERE {_broadcast_where(filter_type)}""",
+            (type, job_id)
+        ).rowcount
+        conn.execute("UPDATE notification_jobs SET total = ? WHERE id = ?", (total, job_id))
+    return job_id, total
+
+def get_notification_job_status(job_id: int):
+    """(type, total, pending, sent, failed, finished_at) или None"""
+    return db_fetch_one(
+        """SELECT j.type, j.total,
+                  COUNT(CASE WHEN n.sent = 0 THEN 1 END),
+                  COUNT(CASE WHEN n.sent = 1 THEN 1 END),
+                  COUNT(CASE WHEN n.sent = 2 THEN 1 END),
+                  j.finished_at
+           FROM notification_jobs j LEFT JOIN notifications n ON n.job_id = j.id
+           WHERE j.id = ? GROUP BY j.id""",
+        (job_id,)
+    )
+
+def finish_notification_jobs(job_ids) -> list:
+    """Отмечает завершёнными задания без ожидающих уведомлений.
+    Возвращает (job_id, admin_id, chat_id) только что завершённых."""
+    finished = []
+    with db_transaction() as conn:
+        for job_id in job_ids:
+            row = conn.execute(
+                """UPDATE notification_jobs SET finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND finished_at IS NULL
+                     AND NOT EXISTS (SELECT 1 FROM notifications WHERE job_id = ? AND sent = 0)
+                   RETURNING id, admin_id, chat_id""",
+                (job_id, job_id)
+            ).fetchone()
+            if row:
+                finished.append(row)
+    return finished
+
 def add_admin_log(admin_id: int, action: str, details: str):
     db_exec("INSERT INTO admin_logs (admin_id, action, details) VALUES (?, ?, ?)", (admin_id, action, details))
 
@@ -523,27 +1152,57 @@ def get_admin_logs(limit: int = 50):
 # ===== НОВЫЕ ФУНКЦИИ =====
 
 # --- Чёрный список ---
+# Скомпилированный BlacklistMatcher живёт в памяти и пересобирается только
+# после изменения списка через add_blacklist_word/remove_blacklist_word.
+_blacklist_matcher = None
+_blacklist_version = 0
+_blacklist_lock = threading.Lock()
+
+def blacklist_matcher_is_ready() -> bool:
+    return _blacklist_matcher is not None
+
+def _get_blacklist_matcher() -> BlacklistMatcher:
+    global _blacklist_matcher
+    matcher = _blacklist_matcher
+    if matcher is not None:
+        return matcher
+    with _blacklist_lock:
+        version = _blacklist_version
+    matcher = BlacklistMatcher(get_blacklist_words())
+    with _blacklist_lock:
+        # пока строили, список могли изменить — такой автомат не кешируем
+        if version == _blacklist_version:
+            _blacklist_matcher = matcher
+    return matcher
+
+def invalidate_blacklist_matcher():
+    global _blacklist_matcher, _blacklist_version
+    with _blacklist_lock:
+        _blacklist_matcher = None
+        _blacklist_version += 1
+
 def add_blacklist_word(word: str):
     try:
         db_exec("INSERT INTO blacklist_words (word) VALUES (?)", (word.lower(),))
-        return True
     except sqlite3.IntegrityError:
         return False
+    invalidate_blacklist_matcher()
+    return True
 
-def remove_blacklist_word(word: str):
-    db_exec("DELETE FROM blacklist_words WHERE word = ?", (word.lower(),))
+def remove_blacklist_word(word: str) -> bool:
+    with db_transaction() as conn:
+        removed = conn.execute("DELETE FROM blacklist_words WHERE word = ?", (word.lower(),)).rowcount
+    if removed:
+        invalidate_blacklist_matcher()
+    return removed > 0
 
 def get_blacklist_words():
     rows = db_fetch("SELECT word FROM blacklist_words ORDER BY word")
     return [row[0] for row in rows]
 
-def check_text_blacklist(text: str) -> bool:
-    words = get_blacklist_words()
-    text_lower = text.lower()
-    for word in words:
-        if word in text_lower:
-            return True
-    return False
+def check_text_blacklist(text: str) -> list:
+    """Запрещённые слова, найденные в тексте (пустой список — текст чистый)"""
+    return _get_blacklist_matcher().find(text)
 
 # --- Warn система ---
 def add_warn(user_id: int, admin_id: int, reason: str):
@@ -699,4 +1358,343 @@ def clear_battle_participants():
     db_exec("DELETE FROM battle_participants")
 
 def is_battle_enabled() -> bool:
-    return get_admin_settings("battle_enabled") == "1"
\ No newline at end of file
+    return get_admin_settings("battle_enabled") == "1"
+# ===== РАССЫЛКИ =====
+# Условия отбора получателей; blocked_bot = 0 добавляется всегда
+BROADCAST_FILTERS = {
+    "all": "banned = 0",
+    "vip": "vip_until > CAST(strftime('%s', 'now') AS INTEGER)",
+    "nonvip": "banned = 0 AND (vip_until IS NULL OR vip_until <= CAST(strftime('%s', 'now') AS INTEGER))",
+    "active": "banned = 0 AND last_active > datetime('now', '-7 days')",
+    "inactive": "banned = 0 AND last_active <= datetime('now', '-7 days')",
+    "banned": "banned = 1",
+}
+
+class BroadcastJob(NamedTuple):
+    id: int
+    admin_id: int
+    chat_id: int
+    progress_message_id: Optional[int]
+    filter_type: str
+    text: str
+    status: str
+    last_user_id: int
+    total: int
+    sent: int
+    failed: int
+    blocked: int
+
+_BROADCAST_JOB_COLUMNS = """id, admin_id, chat_id, progress_message_id, filter_type, text,
+    status, last_user_id, total, sent, failed, blocked"""
+
+def _broadcast_where(filter_type: str) -> str:
+    if filter_type not in BROADCAST_FILTERS:
+        raise ValueError(f"Неизвестный фильтр рассылки: {filter_type}")
+    return f"blocked_bot = 0 AND {BROADCAST_FILTERS[filter_type]}"
+
+def count_broadcast_recipients(filter_type: str) -> int:
+    return db_fetch_one(f"SELECT COUNT(*) FROM users WHERE {_broadcast_where(filter_type)}")[0]
+
+def get_broadcast_recipients(filter_type: str, after_id: int, limit: int):
+    """Следующая страница получателей по возрастанию id, начиная после after_id"""
+    rows = db_fetch(
+        f"SELECT id FROM users WHERE id > ? AND {_broadcast_where(filter_type)} ORDER BY id LIMIT ?",
+        (after_id, limit)
+    )
+    return [row[0] for row in rows]
+
+def create_broadcast_job(admin_id: int, chat_id: int, filter_type: str, text: str, total: int) -> int:
+    return db_exec(
+        """INSERT INTO broadcast_jobs (admin_id, chat_id, filter_type, text, total)
+           VALUES (?, ?, ?, ?, ?)""",
+        (admin_id, chat_id, filter_type, text, total)
+    )
+
+def set_broadcast_progress_message(job_id: int, message_id: int):
+    db_exec("UPDATE broadcast_jobs SET progress_message_id = ? WHERE id = ?", (message_id, job_id))
+
+def save_broadcast_progress(job_id: int, last_user_id: int, sent: int, failed: int, blocked: int,
+                            blocked_users=()):
+    """Сохраняет курсор и счётчики после страницы и помечает заблокировавших бота"""
+    with db_transaction() as conn:
+        conn.executemany("UPDATE users SET blocked_bot = 1 WHERE id = ?", [(uid,) for uid in blocked_users])
+        conn.execute(
+            """UPDATE broadcast_jobs SET last_user_id = ?, sent = ?, failed = ?, blocked = ?
+               WHERE id = ?""",
+            (last_user_id, sent, failed, blocked, job_id)
+        )
+
+def finish_broadcast_job(job_id: int, status: str) -> bool:
+    """Переводит незавершённую рассылку в итоговый статус; False, если она уже завершена"""
+    with db_transaction() as conn:
+        cur = conn.execute(
+            """UPDATE broadcast_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND status = 'running'""",
+            (status, job_id)
+        )
+    return cur.rowcount > 0
+
+def get_broadcast_job(job_id: int) -> Optional[BroadcastJob]:
+    row = db_fetch_one(f"SELECT {_BROADCAST_JOB_COLUMNS} FROM broadcast_jobs WHERE id = ?", (job_id,))
+    return BroadcastJob(*row) if row else None
+
+def get_running_broadcast_jobs():
+    rows = db_fetch(f"SELECT {_BROADCAST_JOB_COLUMNS} FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+    return [BroadcastJob(*row) for row in rows]
+
+def set_user_blocked_bot(user_id: int, blocked: bool):
+    db_exec("UPDATE users SET blocked_bot = ? WHERE id = ?", (1 if blocked else 0, user_id))
+
+# ===== СОСТОЯНИЯ FSM =====
+def load_fsm_state(chat_id: int, user_id: int):
+    """(state, data_json, updated_at) или None"""
+    return db_fetch_one(
+        "SELECT state, data, updated_at FROM fsm_states WHERE chat_id = ? AND user_id = ?",
+        (chat_id, user_id)
+    )
+
+def save_fsm_states(upserts=(), deletes=()):
+    """upserts — (chat_id, user_id, state, data_json, updated_at); deletes — (chat_id, user_id)"""
+    with db_transaction() as conn:
+        conn.executemany(
+            """INSERT INTO fsm_states (chat_id, user_id, state, data, updated_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                   state = excluded.state, data = excluded.data, updated_at = excluded.updated_at""",
+            upserts
+        )
+        conn.executemany("DELETE FROM fsm_states WHERE chat_id = ? AND user_id = ?", deletes)
+
+def delete_expired_fsm_states(ttl: int) -> int:
+    with db_transaction() as conn:
+        cur = conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (int(time.time()) - ttl,))
+    return cur.rowcount
+
+# ===== АНАЛИТИКА =====
+# Счётчики событий по часам (stats_hourly) и по суткам UTC (stats_daily).
+# Ведутся триггерами в той же транзакции, что и сама запись, поэтому их не
+# пропустит ни один путь вставки; удаление старых строк очисткой на них не
+# влияет. Ключ — начало часа/суток в epoch.
+# метрика -> (таблица, событие триггера, условие WHEN, столбец времени события;
+#             None — берётся время срабатывания, прошлые события тогда не восстановить)
+ROLLUP_SOURCES = {
+    "users": ("users", "INSERT", None, "created_at"),
+    "confessions": ("confessions", "INSERT", None, "created_at"),
+    "reports": ("reports", "INSERT", None, "created_at"),
+    "vip": ("users", "UPDATE OF vip_until", "NEW.vip_until > COALESCE(OLD.vip_until, 0)", None),
+    "promo": ("promo_activations", "INSERT", None, "activated_at"),
+}
+ROLLUP_BUCKETS = (("stats_hourly", "hour", 3600), ("stats_daily", "day", DAY))
+_NOW_EPOCH_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+def _create_rollups(conn: sqlite3.Connection):
+    for metric, (table, event, when, ts_column) in ROLLUP_SOURCES.items():
+        epoch_sql = (
+            f"COALESCE(CAST(strftime('%s', NEW.{ts_column}) AS INTEGER), {_NOW_EPOCH_SQL})" if ts_column else _NOW_EPOCH_SQL
+        )
+        upserts = "".join(
+            f"""INSERT INTO {bucket_table} ({column}, metric, value) VALUES ({epoch_sql} / {size} * {size}, '{metric}', 1)
+                    ON CONFLICT({column}, metric) DO UPDATE SET value = value + 1;
+                """
+            for bucket_table, column, size in ROLLUP_BUCKETS
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_stats_{metric} AFTER {event} ON {table}
+                {f'WHEN {when}' if when else ''}
+                BEGIN
+                {upserts}END"""
+        )
+        if not ts_column:
+            continue
+        for bucket_table, column, size in ROLLUP_BUCKETS:
+            conn.execute(
+                f"""INSERT INTO {bucket_table} ({column}, metric, value)
+                    SELECT CAST(strftime('%s', {ts_column}) AS INTEGER) / {size} * {size} AS bucket, '{metric}', COUNT(*)
+                    FROM {table} WHERE {ts_column} IS NOT NULL GROUP BY bucket
+                    ON CONFLICT({column}, metric) DO UPDATE SET value = value + excluded.value"""
+            )
+
+def _rollup_sums(since: int, until: int) -> dict:
+    rows = db_fetch(
+        "SELECT metric, SUM(value) FROM stats_hourly WHERE hour >= ? AND hour < ? GROUP BY metric",
+        (since // 3600 * 3600, until)
+    )
+    return dict(rows)
+
+def get_dashboard_stats() -> dict:
+    """Всё для экрана статистики: итоги из счётчиков плюс текущие значения по индексам"""
+    now = now_epoch()
+    totals = dict(db_fetch("SELECT metric, SUM(value) FROM stats_daily GROUP BY metric"))
+    banned = db_fetch_one("SELECT COUNT(*) FROM users WHERE banned = 1")[0]
+    return {
+        "totals": totals,
+        "day": _rollup_sums(now - DAY + 3600, now + 3600),
+        "week": _rollup_sums(now - 7 * DAY + 3600, now + 3600),
+        "banned": banned,
+        "active": totals.get("users", 0) - banned,
+        "vip": db_fetch_one("SELECT COUNT(*) FROM users WHERE vip_until > ?", (now,))[0],
+        "pending_reports": db_fetch_one("SELECT COUNT(*) FROM reports")[0],
+    }
+
+def get_rollup_series(metric: str, since: int, until: int, step: str = "day") -> list:
+    """Ряд (начало интервала, значение) от since до until включительно, с нулями
+    для пустых интервалов; step — "hour" или "day"."""
+    table, column, size = next(bucket for bucket in ROLLUP_BUCKETS if bucket[1] == step)
+    start, end = since // size * size, until // size * size
+    values = dict(db_fetch(
+        f"SELECT {column}, value FROM {table} WHERE {column} >= ? AND {column} <= ? AND metric = ?",
+        (start, end, metric)
+    ))
+    return [(bucket, values.get(bucket, 0)) for bucket in range(start, end + 1, size)]
+
+def get_activity_by_hour(metric: str, days: int) -> list:
+    """Сумма за последние days суток по часам местного времени: список из 24 чисел"""
+    since = now_epoch() - days * DAY
+    result = [0] * 24
+    for hour, value in db_fetch(
+        "SELECT hour, value FROM stats_hourly WHERE hour >= ? AND metric = ?", (since // 3600 * 3600, metric)
+    ):
+        result[time.localtime(hour).tm_hour] += value
+    return result
+
+# ===== ЛЕНТА ПРИЗНАНИЙ =====
+# Фильтры ленты: имя -> условие. from/to идут по индексам from_user/to_user
+# (в них уже есть id для сортировки), vip и media — по частичным индексам,
+# а период переводится в диапазон id (см. _feed_id_bounds).
+FEED_FILTERS = {
+    "from": "from_user = ?",
+    "to": "to_user = ?",
+    "vip": "is_vip_sender = 1",
+    "media": "media_type = ?",
+}
+_feed_count_cache = {}  # ключ фильтров -> (число, время подсчёта)
+
+def _feed_id_bounds(since: Optional[str], until: Optional[str]) -> tuple:
+    # id растёт вместе с created_at (AUTOINCREMENT и время вставки), поэтому
+    # границы периода достаточно найти по индексу created_at один раз
+    low = high = None
+    if since:
+        row = db_fetch_one(
+            "SELECT id FROM confessions WHERE created_at >= ? ORDER BY created_at, id LIMIT 1",
+            (since,)
+        )
+        low = row[0] if row else sys.maxsize
+    if until:
+        row = db_fetch_one(
+            "SELECT id FROM confessions WHERE created_at < date(?, '+1 day') ORDER BY created_at DESC, id DESC LIMIT 1",
+            (until,)
+        )
+        high = row[0] if row else 0
+    return low, high
+
+def _feed_where(filters: dict) -> tuple:
+    conditions, params = [], []
+    for name, condition in FEED_FILTERS.items():
+        if name in filters:
+            conditions.append(condition)
+            if "?" in condition:
+                params.append(filters[name])
+    low, high = _feed_id_bounds(filters.get("since"), filters.get("until"))
+    if low is not None:
+        conditions.append("id >= ?")
+        params.append(low)
+    if high is not None:
+        conditions.append("id <= ?")
+        params.append(high)
+    return conditions, params
+
+def get_confession_feed(filters: dict, before_id: int = None, after_id: int = None, limit: int = 5) -> tuple:
+    """Страница ленты от новых к старым по курсору: before_id — следующая
+    (более старые), after_id — предыдущая (более новые). Возвращает (строки, есть_ещё),
+    где есть_ещё относится к направлению листания."""
+    conditions, params = _feed_where(filters)
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(after_id)
+        order = "ASC"
+    else:
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        order = "DESC"
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    rows = db_fetch(
+        f"SELECT id, from_user, to_user, text, created_at FROM confessions{where} ORDER BY id {order} LIMIT ?",
+        params + [limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        rows.reverse()
+    return rows, has_more
+
+def count_confession_feed(filters: dict) -> int:
+    """Число признаний под фильтром; пересчитывается не чаще раза в FEED_COUNT_TTL секунд"""
+    key = tuple(sorted(filters.items()))
+    cached = _feed_count_cache.get(key)
+    if cached and time.monotonic() - cached[1] < FEED_COUNT_TTL:
+        return cached[0]
+    conditions, params = _feed_where(filters)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    count = db_fetch_one(f"SELECT COUNT(*) FROM confessions{where}", params)[0]
+    if len(_feed_count_cache) >= 100:
+        _feed_count_cache.clear()
+    _feed_count_cache[key] = (count, time.monotonic())
+    return count
+
+# ===== ЭКСПОРТ =====
+# таблица -> (столбцы: имя -> SQL-выражение, столбец даты для фильтра по периоду)
+_LOCAL_TIME_SQL = "datetime({}, 'unixepoch', 'localtime')"
+EXPORT_TABLES = {
+    "users": ({
+        "id": "id", "username": "username", "full_name": "full_name", "banned": "banned",
+        "ban_until": _LOCAL_TIME_SQL.format("ban_until"), "ban_reason": "ban_reason",
+        "vip_until": _LOCAL_TIME_SQL.format("vip_until"), "emoji": "emoji",
+        "created_at": "created_at", "last_active": "last_active",
+    }, "created_at"),
+    "confessions": ({
+        "id": "id", "from_user": "from_user", "to_user": "to_user", "text": "text",
+        "media_type": "media_type", "reveal_status": "reveal_status", "is_vip_sender": "is_vip_sender",
+        "created_at": "created_at",
+    }, "created_at"),
+    "achievements": ({
+        "id": "id", "name": "name", "description": "description", "created_at": "created_at",
+    }, "created_at"),
+    "reports": ({
+        "id": "id", "confession_id": "confession_id", "reporter_id": "reporter_id", "created_at": "created_at",
+    }, "created_at"),
+    "warnings": ({
+        "id": "id", "user_id": "user_id", "admin_id": "admin_id", "reason": "reason", "created_at": "created_at",
+    }, "created_at"),
+    "promo_activations": ({
+        "id": "id", "user_id": "user_id", "promo_code": "promo_code", "activated_at": "activated_at",
+    }, "activated_at"),
+    "admin_logs": ({
+        "id": "id", "admin_id": "admin_id", "action": "action", "details": "details", "created_at": "created_at",
+    }, "created_at"),
+}
+
+def iter_export_rows(table: str, columns: list, date_from: str = None, date_to: str = None, batch_size: int = 1000):
+    """Генератор строк таблицы для экспорта. Читает отдельным соединением
+    пачками по batch_size, поэтому память не зависит от размера таблицы.
+    date_from/date_to — даты 'YYYY-MM-DD' (UTC, как created_at), обе включительно."""
+    available, date_column = EXPORT_TABLES[table]
+    query = f"SELECT {', '.join(available[column] for column in columns)} FROM {table}"
+    conditions, params = [], []
+    if date_from:
+        conditions.append(f"{date_column} >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append(f"{date_column} < date(?, '+1 day')")
+        params.append(date_to)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=DB_BUSY_TIMEOUT)
+    try:
+        cur = conn.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
@@ -0,0 +1,136 @@
+"""Планировщик истечения банов и VIP.
+
+Держит в куче сроки, наступающие в ближайшие EXPIRY_HORIZON секунд, и
+срабатывает точно в момент истечения: снимает бан, напоминает о конце VIP
+за NOTIFY_VIP_EXPIRE_DAYS дней и сообщает, что VIP закончился. Сообщения
+уходят через очередь уведомлений. Новые сроки из ban_user/add_vip_days
+приходят через database.add_deadline_listener без перечитывания таблицы.
+"""
+import asyncio
+import heapq
+import logging
+import time
+
+import database
+from config import NOTIFY_VIP_EXPIRE_DAYS, EXPIRY_HORIZON
+from async_db import unban_if_expired, get_upcoming_expiries
+from notifier import notify
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+
+class ExpiryScheduler:
+    def __init__(self, horizon: int = EXPIRY_HORIZON):
+        self.horizon = horizon
+        self._heap = []     # (epoch, ключ таймера)
+        self._timers = {}   # ключ -> epoch; запись в куче без пары здесь устарела
+        self._loaded_until = 0
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        database.add_deadline_listener(self._on_deadline_changed)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        database.remove_deadline_listener(self._on_deadline_changed)
+        if self._task:
+            # wait_for в Python 3.11 теряет отмену, если событие сработало в тот же момент,
+            # поэтому цикл ещё и проверяет флаг
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def reload(self):
+        """Забывает таймеры и перечитывает сроки из БД (после восстановления из бэкапа)"""
+        self._heap.clear()
+        self._timers.clear()
+        self._loaded_until = 0
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _on_deadline_changed(self, kind: str, user_id: int, deadline):
+        # вызывается в потоке БД
+        self._loop.call_soon_threadsafe(self.schedule, kind, user_id, deadline)
+
+    def schedule(self, kind: str, user_id: int, deadline):
+        """Перепланирует все таймеры пользователя для kind ("ban" или "vip")"""
+        if kind == "ban":
+            self._set(("unban", user_id), deadline, fire_late=True)
+        elif kind == "vip":
+            for days in NOTIFY_VIP_EXPIRE_DAYS:
+                self._set(("vip_remind", user_id, days), deadline - days * DAY if deadline else None)
+            self._set(("vip_expired", user_id), deadline)
+
+    def _set(self, key: tuple, when, fire_late: bool = False):
+        now = time.time()
+        if when is not None and when <= now and fire_late:
+            when = now
+        if when is None or when < now or when > max(self._loaded_until, now + self.horizon):
+            # прошедшие напоминания не шлём, далёкие подхватит следующая загрузка
+            self._timers.pop(key, None)
+            return
+        if self._timers.get(key) == when:
+            return
+        self._timers[key] = when
+        heapq.heappush(self._heap, (when, key))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _reload(self):
+        now = int(time.time())
+        until = now + self.horizon
+        self._loaded_until = until
+        rows = await get_upcoming_expiries(until, max(NOTIFY_VIP_EXPIRE_DAYS, default=0) * DAY)
+        for kind, user_id, deadline in rows:
+            self.schedule(kind, user_id, deadline)
+        logger.info(f"⏰ Планировщик сроков: загружено {len(rows)}, таймеров {len(self._timers)}")
+
+    async def _fire(self, key: tuple):
+        kind, user_id = key[0], key[1]
+        if kind == "unban":
+            if await unban_if_expired(user_id):
+                logger.info(f"⏰ Бан пользователя {user_id} истёк")
+                await notify(user_id, "unban", "✅ Срок бана истёк. Вы снова можете пользоваться ботом.")
+        elif kind == "vip_remind":
+            await notify(user_id, "vip_expire", f"⭐ Ваша VIP подписка закончится через {key[2]} дн.")
+        elif kind == "vip_expired":
+            await notify(user_id, "vip_expired", "⭐ Ваша VIP подписка закончилась.")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                now = time.time()
+                if now >= self._loaded_until - self.horizon / 2:
+                    await self._reload()
+                while self._heap and self._heap[0][0] <= time.time():
+                    when, key = heapq.heappop(self._heap)
+                    if self._timers.get(key) != when:
+                        continue
+                    del self._timers[key]
+                    await self._fire(key)
+                timeout = self._loaded_until - self.horizon / 2 - time.time()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - time.time())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка планировщика сроков")
+                await asyncio.sleep(5)
+
+
+scheduler = ExpiryScheduler()
@@ -0,0 +1,83 @@
+"""Экспорт таблиц в CSV или NDJSON.
+
+Строки читаются курсором пачками по EXPORT_BATCH_SIZE и сразу пишутся в
+gzip-файл во временном каталоге, который затем отправляется с диска.
+Память не зависит от размера таблицы, а вся работа идёт в отдельном потоке
+и не останавливает цикл событий.
+"""
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from config import EXPORT_BATCH_SIZE
+from async_db import EXPORT_TABLES, iter_export_rows
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+
+def parse_export_args(args: str) -> dict:
+    """Разбирает «таблица [csv|ndjson] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [cols=a,b]».
+    При ошибке бросает ValueError с текстом для пользователя."""
+    parts = args.split()
+    if not parts or parts[0].lower() not in EXPORT_TABLES:
+        raise ValueError(f"Доступные таблицы: {', '.join(EXPORT_TABLES)}")
+    table = parts[0].lower()
+    available = EXPORT_TABLES[table][0]
+    options = {"table": table, "fmt": "csv", "columns": list(available), "date_from": None, "date_to": None}
+    for part in parts[1:]:
+        key, _, value = part.partition("=")
+        key = key.lower()
+        if not value and key in EXPORT_FORMATS:
+            options["fmt"] = key
+        elif key in ("from", "to"):
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Дата должна быть в формате ГГГГ-ММ-ДД: {part}")
+            options["date_from" if key == "from" else "date_to"] = value
+        elif key == "cols":
+            columns = [column for column in value.lower().split(",") if column]
+            unknown = [column for column in columns if column not in available]
+            if unknown or not columns:
+                raise ValueError(f"Столбцы {table}: {', '.join(available)}")
+            options["columns"] = columns
+        else:
+            raise ValueError(f"Непонятный параметр: {part}")
+    return options
+
+
+def _write_export(path: str, table: str, fmt: str, columns: list, date_from: str, date_to: str) -> int:
+    rows = iter_export_rows(table, columns, date_from, date_to, EXPORT_BATCH_SIZE)
+    count = 0
+    with gzip.open(path, "wt", compresslevel=6, encoding="utf-8", newline="") as out:
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                out.write("\n")
+                count += 1
+    return count
+
+
+async def export_table(table: str, fmt: str = "csv", columns: list = None, date_from: str = None, date_to: str = None) -> tuple:
+    """Пишет выгрузку во временный .gz файл. Возвращает (путь, число строк);
+    удалить файл после отправки должен вызывающий."""
+    fd, path = tempfile.mkstemp(prefix=f"export_{table}_", suffix=f".{fmt}.gz")
+    os.close(fd)
+    columns = columns or list(EXPORT_TABLES[table][0])
+    loop = asyncio.get_running_loop()
+    try:
+        count = await loop.run_in_executor(None, _write_export, path, table, fmt, columns, date_from, date_to)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
@@ -0,0 +1,175 @@
+"""Хранилище состояний FSM в основной базе SQLite.
+
+В отличие от MemoryStorage, состояния переживают перезапуск бота, а память
+не растёт с числом пользователей: в ОЗУ держится только LRU-кеш из
+FSM_CACHE_SIZE последних состояний. Изменения копятся в памяти и раз в
+FSM_FLUSH_INTERVAL секунд записываются в таблицу fsm_states одной
+транзакцией. Состояния, которые не менялись дольше FSM_STATE_TTL,
+считаются брошенными и удаляются.
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_STATE_TTL, FSM_CLEANUP_INTERVAL
+from async_db import load_fsm_state, save_fsm_states, delete_expired_fsm_states
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state=None, data=None, updated_at=None):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+    @property
+    def is_expired(self) -> bool:
+        return self.updated_at is not None and time.time() - self.updated_at > FSM_STATE_TTL
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, cache_size: int = FSM_CACHE_SIZE, flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache = OrderedDict()  # (chat, user) -> _Entry
+        self._dirty = {}             # изменённые, ещё не записанные записи
+        self._flushing = {}          # записи, которые пишутся прямо сейчас
+        self._task = None
+        self._closed = False
+
+    # --- внутреннее ---
+
+    def _key(self, chat, user) -> tuple:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _remember(self, key: tuple, entry: _Entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # вытесненная запись, если не записана, остаётся в _dirty до сброса
+            self._cache.popitem(last=False)
+
+    async def _get_entry(self, key: tuple) -> _Entry:
+        entry = self._cache.get(key) or self._dirty.get(key) or self._flushing.get(key)
+        if entry is None:
+            row = await load_fsm_state(*key)
+            # пока читали из БД, запись могли создать в памяти — она новее
+            entry = self._cache.get(key) or self._dirty.get(key) or self._flushing.get(key)
+            if entry is None:
+                entry = _Entry(row[0], json.loads(row[1]) if row[1] else {}, row[2]) if row else _Entry()
+        if entry.is_expired:
+            entry = _Entry()
+        self._remember(key, entry)
+        return entry
+
+    def _touch(self, key: tuple, entry: _Entry):
+        entry.updated_at = int(time.time())
+        self._remember(key, entry)
+        self._dirty[key] = entry
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush(self):
+        if not self._dirty:
+            return
+        self._flushing, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for (chat, user), entry in self._flushing.items():
+            if entry.is_empty:
+                deletes.append((chat, user))
+            else:
+                upserts.append((chat, user, entry.state, json.dumps(entry.data, ensure_ascii=False), entry.updated_at))
+        try:
+            await save_fsm_states(upserts, deletes)
+        except Exception:
+            # вернём записи в очередь, если их не успели изменить заново
+            for key, entry in self._flushing.items():
+                self._dirty.setdefault(key, entry)
+            raise
+        finally:
+            self._flushing = {}
+
+    async def flush(self):
+        await self._flush()
+
+    async def reset(self):
+        """Отбрасывает состояния в памяти, в том числе не записанные:
+        после восстановления базы из бэкапа они читаются из неё заново"""
+        self._cache.clear()
+        self._dirty.clear()
+
+    async def _flush_loop(self):
+        cleaned_at = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._flush()
+                if time.monotonic() - cleaned_at >= FSM_CLEANUP_INTERVAL:
+                    cleaned_at = time.monotonic()
+                    expired = await delete_expired_fsm_states(FSM_STATE_TTL)
+                    if expired:
+                        logger.info(f"🧹 Удалено брошенных состояний FSM: {expired}")
+            except Exception:
+                logger.exception("Ошибка записи состояний FSM")
+
+    # --- BaseStorage ---
+
+    async def close(self):
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self._flush()
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        entry = await self._get_entry(self._key(chat, user))
+        return entry.state if entry.state is not None else default
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        entry = await self._get_entry(self._key(chat, user))
+        return copy.deepcopy(entry.data) if entry.data else (default or {})
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key = self._key(chat, user)
+        entry = await self._get_entry(key)
+        entry.state = self.resolve_state(state)
+        self._touch(key, entry)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key = self._key(chat, user)
+        entry = await self._get_entry(key)
+        entry.data = copy.deepcopy(data) if data else {}
+        self._touch(key, entry)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        key = self._key(chat, user)
+        entry = await self._get_entry(key)
+        if data:
+            entry.data.update(data)
+        entry.data.update(kwargs)
+        self._touch(key, entry)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        key = self._key(chat, user)
+        entry = await self._get_entry(key)
+        entry.state = None
+        if with_data:
+            entry.data = {}
+        self._touch(key, entry)
@@ -2,31 +2,46 @@ from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ContentType, InlineKeyboardMarkup, InlineKeyboardButton
-import asyncio
-from datetime import datetime, timedelta
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
 import logging
 
-from config import OWNER, REPORT_CHAT_ID, BROADCAST_DELAY, CHANNEL_ID
-from database import (
-    get_user_role, get_all_admins, get_admin_logs, get_active_users_count,
-    get_total_confessions_count, get_pending_reports_count, db_fetch, db_exec,
+from config import (
+    OWNER, REPORT_CHAT_ID, DB_PATH, CLEANUP_CONFESSIONS_AGE, CLEANUP_REPORTS_AGE, EXPORT_MAX_UPLOAD,
+    FEED_PAGE_SIZE, ANALYTICS_HOURS_DAYS, CHART_DEFAULT_DAYS, CHART_MAX_BARS
+)
+from async_db import (
+    get_user_role, get_admin_logs, get_active_users_count,
+    get_total_confessions_count, get_pending_reports_count, db_fetch,
     get_user, get_user_by_username, get_user_stats, is_vip, ban_user, unban_user,
-    add_vip_days, remove_vip, get_banned_users, get_vip_users, get_all_users,
-    add_admin_log, set_admin_settings, get_admin_settings,
-    add_blacklist_word, remove_blacklist_word, get_blacklist_words, check_text_blacklist,
+    add_vip_days, remove_vip, get_banned_users, get_vip_users,
+    add_admin_log, set_admin_settings, get_admin_settings, get_settings_cache_stats,
+    add_admin_role, remove_admin_role,
+    add_blacklist_word, remove_blacklist_word, get_blacklist_words,
     add_warn, remove_warn, get_warns,
-    set_maintenance, is_maintenance,
+    set_maintenance,
     create_achievement, delete_achievement, get_all_achievements, award_achievement, remove_achievement,
     create_promo_code, get_promo_codes, delete_promo_code, get_promo_activations,
-    create_confession, get_confession, delete_confession,
-    update_reveal_status, create_report, delete_report,
-    get_top_users,
+    get_confession, delete_confession, rebuild_user_stats,
+    get_auto_vacuum, enable_incremental_vacuum,
+    delete_report,
+    now_epoch, epoch_after, format_epoch,
+    get_users_by_ids, get_confession_feed, count_confession_feed,
+    get_dashboard_stats, get_rollup_series, get_activity_by_hour,
     # whois
     is_whois_enabled,
     # battle
     is_battle_enabled, clear_battle_participants
 )
-from utils import format_user_name, html_escape, generate_csv
+from utils import format_user_name, format_time_left, html_escape, get_current_user_role, format_bar_chart
+from broadcast import start_broadcast, cancel_broadcast, get_broadcast_status
+from notifier import notify_everyone, get_job_status_text
+from ratelimit import get_throttle_stats
+from updates import get_update_stats
+from retention import run_retention
+from backup import create_backup, restore_backup, list_backups
+from export import parse_export_args, export_table
 from keyboards import get_admin_main_keyboard, get_back_keyboard, get_feed_keyboard
 
 logger = logging.getLogger(__name__)
@@ -53,7 +68,7 @@ class MaintenanceForm(StatesGroup):
 def admin_required(role_required="moderator"):
     def decorator(func):
         async def wrapper(message: types.Message, *args, **kwargs):
-            user_role = get_user_role(message.from_user.id)
+            user_role = await get_current_user_role(message.from_user.id)
             if not user_role:
                 return
             role_level = {"intern": 1, "moderator": 2, "admin": 3, "owner": 4}
@@ -67,49 +82,42 @@ def admin_required(role_required="moderator"):
 # ===== ОСНОВНЫЕ КМД =====
 
 async def cmd_admin(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if not user_role:
         return
     await message.answer("⚙️ Админ-панель", reply_markup=get_admin_main_keyboard(user_role))
 
 async def admin_stats_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if not user_role:
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    total_users = db_fetch_one("SELECT COUNT(*) FROM users")[0]
-    active_users = get_active_users_count()
-    banned_users = db_fetch_one("SELECT COUNT(*) FROM users WHERE banned = 1")[0]
-    vip_users = db_fetch_one("SELECT COUNT(*) FROM users WHERE vip_until > datetime('now')")[0]
-    total_confs = get_total_confessions_count()
-    today_confs = db_fetch_one("SELECT COUNT(*) FROM confessions WHERE created_at > datetime('now', '-1 day')")[0]
-    week_confs = db_fetch_one("SELECT COUNT(*) FROM confessions WHERE created_at > datetime('now', '-7 days')")[0]
-    pending_reports = get_pending_reports_count()
-    total_reports = db_fetch_one("SELECT COUNT(*) FROM reports")[0]
+    stats = await get_dashboard_stats()
+    totals, day, week = stats["totals"], stats["day"], stats["week"]
     text = f"""
 📊 Подробная статистика
 
 👥 Пользователи:
-• Всего: {total_users}
-• Активных: {active_users}
-• Забаненных: {banned_users}
-• VIP: {vip_users}
+• Всего: {totals.get('users', 0)}
+• Активных: {stats['active']}
+• Забаненных: {stats['banned']}
+• VIP: {stats['vip']}
 
 📩 Признания:
-• Всего отправлено: {total_confs}
-• За сутки: {today_confs}
-• За неделю: {week_confs}
+• Всего отправлено: {totals.get('confessions', 0)}
+• За сутки: {day.get('confessions', 0)}
+• За неделю: {week.get('confessions', 0)}
 
 🚩 Модерация:
-• Ожидающих жалоб: {pending_reports}
-• Всего жалоб: {total_reports}
+• Ожидающих жалоб: {stats['pending_reports']}
+• Всего жалоб: {totals.get('reports', 0)}
 
 🕐 Обновлено: {datetime.now().strftime('%H:%M:%S')}
 """
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_users_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if not user_role:
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -129,7 +137,7 @@ async def admin_users_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_confessions_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -146,7 +154,7 @@ async def admin_confessions_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_vip_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -164,7 +172,7 @@ async def admin_vip_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_promo_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -183,19 +191,32 @@ async def admin_promo_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_settings_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    settings = get_admin_settings()
+    settings = await get_admin_settings()
     text = "⚙️ Системные настройки\n\n"
     for key, value in settings:
         text += f"{key}: {value}\n"
+    cache = get_settings_cache_stats()
+    text += f"\nКеш настроек: попаданий {cache['hits']}, промахов {cache['misses']}\n"
+    throttle = get_throttle_stats()
+    text += f"Антиспам: ключей {throttle['keys']}, отклонено " + (
+        ", ".join(f"{action} {count}" for action, count in sorted(throttle['throttled'].items())) or "0"
+    ) + "\n"
+    queue = get_update_stats()
+    text += (
+        f"Обновления: в очереди {queue['pending']} (пользователей {queue['users']}, "
+        f"макс. у одного {queue['max_user_depth']}), выполняется {queue['in_flight']}, "
+        f"ожидание ср. {queue['wait_avg'] * 1000:.0f} мс, макс. {queue['wait_max'] * 1000:.0f} мс, "
+        f"отклонено {queue['rejected']}\n"
+    )
     text += "\nДля изменения настройки:\n/set ключ значение"
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_tools_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -204,18 +225,23 @@ async def admin_tools_callback(call: types.CallbackQuery):
 
 Команды:
 • /backup - Создать бэкап БД
+• /restore [файл] - Список бэкапов / восстановить БД
 • /logs количество - Показать логи
 • /cleanup - Очистка старых данных
-• /export users|confessions|achievements - Экспорт в CSV
+• /vacuum - Включить возврат места ОС (однократный полный VACUUM)
+• /rebuild_stats - Пересчитать счётчики профилей
+• /export таблица [csv|ndjson] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [cols=...] - Экспорт (gzip)
+  таблицы: users, confessions, reports, warnings, promo_activations, admin_logs, achievements
+• /feed [from=ID] [to=ID] [vip] [media=тип] [since=ГГГГ-ММ-ДД] [until=ГГГГ-ММ-ДД] - Лента признаний
 """
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_logs_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    logs = get_admin_logs(10)
+    logs = await get_admin_logs(10)
     text = "📁 Последние логи:\n\n"
     for log in logs:
         log_id, admin_id, action, details, created_at = log
@@ -223,7 +249,7 @@ async def admin_logs_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_moderation_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -240,7 +266,7 @@ async def admin_moderation_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_broadcast_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -254,13 +280,17 @@ async def admin_broadcast_callback(call: types.CallbackQuery):
 • /broadcast_active текст - Активным (были в боте за последние 7 дней)
 • /broadcast_inactive текст - Неактивным
 • /broadcast_filter all|vip|banned|active текст
+• /broadcast_status id - Прогресс рассылки
+• /broadcast_cancel id - Остановить рассылку
+
+Рассылка идёт в фоне, прогресс обновляется в отдельном сообщении.
 """
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 # ===== НОВЫЕ РАЗДЕЛЫ =====
 
 async def admin_maintenance_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -270,11 +300,12 @@ async def admin_maintenance_callback(call: types.CallbackQuery):
 Команды:
 • /maintenance_on - Включить режим техработ
 • /maintenance_off - Выключить
+• /notify_status id - Прогресс рассылки уведомления
 """
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_achievements_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
@@ -291,11 +322,11 @@ async def admin_achievements_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_whois_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    status = "включён" if is_whois_enabled() else "выключен"
+    status = "включён" if await is_whois_enabled() else "выключен"
     text = f"""
 🎭 Режим "Кто я?"
 
@@ -308,11 +339,11 @@ async def admin_whois_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_battle_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    status = "включён" if is_battle_enabled() else "выключен"
+    status = "включён" if await is_battle_enabled() else "выключен"
     text = f"""
 ⚔ Анонимный батл
 
@@ -326,53 +357,97 @@ async def admin_battle_callback(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
 async def admin_analytics_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    new_today = db_fetch_one("SELECT COUNT(*) FROM users WHERE created_at > datetime('now', '-1 day')")[0]
-    new_week = db_fetch_one("SELECT COUNT(*) FROM users WHERE created_at > datetime('now', '-7 days')")[0]
-    conf_today = db_fetch_one("SELECT COUNT(*) FROM confessions WHERE created_at > datetime('now', '-1 day')")[0]
-    conf_week = db_fetch_one("SELECT COUNT(*) FROM confessions WHERE created_at > datetime('now', '-7 days')")[0]
-    # Активность по часам
-    hours = db_fetch("SELECT strftime('%H', created_at) as h, COUNT(*) FROM confessions GROUP BY h ORDER BY h")
-    hours_text = "\n".join([f"{h:02d}:00 – {cnt}" for h, cnt in hours]) if hours else "Нет данных"
+    stats = await get_dashboard_stats()
+    day, week = stats["day"], stats["week"]
+    hours = await get_activity_by_hour("confessions", ANALYTICS_HOURS_DAYS)
+    hours_text = format_bar_chart([(f"{hour:02d}:00", count) for hour, count in enumerate(hours)]) if any(hours) else "Нет данных"
     text = f"""
 📈 Аналитика
 
 Новых пользователей:
-• за день: {new_today}
-• за неделю: {new_week}
+• за день: {day.get('users', 0)}
+• за неделю: {week.get('users', 0)}
 
 Признаний:
-• за день: {conf_today}
-• за неделю: {conf_week}
+• за день: {day.get('confessions', 0)}
+• за неделю: {week.get('confessions', 0)}
 
-Активность по часам:
+Выдано VIP за неделю: {week.get('vip', 0)}
+Активаций промокодов за неделю: {week.get('promo', 0)}
+
+Активность по часам (за {ANALYTICS_HOURS_DAYS} дн.):
 {hours_text}
+
+Графики за период: /chart
 """
     await call.message.edit_text(text, reply_markup=get_back_keyboard())
 
-async def admin_feed_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+async def admin_feed_callback(call: types.CallbackQuery, state: FSMContext):
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role != "owner":
         await call.answer("Доступ запрещен", show_alert=True)
         return
-    await feed_cmd(call.message, 1)
+    await state.update_data(feed_filters={})
+    await _show_feed(call.message, {})
 
 # ===== КОМАНДЫ =====
 
 async def stat_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if not user_role:
         return
-    users = get_active_users_count()
-    confs = get_total_confessions_count()
-    reports = get_pending_reports_count()
+    users = await get_active_users_count()
+    confs = await get_total_confessions_count()
+    reports = await get_pending_reports_count()
     await message.answer(f"📊 Статистика:\n👥 Пользователей: {users}\n📩 Признаний: {confs}\n🚩 Жалоб: {reports}")
 
+CHART_METRICS = {
+    "users": "Новые пользователи",
+    "confessions": "Признания",
+    "reports": "Жалобы",
+    "vip": "Выдачи VIP",
+    "promo": "Активации промокодов",
+}
+
+async def chart_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role not in ["owner", "admin"]:
+        return
+    usage = (
+        f"Использование: /chart {'|'.join(CHART_METRICS)} [ГГГГ-ММ-ДД] [ГГГГ-ММ-ДД]\n"
+        f"По умолчанию — последние {CHART_DEFAULT_DAYS} дней, сутки по UTC."
+    )
+    args = message.get_args().split()
+    if not args or args[0] not in CHART_METRICS:
+        await message.answer(usage)
+        return
+    metric = args[0]
+    try:
+        dates = [int(datetime.strptime(arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) for arg in args[1:3]]
+    except ValueError:
+        await message.answer(usage)
+        return
+    until = dates[1] if len(dates) > 1 else now_epoch()
+    since = dates[0] if dates else until - (CHART_DEFAULT_DAYS - 1) * 86400
+    if since > until:
+        since, until = until, since
+    series = await get_rollup_series(metric, since, until, "day")
+    # длинный период сворачиваем по несколько дней, чтобы сообщение поместилось
+    step = -(-len(series) // CHART_MAX_BARS)
+    bars = [
+        (datetime.fromtimestamp(series[i][0], timezone.utc).strftime("%d.%m.%y"), sum(value for _, value in series[i:i + step]))
+        for i in range(0, len(series), step)
+    ]
+    period = "по дням" if step == 1 else f"по {step} дн."
+    text = f"📈 {CHART_METRICS[metric]} {period}\nВсего за период: {sum(value for _, value in series)}\n\n"
+    await message.answer(text + format_bar_chart(bars))
+
 async def find_user_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator", "intern"]:
         return
     args = message.get_args().strip()
@@ -383,25 +458,25 @@ async def find_user_cmd(message: types.Message):
     user = None
     if args.startswith("@"):
         username = args[1:]
-        user = get_user_by_username(username)
+        user = await get_user_by_username(username)
         if user:
             user_id = user[0]
     else:
         try:
             user_id = int(args)
-            user = get_user(user_id)
+            user = await get_user(user_id)
         except:
             pass
     if not user:
         await message.answer("❌ Пользователь не найден.")
         return
-    stats = get_user_stats(user_id)
-    user_vip = is_vip(user_id)
+    stats = await get_user_stats(user_id)
+    user_vip = await is_vip(user_id)
     emoji = user[6] if user[6] else "💍"
     ban_status = "Да" if user[3] == 1 else "Нет"
-    ban_until = user[4] if user[4] else "Нет"
+    ban_until = format_epoch(user[4]) or "Нет"
     vip_until = format_time_left(user[5])
-    warns = get_warns(user_id)
+    warns = await get_warns(user_id)
     warns_count = len(warns)
     text = (
         f"👤 <b>Информация о пользователе</b>\n\n"
@@ -419,13 +494,13 @@ async def find_user_cmd(message: types.Message):
         f"📤 Отправлено признаний: {stats['sent']}\n"
         f"🚩 Подано жалоб: {stats['reports']}\n"
     )
-    user_role_info = get_user_role(user_id)
+    user_role_info = await get_user_role(user_id)
     if user_role_info:
         text += f"\n👮 <b>Роль: {user_role_info.upper()}</b>"
     await message.answer(text)
 
 async def ban_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().strip()
@@ -443,13 +518,13 @@ async def ban_cmd(message: types.Message):
         if days < 0:
             await message.answer("❌ Количество дней не может быть отрицательным")
             return
-        ban_user(uid, days, reason)
+        await ban_user(uid, days, reason)
         if days == 0:
             ban_text = "навсегда"
         else:
             ban_text = f"{days} дней"
         await message.answer(f"✅ Пользователь {uid} забанен на {ban_text}\nПричина: {reason}")
-        add_admin_log(message.from_user.id, "ban", f"Забанен пользователь {uid} на {days} дней. Причина: {reason}")
+        await add_admin_log(message.from_user.id, "ban", f"Забанен пользователь {uid} на {days} дней. Причина: {reason}")
         try:
             if days == 0:
                 ban_time = "навсегда"
@@ -470,7 +545,7 @@ async def ban_cmd(message: types.Message):
         await message.answer(f"❌ Ошибка: {e}")
 
 async def unban_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().strip()
@@ -479,9 +554,9 @@ async def unban_cmd(message: types.Message):
         return
     try:
         uid = int(args)
-        unban_user(uid)
+        await unban_user(uid)
         await message.answer(f"✅ Пользователь {uid} разбанен.")
-        add_admin_log(message.from_user.id, "unban", f"Разбанен пользователь {uid}")
+        await add_admin_log(message.from_user.id, "unban", f"Разбанен пользователь {uid}")
         try:
             await message.bot.send_message(uid, "✅ Ваш бан был снят администратором.")
         except:
@@ -490,10 +565,10 @@ async def unban_cmd(message: types.Message):
         await message.answer("❌ Укажите корректный числовой ID.")
 
 async def banned_list_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
-    res = get_banned_users()
+    res = await get_banned_users()
     if not res:
         await message.answer("✅ Нет забаненных пользователей.")
         return
@@ -505,7 +580,7 @@ async def banned_list_cmd(message: types.Message):
     await message.answer(text)
 
 async def warn_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().split(maxsplit=2)
@@ -513,20 +588,20 @@ async def warn_cmd(message: types.Message):
         await message.answer("Использование: /warn @username/id причина")
         return
     target, reason = args[0], args[2]
-    user = get_user_by_username(target[1:]) if target.startswith('@') else get_user(int(target))
+    user = await get_user_by_username(target[1:]) if target.startswith('@') else await get_user(int(target))
     if not user:
         await message.answer("❌ Пользователь не найден.")
         return
-    banned = add_warn(user[0], message.from_user.id, reason)
+    banned = await add_warn(user[0], message.from_user.id, reason)
     if banned:
         await message.answer(f"⚠️ Пользователь {target} получил 3-е предупреждение и забанен навсегда.")
     else:
-        warns = get_warns(user[0])
+        warns = await get_warns(user[0])
         await message.answer(f"⚠️ Предупреждение выдано. Всего предупреждений: {len(warns)}")
-    add_admin_log(message.from_user.id, "warn", f"Выдано предупреждение {user[0]}: {reason}")
+    await add_admin_log(message.from_user.id, "warn", f"Выдано предупреждение {user[0]}: {reason}")
 
 async def unwarn_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().split()
@@ -534,16 +609,16 @@ async def unwarn_cmd(message: types.Message):
         await message.answer("Использование: /unwarn @username/id")
         return
     target = args[0]
-    user = get_user_by_username(target[1:]) if target.startswith('@') else get_user(int(target))
+    user = await get_user_by_username(target[1:]) if target.startswith('@') else await get_user(int(target))
     if not user:
         await message.answer("❌ Пользователь не найден.")
         return
-    remove_warn(user[0])
+    await remove_warn(user[0])
     await message.answer(f"✅ Последнее предупреждение удалено.")
-    add_admin_log(message.from_user.id, "unwarn", f"Снято предупреждение {user[0]}")
+    await add_admin_log(message.from_user.id, "unwarn", f"Снято предупреждение {user[0]}")
 
 async def vip_add_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
     args = message.get_args().strip()
@@ -560,13 +635,13 @@ async def vip_add_cmd(message: types.Message):
         if days <= 0:
             await message.answer("❌ Количество дней должно быть положительным числом.")
             return
-        user = get_user(user_id)
+        user = await get_user(user_id)
         if not user:
             await message.answer("❌ Пользователь не найден.")
             return
-        add_vip_days(user_id, days)
+        await add_vip_days(user_id, days)
         await message.answer(f"✅ Пользователю {user_id} добавлено {days} дней VIP.")
-        add_admin_log(message.from_user.id, "vip_add", f"Добавлено {days} дней VIP пользователю {user_id}")
+        await add_admin_log(message.from_user.id, "vip_add", f"Добавлено {days} дней VIP пользователю {user_id}")
         try:
             await message.bot.send_message(user_id, f"⭐ Вам добавлено {days} дней VIP подписки администратором!")
         except:
@@ -575,7 +650,7 @@ async def vip_add_cmd(message: types.Message):
         await message.answer("❌ ID и дни должны быть числами.")
 
 async def vip_remove_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
     args = message.get_args().strip()
@@ -584,16 +659,16 @@ async def vip_remove_cmd(message: types.Message):
         return
     try:
         user_id = int(args)
-        user = get_user(user_id)
+        user = await get_user(user_id)
         if not user:
             await message.answer("❌ Пользователь не найден.")
             return
-        if not is_vip(user_id):
+        if not await is_vip(user_id):
             await message.answer("❌ У пользователя нет VIP.")
             return
-        remove_vip(user_id)
+        await remove_vip(user_id)
         await message.answer(f"✅ VIP удален у пользователя {user_id}.")
-        add_admin_log(message.from_user.id, "vip_remove", f"Удален VIP у пользователя {user_id}")
+        await add_admin_log(message.from_user.id, "vip_remove", f"Удален VIP у пользователя {user_id}")
         try:
             await message.bot.send_message(user_id, "⚠️ Ваша VIP подписка была удалена администратором.")
         except:
@@ -602,10 +677,10 @@ async def vip_remove_cmd(message: types.Message):
         await message.answer("❌ ID должен быть числом.")
 
 async def vip_list_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
-    vip_users = get_vip_users()
+    vip_users = await get_vip_users()
     if not vip_users:
         await message.answer("⭐ Нет VIP пользователей.")
         return
@@ -622,18 +697,20 @@ async def blacklist_add_cmd(message: types.Message):
     if not word:
         await message.answer("Укажите слово.")
         return
-    if add_blacklist_word(word):
+    if await add_blacklist_word(word):
         await message.answer(f"✅ Слово '{word}' добавлено в чёрный список.")
     else:
         await message.answer("❌ Такое слово уже есть.")
 
 async def blacklist_remove_cmd(message: types.Message):
     word = message.get_args().strip().lower()
-    remove_blacklist_word(word)
-    await message.answer(f"✅ Слово '{word}' удалено из чёрного списка.")
+    if await remove_blacklist_word(word):
+        await message.answer(f"✅ Слово '{word}' удалено из чёрного списка.")
+    else:
+        await message.answer(f"❌ Слова '{word}' нет в чёрном списке.")
 
 async def blacklist_list_cmd(message: types.Message):
-    words = get_blacklist_words()
+    words = await get_blacklist_words()
     if not words:
         await message.answer("📭 Чёрный список пуст.")
     else:
@@ -641,7 +718,7 @@ async def blacklist_list_cmd(message: types.Message):
         await message.answer(text)
 
 async def confession_info_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().strip()
@@ -650,7 +727,7 @@ async def confession_info_cmd(message: types.Message):
         return
     try:
         confession_id = int(args)
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         if not confession:
             await message.answer("❌ Признание не найдено.")
             return
@@ -662,8 +739,8 @@ async def confession_info_cmd(message: types.Message):
         reveal_status = confession[7]
         is_vip_sender = confession[8]
         created_at = confession[9]
-        from_user_info = get_user(from_user)
-        to_user_info = get_user(to_user)
+        from_user_info = await get_user(from_user)
+        to_user_info = await get_user(to_user)
         from_name = format_user_name(from_user_info)
         to_name = format_user_name(to_user_info)
         reveal_text = ""
@@ -697,7 +774,7 @@ async def confession_info_cmd(message: types.Message):
         await message.answer("❌ ID должен быть числом.")
 
 async def delete_confession_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().strip()
@@ -706,21 +783,21 @@ async def delete_confession_cmd(message: types.Message):
         return
     try:
         confession_id = int(args)
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         if not confession:
             await message.answer("❌ Признание не найдено.")
             return
-        delete_confession(confession_id)
+        await delete_confession(confession_id)
         await message.answer(f"✅ Признание #{confession_id} удалено.")
-        add_admin_log(message.from_user.id, "delete_confession", f"Удалено признание #{confession_id}")
+        await add_admin_log(message.from_user.id, "delete_confession", f"Удалено признание #{confession_id}")
     except ValueError:
         await message.answer("❌ ID должен быть числом.")
 
 async def reports_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
-    reps = db_fetch("SELECT id, confession_id, reporter_id, created_at FROM reports ORDER BY created_at DESC LIMIT 50")
+    reps = await db_fetch("SELECT id, confession_id, reporter_id, created_at FROM reports ORDER BY created_at DESC LIMIT 50")
     if not reps:
         await message.answer("🚩 Жалоб нет.")
         return
@@ -730,7 +807,7 @@ async def reports_cmd(message: types.Message):
     await message.answer(text)
 
 async def add_promo_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
     args = message.get_args().split()
@@ -745,23 +822,23 @@ async def add_promo_cmd(message: types.Message):
     except:
         await message.answer("❌ Числовые значения должны быть числами.")
         return
-    expires_at = (datetime.now() + timedelta(days=expires_days)).strftime("%Y-%m-%d %H:%M:%S") if expires_days else None
-    create_promo_code(code, activations, vip_days, message.from_user.id, expires_at)
+    expires_at = epoch_after(days=expires_days) if expires_days else None
+    await create_promo_code(code, activations, vip_days, message.from_user.id, expires_at)
     await message.answer(f"✅ Промокод {code} создан.")
-    add_admin_log(message.from_user.id, "add_promo", f"{code}")
+    await add_admin_log(message.from_user.id, "add_promo", f"{code}")
 
 async def promo_list_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
-    promos = get_promo_codes()
+    promos = await get_promo_codes()
     if not promos:
         await message.answer("🎁 Нет созданных промокодов.")
         return
     text = "🎁 <b>Список промокодов:</b>\n\n"
     for promo in promos:
         code, activations, activations_left, vip_days, created_by, created_at, expires_at = promo
-        creator = get_user(created_by)
+        creator = await get_user(created_by)
         creator_name = format_user_name(creator) if creator else f"User {created_by}"
         text += f"<b>Код:</b> {code}\n"
         text += f"<b>Активаций:</b> {activations_left}/{activations}\n"
@@ -769,43 +846,43 @@ async def promo_list_cmd(message: types.Message):
         text += f"<b>Создал:</b> {creator_name}\n"
         text += f"<b>Создан:</b> {created_at}\n"
         if expires_at:
-            text += f"<b>Истекает:</b> {expires_at}\n"
+            text += f"<b>Истекает:</b> {format_epoch(expires_at)}\n"
         text += "─" * 20 + "\n"
     await message.answer(text)
 
 async def promo_delete_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
     code = message.get_args().strip().upper()
     if not code:
         await message.answer("Укажите код.")
         return
-    delete_promo_code(code)
+    await delete_promo_code(code)
     await message.answer(f"✅ Промокод {code} удален.")
-    add_admin_log(message.from_user.id, "promo_delete", f"Удален промокод {code}")
+    await add_admin_log(message.from_user.id, "promo_delete", f"Удален промокод {code}")
 
 async def promo_activations_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin"]:
         return
     code = message.get_args().strip().upper()
     if not code:
         await message.answer("Укажите код.")
         return
-    activations = get_promo_activations(code)
+    activations = await get_promo_activations(code)
     if not activations:
         await message.answer("Нет активаций.")
         return
     text = f"📊 Активации промокода {code}:\n"
     for user_id, activated_at in activations:
-        user = get_user(user_id)
+        user = await get_user(user_id)
         name = format_user_name(user)
         text += f"• {name} – {activated_at}\n"
     await message.answer(text)
 
 async def set_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
     args = message.get_args().strip()
@@ -817,32 +894,53 @@ async def set_cmd(message: types.Message):
         await message.answer("Использование: /set ключ значение")
         return
     key, value = parts[0], parts[1]
-    set_admin_settings(key, value)
+    await set_admin_settings(key, value)
     await message.answer(f"✅ Настройка {key} изменена на: {value}")
-    add_admin_log(message.from_user.id, "set", f"Изменена настройка {key} на {value}")
+    await add_admin_log(message.from_user.id, "set", f"Изменена настройка {key} на {value}")
 
 async def backup_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
-    import shutil, os
-    from config import BACKUP_PATH, DB_PATH
     try:
-        os.makedirs(BACKUP_PATH, exist_ok=True)
-        backup_name = f"confessions_backup_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.db"
-        backup_file = os.path.join(BACKUP_PATH, backup_name)
-        if os.path.exists(DB_PATH):
-            shutil.copy2(DB_PATH, backup_file)
-            await message.answer(f"✅ Бэкап создан: {backup_name}")
-            add_admin_log(message.from_user.id, "backup", f"Создан бэкап {backup_name}")
-        else:
-            await message.answer("❌ Файл базы данных не найден.")
+        await message.answer("💾 Создаю бэкап...")
+        backup_name, size = await create_backup()
+        await message.answer(f"✅ Бэкап создан: {backup_name} ({size / 1024 / 1024:.1f} МБ)")
+        await add_admin_log(message.from_user.id, "backup", f"Создан бэкап {backup_name}")
     except Exception as e:
         logger.error(f"Ошибка создания бэкапа: {e}")
         await message.answer(f"❌ Ошибка создания бэкапа: {e}")
 
+async def restore_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role != "owner":
+        return
+    backup_name = message.get_args().strip()
+    if not backup_name:
+        backups = list_backups()
+        if not backups:
+            await message.answer("💾 Бэкапов нет.")
+            return
+        text = "💾 Бэкапы (новые первыми):\n\n"
+        for name, size in backups:
+            text += f"<code>{name}</code> — {size / 1024 / 1024:.1f} МБ\n"
+        text += "\nВосстановить: /restore имя_файла"
+        await message.answer(text)
+        return
+    try:
+        await message.answer(f"♻️ Восстанавливаю базу из {backup_name}...")
+        safety_name = await restore_backup(backup_name)
+        await message.answer(
+            f"✅ База восстановлена из {backup_name}.\n"
+            f"Прежняя база сохранена в {safety_name}."
+        )
+        await add_admin_log(message.from_user.id, "restore", f"Восстановлено из {backup_name}")
+    except Exception as e:
+        logger.error(f"Ошибка восстановления из бэкапа: {e}")
+        await message.answer(f"❌ Ошибка восстановления: {e}")
+
 async def logs_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
     args = message.get_args().strip()
@@ -870,29 +968,77 @@ async def logs_cmd(message: types.Message):
         await message.answer(f"❌ Ошибка чтения логов: {e}")
 
 async def cleanup_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
     try:
-        old_reports = db_exec("DELETE FROM reports WHERE created_at < datetime('now', '-30 days')")
-        old_confs = db_exec("DELETE FROM confessions WHERE created_at < datetime('now', '-90 days')")
-        await message.answer(f"✅ Очистка выполнена.\nУдалено признаний: {old_confs}\nУдалено жалоб: {old_reports}")
-        add_admin_log(message.from_user.id, "cleanup", f"Очистка: {old_confs} признаний, {old_reports} жалоб")
+        await message.answer("🧹 Очистка запущена...")
+        old_confs, old_reports, freed = await run_retention(CLEANUP_CONFESSIONS_AGE, CLEANUP_REPORTS_AGE)
+        await message.answer(
+            f"✅ Очистка выполнена.\nУдалено признаний: {old_confs}\nУдалено жалоб: {old_reports}\n"
+            f"Освобождено: {freed / 1024 / 1024:.1f} МБ"
+        )
+        await add_admin_log(message.from_user.id, "cleanup", f"Очистка: {old_confs} признаний, {old_reports} жалоб")
     except Exception as e:
         logger.error(f"Ошибка очистки: {e}")
         await message.answer(f"❌ Ошибка очистки: {e}")
 
+async def vacuum_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role != "owner":
+        return
+    if await get_auto_vacuum() == 2:
+        await message.answer("✅ auto_vacuum = INCREMENTAL уже включён, место возвращается при очистке.")
+        return
+    size = os.path.getsize(DB_PATH)
+    free = shutil.disk_usage(os.path.dirname(DB_PATH)).free
+    if message.get_args().strip() != "confirm":
+        await message.answer(
+            f"🗄 auto_vacuum выключен: место после удалений не возвращается ОС.\n"
+            f"Включение перезаписывает всю базу ({size / 1024 / 1024:.1f} МБ) полным VACUUM. "
+            f"Всё это время бот не сможет ничего записать, а на диске нужно до двух размеров базы "
+            f"(свободно {free / 1024 / 1024:.1f} МБ).\n\n"
+            f"Запустить: /vacuum confirm"
+        )
+        return
+    if free < size * 2:
+        await message.answer("❌ Недостаточно места на диске для VACUUM.")
+        return
+    try:
+        await message.answer("🗄 VACUUM запущен...")
+        new_size = await enable_incremental_vacuum()
+        await message.answer(
+            f"✅ auto_vacuum = INCREMENTAL включён.\n"
+            f"Размер базы: {size / 1024 / 1024:.1f} → {new_size / 1024 / 1024:.1f} МБ"
+        )
+        await add_admin_log(message.from_user.id, "vacuum", f"VACUUM: {size} → {new_size} байт")
+    except Exception as e:
+        logger.error(f"Ошибка VACUUM: {e}")
+        await message.answer(f"❌ Ошибка VACUUM: {e}")
+
+async def rebuild_stats_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role != "owner":
+        return
+    try:
+        users = await rebuild_user_stats()
+        await message.answer(f"✅ Счётчики пересчитаны.\nПользователей со статистикой: {users}")
+        await add_admin_log(message.from_user.id, "rebuild_stats", f"Пересчёт счётчиков: {users} пользователей")
+    except Exception as e:
+        logger.error(f"Ошибка пересчёта счётчиков: {e}")
+        await message.answer(f"❌ Ошибка пересчёта: {e}")
+
 async def moderate_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
-    reports = db_fetch("SELECT id, confession_id, reporter_id, created_at FROM reports ORDER BY created_at DESC LIMIT 1")
+    reports = await db_fetch("SELECT id, confession_id, reporter_id, created_at FROM reports ORDER BY created_at DESC LIMIT 1")
     if not reports:
         await message.answer("🚩 Нет жалоб для модерации.")
         return
     report = reports[0]
     report_id, confession_id, reporter_id, created_at = report
-    confession = get_confession(confession_id)
+    confession = await get_confession(confession_id)
     if not confession:
         await message.answer("❌ Признание не найдено.")
         return
@@ -919,56 +1065,20 @@ async def broadcast_cmd_generic(message: types.Message, filter_type: str):
     if not text:
         await message.answer(f"Использование: /broadcast_{filter_type} текст")
         return
-    users = []
-    if filter_type == "all":
-        users = get_all_users()
-    elif filter_type == "vip":
-        vip_data = get_vip_users()
-        users = [(uid,) for uid, _, _ in vip_data]
-    elif filter_type == "nonvip":
-        all_users = get_all_users()
-        vip_ids = {uid for uid, _, _ in get_vip_users()}
-        users = [(uid,) for uid, in all_users if uid not in vip_ids]
-    elif filter_type == "active":
-        # активные за последние 7 дней
-        users = db_fetch("SELECT id FROM users WHERE last_active > datetime('now', '-7 days') AND banned=0")
-    elif filter_type == "inactive":
-        users = db_fetch("SELECT id FROM users WHERE last_active <= datetime('now', '-7 days') AND banned=0")
-    elif filter_type == "filter":
+    if filter_type == "filter":
         args = text.split(maxsplit=1)
         if len(args) < 2:
             await message.answer("Использование: /broadcast_filter all|vip|banned|active текст")
             return
-        ftype, text = args[0].lower(), args[1]
-        if ftype == "all":
-            users = get_all_users()
-        elif ftype == "vip":
-            vip_data = get_vip_users()
-            users = [(uid,) for uid, _, _ in vip_data]
-        elif ftype == "banned":
-            users = get_banned_users()
-        elif ftype == "active":
-            users = db_fetch("SELECT id FROM users WHERE last_active > datetime('now', '-7 days') AND banned=0")
-        else:
+        filter_type, text = args[0].lower(), args[1]
+        if filter_type not in ("all", "vip", "banned", "active"):
             await message.answer("Неверный фильтр.")
             return
-    else:
-        await message.answer("Неизвестный тип рассылки.")
-        return
-    if not users:
+    job_id = await start_broadcast(message.bot, message.from_user.id, message.chat.id, filter_type, text)
+    if job_id is None:
         await message.answer(f"❌ Нет пользователей для рассылки.")
         return
-    success = 0
-    fail = 0
-    for (uid,) in users:
-        try:
-            await message.bot.send_message(uid, f"{text}")
-            success += 1
-            await asyncio.sleep(BROADCAST_DELAY)
-        except Exception:
-            fail += 1
-    await message.answer(f"✅ Рассылка завершена.\nДоставлено: {success}\nОшибок: {fail}")
-    add_admin_log(message.from_user.id, "broadcast", f"{filter_type}: {text[:50]}...")
+    await add_admin_log(message.from_user.id, "broadcast", f"#{job_id} {filter_type}: {text[:50]}...")
 
 async def broadcast_all_cmd(message: types.Message):
     await broadcast_cmd_generic(message, "all")
@@ -988,6 +1098,31 @@ async def broadcast_inactive_cmd(message: types.Message):
 async def broadcast_filter_cmd(message: types.Message):
     await broadcast_cmd_generic(message, "filter")
 
+async def broadcast_status_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role not in ["owner", "admin"]:
+        return
+    args = message.get_args().strip()
+    if not args.isdigit():
+        await message.answer("Использование: /broadcast_status id")
+        return
+    status = await get_broadcast_status(int(args))
+    await message.answer(status or "❌ Рассылка не найдена")
+
+async def broadcast_cancel_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role not in ["owner", "admin"]:
+        return
+    args = message.get_args().strip()
+    if not args.isdigit():
+        await message.answer("Использование: /broadcast_cancel id")
+        return
+    if await cancel_broadcast(message.bot, int(args)):
+        await message.answer(f"⛔ Рассылка #{args} остановлена")
+        await add_admin_log(message.from_user.id, "broadcast_cancel", f"#{args}")
+    else:
+        await message.answer("❌ Рассылка не найдена или уже завершена")
+
 async def add_role_cmd(message: types.Message):
     if message.from_user.id not in OWNER:
         return
@@ -1006,7 +1141,7 @@ async def add_role_cmd(message: types.Message):
     target = parts[1]
     user_id = None
     if target.startswith("@"):
-        user = get_user_by_username(target[1:])
+        user = await get_user_by_username(target[1:])
         if user:
             user_id = user[0]
     else:
@@ -1017,7 +1152,7 @@ async def add_role_cmd(message: types.Message):
     if not user_id:
         await message.answer("❌ Пользователь не найден")
         return
-    add_admin_role(user_id, role, message.from_user.id)
+    await add_admin_role(user_id, role, message.from_user.id)
     await message.answer(f"✅ Роль {role} назначена пользователю {user_id}")
     try:
         await message.bot.send_message(user_id, f"👮 Вам назначена роль {role.upper()}")
@@ -1042,7 +1177,7 @@ async def del_role_cmd(message: types.Message):
     target = parts[1]
     user_id = None
     if target.startswith("@"):
-        user = get_user_by_username(target[1:])
+        user = await get_user_by_username(target[1:])
         if user:
             user_id = user[0]
     else:
@@ -1053,7 +1188,7 @@ async def del_role_cmd(message: types.Message):
     if not user_id:
         await message.answer("❌ Пользователь не найден")
         return
-    remove_admin_role(user_id, role, message.from_user.id)
+    await remove_admin_role(user_id, role, message.from_user.id)
     await message.answer(f"✅ Роль {role} удалена у пользователя {user_id}")
     try:
         await message.bot.send_message(user_id, f"👮 У вас удалена роль {role.upper()}")
@@ -1082,12 +1217,12 @@ async def handle_banuser_callback(call: types.CallbackQuery):
 
 async def handle_ignore_callback(call: types.CallbackQuery):
     report_id = int(call.data.split("_")[1])
-    delete_report(report_id)
+    await delete_report(report_id)
     await call.message.edit_text(call.message.text + "\n\n✅ Жалоба проигнорирована (удалена).")
     await call.answer("Жалоба проигнорирована.", show_alert=True)
 
 async def process_ban_details(message: types.Message, state: FSMContext):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         await state.finish()
         return
@@ -1108,15 +1243,15 @@ async def process_ban_details(message: types.Message, state: FSMContext):
         if days < 0:
             await message.answer("❌ Количество дней не может быть отрицательным")
             return
-        ban_user(user_id, days, reason)
+        await ban_user(user_id, days, reason)
         if report_id:
-            delete_report(report_id)
+            await delete_report(report_id)
         if days == 0:
             ban_text = "навсегда"
         else:
             ban_text = f"{days} дней"
         await message.answer(f"✅ Пользователь {user_id} забанен на {ban_text}\nПричина: {reason}")
-        add_admin_log(message.from_user.id, "ban", f"Забанен пользователь {user_id} на {days} дней. Причина: {reason}")
+        await add_admin_log(message.from_user.id, "ban", f"Забанен пользователь {user_id} на {days} дней. Причина: {reason}")
         try:
             if days == 0:
                 ban_time = "навсегда"
@@ -1146,24 +1281,24 @@ async def process_ban_details(message: types.Message, state: FSMContext):
     await state.finish()
 
 async def admin_delete_conf_callback(call: types.CallbackQuery):
-    user_role = get_user_role(call.from_user.id)
+    user_role = await get_current_user_role(call.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         await call.answer("Доступ запрещен", show_alert=True)
         return
     confession_id = int(call.data.split("_")[3])
-    confession = get_confession(confession_id)
+    confession = await get_confession(confession_id)
     if not confession:
         await call.answer("❌ Признание не найдено", show_alert=True)
         return
-    delete_confession(confession_id)
+    await delete_confession(confession_id)
     await call.message.edit_text(f"✅ Признание #{confession_id} удалено.")
-    add_admin_log(call.from_user.id, "delete_confession", f"Удалено признание #{confession_id}")
+    await add_admin_log(call.from_user.id, "delete_confession", f"Удалено признание #{confession_id}")
     await call.answer("Признание удалено", show_alert=True)
 
 # ===== ДОСТИЖЕНИЯ =====
 
 async def create_achievement_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
     await AchievementForm.waiting_for_name.set()
@@ -1178,12 +1313,12 @@ async def achievement_description_handler(message: types.Message, state: FSMCont
     data = await state.get_data()
     name = data['name']
     desc = message.text
-    create_achievement(name, desc)
+    await create_achievement(name, desc)
     await message.answer(f"✅ Достижение '{name}' создано.")
     await state.finish()
 
 async def delete_achievement_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
     try:
@@ -1191,11 +1326,11 @@ async def delete_achievement_cmd(message: types.Message):
     except:
         await message.answer("Укажите ID достижения.")
         return
-    delete_achievement(ach_id)
+    await delete_achievement(ach_id)
     await message.answer("✅ Достижение удалено.")
 
 async def give_achievement_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().split()
@@ -1204,11 +1339,11 @@ async def give_achievement_cmd(message: types.Message):
         return
     target = args[0]
     ach_id = int(args[1])
-    user = get_user_by_username(target[1:]) if target.startswith('@') else get_user(int(target))
+    user = await get_user_by_username(target[1:]) if target.startswith('@') else await get_user(int(target))
     if not user:
         await message.answer("❌ Пользователь не найден.")
         return
-    if award_achievement(user[0], ach_id):
+    if await award_achievement(user[0], ach_id):
         await message.answer("✅ Достижение выдано.")
         try:
             await message.bot.send_message(user[0], f"🏅 Вы получили достижение!")
@@ -1218,7 +1353,7 @@ async def give_achievement_cmd(message: types.Message):
         await message.answer("❌ У пользователя уже есть это достижение.")
 
 async def take_achievement_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
     args = message.get_args().split()
@@ -1227,18 +1362,18 @@ async def take_achievement_cmd(message: types.Message):
         return
     target = args[0]
     ach_id = int(args[1])
-    user = get_user_by_username(target[1:]) if target.startswith('@') else get_user(int(target))
+    user = await get_user_by_username(target[1:]) if target.startswith('@') else await get_user(int(target))
     if not user:
         await message.answer("❌ Пользователь не найден.")
         return
-    remove_achievement(user[0], ach_id)
+    await remove_achievement(user[0], ach_id)
     await message.answer("✅ Достижение удалено у пользователя.")
 
 async def ach_list_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role not in ["owner", "admin", "moderator"]:
         return
-    achievements = get_all_achievements()
+    achievements = await get_all_achievements()
     if not achievements:
         await message.answer("🏅 Нет созданных достижений.")
         return
@@ -1250,7 +1385,7 @@ async def ach_list_cmd(message: types.Message):
 # ===== ТЕХРАБОТЫ =====
 
 async def maintenance_on_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
     await MaintenanceForm.waiting_for_reason.set()
@@ -1282,115 +1417,195 @@ async def maintenance_duration_handler(message: types.Message, state: FSMContext
     data = await state.get_data()
     reason = data['reason']
     until = (datetime.now() + delta).strftime("%Y-%m-%d %H:%M:%S")
-    set_maintenance(True, reason, until)
-    # Уведомляем всех пользователей
-    users = get_all_users()
-    sent = 0
-    for (uid,) in users:
-        try:
-            await message.bot.send_message(uid, f"🛠 Ведутся техработы до {until}\nПричина: {reason}")
-            sent += 1
-            await asyncio.sleep(0.05)
-        except:
-            pass
-    await message.answer(f"✅ Режим техработ включён. Уведомлено {sent} пользователей.")
-    add_admin_log(message.from_user.id, "maintenance_on", f"Причина: {reason}, до {until}")
+    await set_maintenance(True, reason, until)
     await state.finish()
+    job_id, total = await notify_everyone(
+        "maintenance_on", f"🛠 Ведутся техработы до {until}\nПричина: {reason}",
+        message.from_user.id, message.chat.id
+    )
+    await message.answer(
+        f"✅ Режим техработ включён.\n"
+        f"Уведомление {total} пользователям поставлено в очередь (задание #{job_id}).\n"
+        f"Прогресс: /notify_status {job_id}"
+    )
+    await add_admin_log(message.from_user.id, "maintenance_on", f"Причина: {reason}, до {until}")
 
 async def maintenance_off_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
-    set_maintenance(False)
-    users = get_all_users()
-    sent = 0
-    for (uid,) in users:
-        try:
-            await message.bot.send_message(uid, "✅ Техработы завершены. Бот снова доступен.")
-            sent += 1
-            await asyncio.sleep(0.05)
-        except:
-            pass
-    await message.answer(f"✅ Режим техработ выключен. Уведомлено {sent} пользователей.")
-    add_admin_log(message.from_user.id, "maintenance_off", "")
+    await set_maintenance(False)
+    job_id, total = await notify_everyone(
+        "maintenance_off", "✅ Техработы завершены. Бот снова доступен.",
+        message.from_user.id, message.chat.id
+    )
+    await message.answer(
+        f"✅ Режим техработ выключен.\n"
+        f"Уведомление {total} пользователям поставлено в очередь (задание #{job_id}).\n"
+        f"Прогресс: /notify_status {job_id}"
+    )
+    await add_admin_log(message.from_user.id, "maintenance_off", "")
+
+async def notify_status_cmd(message: types.Message):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role not in ["owner", "admin"]:
+        return
+    args = message.get_args().strip()
+    if not args.isdigit():
+        await message.answer("Использование: /notify_status id")
+        return
+    status = await get_job_status_text(int(args))
+    await message.answer(status or "❌ Задание не найдено")
 
 # ===== ЛЕНТА ПРИЗНАНИЙ =====
 
-async def feed_cmd(message: types.Message, page=1):
-    per_page = 5
-    offset = (page - 1) * per_page
-    confessions = db_fetch("SELECT id, from_user, to_user, text, created_at FROM confessions ORDER BY id DESC LIMIT ? OFFSET ?", (per_page, offset))
-    total = db_fetch_one("SELECT COUNT(*) FROM confessions")[0]
-    total_pages = (total + per_page - 1) // per_page
+FEED_MEDIA_TYPES = ("photo", "video", "voice", "sticker")
+FEED_USAGE = (
+    "Использование: /feed [from=ID] [to=ID] [vip] [media=photo|video|voice|sticker] "
+    "[since=ГГГГ-ММ-ДД] [until=ГГГГ-ММ-ДД]"
+)
+
+def _parse_feed_args(args: str) -> dict:
+    filters = {}
+    for part in args.split():
+        key, _, value = part.partition("=")
+        key = key.lower()
+        if key == "vip" and not value:
+            filters["vip"] = True
+        elif key in ("from", "to") and value.isdigit():
+            filters[key] = int(value)
+        elif key == "media" and value in FEED_MEDIA_TYPES:
+            filters["media"] = value
+        elif key in ("since", "until"):
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Дата должна быть в формате ГГГГ-ММ-ДД: {part}")
+            filters[key] = value
+        else:
+            raise ValueError(f"Непонятный параметр: {part}")
+    return filters
+
+async def _show_feed(message: types.Message, filters: dict, page: int = 1,
+                     before_id: int = None, after_id: int = None, edit: bool = False):
+    confessions, has_more = await get_confession_feed(filters, before_id, after_id, FEED_PAGE_SIZE)
     if not confessions:
         await message.answer("Признаний нет.")
         return
-    text = f"📜 Лента признаний (стр. {page}/{total_pages})\n\n"
+    total = await count_confession_feed(filters)
+    total_pages = max((total + FEED_PAGE_SIZE - 1) // FEED_PAGE_SIZE, page)
+    has_prev = has_more if after_id is not None else page > 1
+    has_next = True if after_id is not None else has_more
+    users = await get_users_by_ids([user_id for c in confessions for user_id in (c[1], c[2])])
+    text = f"📜 Лента признаний (стр. {page}/{total_pages})\n"
+    if filters:
+        text += "Фильтр: " + " ".join(key if value is True else f"{key}={value}" for key, value in filters.items()) + "\n"
+    text += "\n"
     for c in confessions:
-        from_user = get_user(c[1])
-        to_user = get_user(c[2])
-        from_name = format_user_name(from_user)
-        to_name = format_user_name(to_user)
+        from_name = format_user_name(users.get(c[1]))
+        to_name = format_user_name(users.get(c[2]))
         short_text = (c[3][:50] + '...') if c[3] and len(c[3]) > 50 else c[3]
         text += f"#{c[0]} {from_name} → {to_name}\n{short_text}\n\n"
-    await message.answer(text, reply_markup=get_feed_keyboard(page, total_pages))
+    keyboard = get_feed_keyboard(page, total_pages, confessions[0][0], confessions[-1][0], has_prev, has_next)
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
 
-async def feed_page_callback(call: types.CallbackQuery):
-    page = int(call.data.split('_')[2])
-    await feed_cmd(call.message, page)
+async def feed_cmd(message: types.Message, state: FSMContext):
+    user_role = await get_current_user_role(message.from_user.id)
+    if user_role != "owner":
+        return
+    try:
+        filters = _parse_feed_args(message.get_args() or "")
+    except ValueError as e:
+        await message.answer(f"❌ {e}\n\n{FEED_USAGE}")
+        return
+    await state.update_data(feed_filters=filters)
+    await _show_feed(message, filters)
+
+async def feed_page_callback(call: types.CallbackQuery, state: FSMContext):
+    user_role = await get_current_user_role(call.from_user.id)
+    if user_role != "owner":
+        await call.answer("Доступ запрещен", show_alert=True)
+        return
+    _, direction, cursor, page = call.data.split('_')
+    filters = (await state.get_data()).get("feed_filters") or {}
+    if direction == "next":
+        await _show_feed(call.message, filters, int(page), before_id=int(cursor), edit=True)
+    else:
+        await _show_feed(call.message, filters, int(page), after_id=int(cursor), edit=True)
+    await call.answer()
 
 # ===== ЭКСПОРТ =====
 
 async def export_cmd(message: types.Message):
-    user_role = get_user_role(message.from_user.id)
+    user_role = await get_current_user_role(message.from_user.id)
     if user_role != "owner":
         return
-    table = message.get_args().strip().lower()
-    if table not in ['users', 'confessions', 'achievements']:
-        await message.answer("Доступные таблицы: users, confessions, achievements")
+    try:
+        options = parse_export_args(message.get_args())
+    except ValueError as e:
+        await message.answer(
+            f"❌ {e}\n\nИспользование: /export таблица [csv|ndjson] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [cols=id,text]"
+        )
         return
-    if table == 'users':
-        data = db_fetch("SELECT id, username, full_name, banned, vip_until, created_at FROM users")
-        headers = ['id', 'username', 'full_name', 'banned', 'vip_until', 'created_at']
-    elif table == 'confessions':
-        data = db_fetch("SELECT id, from_user, to_user, text, created_at FROM confessions")
-        headers = ['id', 'from_user', 'to_user', 'text', 'created_at']
-    else:
-        data = db_fetch("SELECT id, name, description, created_at FROM achievements")
-        headers = ['id', 'name', 'description', 'created_at']
-    csv_data = generate_csv(data, headers)
-    await message.answer_document(types.InputFile.from_bytes(csv_data, filename=f"{table}.csv"))
+    table, fmt = options["table"], options["fmt"]
+    await message.answer(f"📤 Выгружаю {table}...")
+    path = None
+    try:
+        path, count = await export_table(
+            table, fmt, options["columns"], options["date_from"], options["date_to"]
+        )
+        size = os.path.getsize(path)
+        if size > EXPORT_MAX_UPLOAD:
+            await message.answer(
+                f"❌ Файл слишком большой для Telegram ({size / 1024 / 1024:.1f} МБ). "
+                f"Сузьте период (from=/to=) или выберите меньше столбцов (cols=)."
+            )
+            return
+        await message.answer_document(
+            types.InputFile(path, filename=f"{table}.{fmt}.gz"),
+            caption=f"📤 {table}: {count} строк"
+        )
+        await add_admin_log(message.from_user.id, "export", f"{table} ({count} строк)")
+    except Exception as e:
+        logger.error(f"Ошибка экспорта {table}: {e}")
+        await message.answer(f"❌ Ошибка экспорта: {e}")
+    finally:
+        if path:
+            os.remove(path)
 
 # ===== УПРАВЛЕНИЕ ИВЕНТАМИ =====
 
 async def whois_on_cmd(message: types.Message):
     if message.from_user.id not in OWNER:
         return
-    set_admin_settings("whois_enabled", "1")
+    await set_admin_settings("whois_enabled", "1")
     await message.answer("✅ Режим 'Кто я?' включён.")
 
 async def whois_off_cmd(message: types.Message):
     if message.from_user.id not in OWNER:
         return
-    set_admin_settings("whois_enabled", "0")
+    await set_admin_settings("whois_enabled", "0")
     await message.answer("✅ Режим 'Кто я?' выключён.")
 
 async def battle_on_cmd(message: types.Message):
     if message.from_user.id not in OWNER:
         return
-    set_admin_settings("battle_enabled", "1")
+    await set_admin_settings("battle_enabled", "1")
     await message.answer("✅ Анонимный батл запущен.")
 
 async def battle_off_cmd(message: types.Message):
     if message.from_user.id not in OWNER:
         return
-    set_admin_settings("battle_enabled", "0")
+    await set_admin_settings("battle_enabled", "0")
     await message.answer("✅ Анонимный батл остановлен.")
 
 async def battle_clear_cmd(message: types.Message):
     if message.from_user.id not in OWNER:
         return
-    clear_battle_participants()
+    await clear_battle_participants()
     await message.answer("✅ Список участников батла очищен.")
 
 # ===== РЕГИСТРАЦИЯ =====
@@ -1398,6 +1613,7 @@ async def battle_clear_cmd(message: types.Message):
 def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(cmd_admin, commands=['admin', 'admin_panel'])
     dp.register_message_handler(stat_cmd, commands=['stat'])
+    dp.register_message_handler(chart_cmd, commands=['chart'])
     dp.register_message_handler(find_user_cmd, commands=['find'])
     dp.register_message_handler(ban_cmd, commands=['ban'])
     dp.register_message_handler(unban_cmd, commands=['unban'])
@@ -1419,8 +1635,11 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(promo_activations_cmd, commands=['promo_activations'])
     dp.register_message_handler(set_cmd, commands=['set'])
     dp.register_message_handler(backup_cmd, commands=['backup'])
+    dp.register_message_handler(restore_cmd, commands=['restore'])
     dp.register_message_handler(logs_cmd, commands=['logs'])
     dp.register_message_handler(cleanup_cmd, commands=['cleanup'])
+    dp.register_message_handler(vacuum_cmd, commands=['vacuum'])
+    dp.register_message_handler(rebuild_stats_cmd, commands=['rebuild_stats'])
     dp.register_message_handler(moderate_cmd, commands=['moderate'])
     dp.register_message_handler(broadcast_all_cmd, commands=['broadcast_all'])
     dp.register_message_handler(broadcast_vip_cmd, commands=['broadcast_vip'])
@@ -1428,6 +1647,8 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(broadcast_active_cmd, commands=['broadcast_active'])
     dp.register_message_handler(broadcast_inactive_cmd, commands=['broadcast_inactive'])
     dp.register_message_handler(broadcast_filter_cmd, commands=['broadcast_filter'])
+    dp.register_message_handler(broadcast_status_cmd, commands=['broadcast_status'])
+    dp.register_message_handler(broadcast_cancel_cmd, commands=['broadcast_cancel'])
     dp.register_message_handler(add_role_cmd, commands=['add'])
     dp.register_message_handler(del_role_cmd, commands=['del'])
     dp.register_message_handler(create_achievement_cmd, commands=['create_ach'])
@@ -1437,6 +1658,7 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(ach_list_cmd, commands=['ach_list'])
     dp.register_message_handler(maintenance_on_cmd, commands=['maintenance_on'])
     dp.register_message_handler(maintenance_off_cmd, commands=['maintenance_off'])
+    dp.register_message_handler(notify_status_cmd, commands=['notify_status'])
     dp.register_message_handler(export_cmd, commands=['export'])
     dp.register_message_handler(feed_cmd, commands=['feed'])
     dp.register_message_handler(whois_on_cmd, commands=['whois_on'])
@@ -1473,4 +1695,4 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_callback_query_handler(handle_banuser_callback, lambda c: c.data.startswith('banuser_'))
     dp.register_callback_query_handler(handle_ignore_callback, lambda c: c.data.startswith('ignore_'))
     dp.register_callback_query_handler(admin_delete_conf_callback, lambda c: c.data.startswith('admin_delete_conf_'))
-    dp.register_callback_query_handler(feed_page_callback, lambda c: c.data.startswith('feed_page_'))
\ No newline at end of file
+    dp.register_callback_query_handler(feed_page_callback, lambda c: c.data.startswith(('feed_next_', 'feed_prev_')))
\ No newline at end of file
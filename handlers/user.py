@@ -1,5 +1,4 @@
 import logging
-from datetime import datetime
 
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
@@ -10,29 +9,33 @@ from config import (
     CHANNEL_ID, REPORT_CHAT_ID, BASE_EMOJIS, VIP_EMOJIS,
     NOTIFY_REPORT
 )
-from database import (
-    create_user, get_user, is_vip, is_banned, get_user_stats, get_user_role,
-    get_top_users, get_user_by_username, update_user_activity, add_vip_days,
+from async_db import (
+    create_user, get_user, get_user_stats,
+    get_top_users, add_vip_days,
     activate_promo_code, create_confession, get_confession, update_confession_message_id,
-    create_report, get_confessions_by_user, db_exec, db_fetch_one,
-    get_user_achievements, award_achievement, get_all_achievements,
-    check_text_blacklist, add_warn,
+    create_report, update_reveal_status, db_exec,
+    get_user_achievements,
+    check_text_blacklist,
     # whois
     create_whois_game, get_whois_game, get_whois_game_by_creator,
-    get_whois_game_by_opponent, set_whois_opponent, increment_questions_asked,
+    set_whois_opponent, increment_questions_asked,
     complete_whois_game, is_whois_enabled,
     # battle
     add_battle_participant, remove_battle_participant, get_battle_participants,
     is_battle_enabled,
     # admin_logs
-    add_admin_log, get_all_admins
+    get_all_admins
 )
 from utils import (
     check_subscription, format_time_left, format_user_name,
-    check_ban_decorator, html_escape
+    check_ban_decorator, html_escape,
+    get_current_user_context, update_current_user_context
 )
+from notifier import notify_many
+from links import ref_link, whois_link
+from subscriptions import subscription_cache, is_channel
 from keyboards import (
-    get_subscription_keyboard, get_main_menu_keyboard, get_profile_keyboard,
+    get_main_menu_keyboard, get_profile_keyboard,
     get_emoji_keyboard, get_vip_menu_keyboard, get_back_keyboard,
     get_cancel_keyboard, get_confession_keyboard, get_skip_media_keyboard,
     get_confirmation_keyboard, get_reveal_request_keyboard,
@@ -59,6 +62,8 @@ class WhoIsGuessForm(StatesGroup):
 
 # ==================== Вспомогательные функции ====================
 
+TOP_PERIOD_TITLES = {"day": " за сутки", "week": " за неделю"}
+
 async def require_sub(message: types.Message):
     kb = InlineKeyboardMarkup()
     kb.add(InlineKeyboardButton("📢 Подписаться", url=f"https://t.me/{CHANNEL_ID.replace('@','')}"))
@@ -71,7 +76,9 @@ async def require_sub(message: types.Message):
 @check_ban_decorator
 async def cmd_start(message: types.Message, state: FSMContext):
     args = message.get_args()
-    create_user(message.from_user.id, message.from_user.username, message.from_user.full_name)
+    user_ctx = await get_current_user_context(message.from_user.id)
+    if not user_ctx.exists:
+        await create_user(message.from_user.id, message.from_user.username, message.from_user.full_name)
     if not await check_subscription(message.from_user.id, message.bot):
         await require_sub(message)
         return
@@ -83,7 +90,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
                     await message.answer("😅 Нельзя отправлять признания самому себе.")
                     return
                 await state.update_data(target_id=target_id)
-                if is_vip(message.from_user.id):
+                if user_ctx.is_vip:
                     await ConfessionForm.waiting_for_text.set()
                     await message.answer(
                         "✍️ Напиши своё анонимное признание для этого человека.\n\n"
@@ -104,7 +111,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
             elif args.startswith("whois_"):
                 # Новая логика whois
                 game_id = int(args.split("_")[1])
-                game = get_whois_game(game_id)
+                game = await get_whois_game(game_id)
                 if not game:
                     await message.answer("❌ Игра не найдена.")
                     return
@@ -114,7 +121,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
                 if message.from_user.id == game[1]:  # creator_id
                     await message.answer("❌ Вы не можете играть сами с собой.")
                     return
-                set_whois_opponent(game_id, message.from_user.id)
+                await set_whois_opponent(game_id, message.from_user.id)
                 creator_id = game[1]
                 try:
                     await message.bot.send_message(
@@ -138,10 +145,10 @@ async def cmd_start(message: types.Message, state: FSMContext):
             logger.error(f"Ошибка в start args: {e}")
             await message.answer("❌ Неверная ссылка.")
     else:
-        link = f"https://t.me/{(await message.bot.get_me()).username}?start=ref_{message.from_user.id}"
-        user_vip = is_vip(message.from_user.id)
-        whois_enabled = is_whois_enabled()
-        battle_enabled = is_battle_enabled()
+        link = ref_link(message.from_user.id)
+        user_vip = user_ctx.is_vip
+        whois_enabled = await is_whois_enabled()
+        battle_enabled = await is_battle_enabled()
         welcome_text = (
             f"👋 Привет!\n\n"
             f"Вот твоя уникальная ссылка для признаний:\n\n"
@@ -158,24 +165,21 @@ async def cmd_start(message: types.Message, state: FSMContext):
 
 @check_ban_decorator
 async def cmd_profile(message: types.Message):
-    # Создаём пользователя, если его нет
-    create_user(message.from_user.id, message.from_user.username, message.from_user.full_name)
-
     user_id = message.from_user.id
-    user = get_user(user_id)
-    if not user:
-        await message.answer("❌ Пользователь не найден.")
-        return
-    stats = get_user_stats(user_id)
-    user_vip = is_vip(user_id)
-    emoji = user[6] if user[6] else "💍"
+    user_ctx = await get_current_user_context(user_id)
+    # Создаём пользователя, если его нет
+    if not user_ctx.exists:
+        await create_user(user_id, message.from_user.username, message.from_user.full_name)
+    stats = await get_user_stats(user_id)
+    user_vip = user_ctx.is_vip
+    emoji = user_ctx.emoji or "💍"
     profile_text = (
         f"👤 <b>Профиль</b>\n\n"
         f"🆔 ID: {user_id}\n"
         f"👁️‍🗨️ Эмодзи: {emoji}\n"
     )
     if user_vip:
-        vip_until = format_time_left(user[5])
+        vip_until = format_time_left(user_ctx.vip_until)
         profile_text += f"⭐ VIP до: {vip_until}\n\n"
     else:
         profile_text += f"❌ Нет VIP\n\n"
@@ -185,27 +189,27 @@ async def cmd_profile(message: types.Message):
         f"📤 Отправлено признаний: {stats['sent']}\n"
         f"🚩 Подано жалоб: {stats['reports']}\n"
     )
-    user_role = get_user_role(user_id)
-    if user_role:
-        profile_text += f"\n👮 <b>Статус: {user_role.upper()}</b>"
+    if user_ctx.role:
+        profile_text += f"\n👮 <b>Статус: {user_ctx.role.upper()}</b>"
     await message.answer(profile_text, reply_markup=get_profile_keyboard())
 
 
 @check_ban_decorator
 async def cmd_top(message: types.Message):
-    top_users = get_top_users(10)
+    # /top day или /top week — топ за период из rating_cache
+    period = (message.get_args() or "").strip().lower()
+    if period not in TOP_PERIOD_TITLES:
+        period = "all"
+    top_users = await get_top_users(10, period)
     if not top_users:
         await message.answer("🏆 Топ пользователей пока пуст.")
         return
-    text = "🏆 <b>Топ пользователей по полученным признаниям:</b>\n\n"
+    text = f"🏆 <b>Топ пользователей по полученным признаниям{TOP_PERIOD_TITLES.get(period, '')}:</b>\n\n"
     for i, user in enumerate(top_users, 1):
-        user_id, username, count = user
+        user_id, username, count, emoji, user_role = user
         display_name = f"@{username}" if username else f"User {user_id}"
-        user_data = get_user(user_id)
-        if user_data and user_data[6]:
-            emoji = user_data[6]
+        if emoji:
             display_name = f"{emoji} {display_name}"
-        user_role = get_user_role(user_id)
         if user_role:
             display_name += " 👮"
         text += f"{i}. {display_name} - {count} признаний\n"
@@ -262,12 +266,15 @@ async def process_confession_text(message: types.Message, state: FSMContext):
     target_id = data.get("target_id")
     text = message.text.strip()
     # Проверка на чёрный список
-    if check_text_blacklist(text):
+    banned_words = await check_text_blacklist(text)
+    if banned_words:
+        logger.info(f"Признание от {message.from_user.id} отклонено, запрещённые слова: {banned_words}")
         await message.answer("❌ Ваш текст содержит запрещённые слова.")
         return
-    confession_id = create_confession(message.from_user.id, target_id, text)
+    user_vip = (await get_current_user_context(message.from_user.id)).is_vip
+    confession_id = await create_confession(message.from_user.id, target_id, text, user_vip)
     await state.update_data(confession_id=confession_id, text=text)
-    if is_vip(message.from_user.id):
+    if user_vip:
         await ConfessionForm.waiting_for_media.set()
         await message.answer(
             "✅ Текст сохранен!\n\n"
@@ -293,7 +300,7 @@ async def send_confession_final(message: types.Message, state: FSMContext):
             await message.answer("❌ Ошибка: данные не найдены.")
             await state.finish()
             return
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         is_vip_sender = confession[8] if confession else 0
         logger.info(f"Отправка обычного признания #{confession_id}: от {message.from_user.id} к {target_id}")
         sent = await message.bot.send_message(
@@ -301,7 +308,7 @@ async def send_confession_final(message: types.Message, state: FSMContext):
             f"📩 Вам пришло новое анонимное признание:\n\n{text}",
             reply_markup=get_confession_keyboard(confession_id, is_vip_sender)
         )
-        update_confession_message_id(confession_id, sent.message_id)
+        await update_confession_message_id(confession_id, sent.message_id)
         logger.info(f"Обычное признание #{confession_id} отправлено успешно")
         await message.answer("✅ Твоё признание отправлено!")
     except Exception as e:
@@ -382,7 +389,7 @@ async def skip_media(call: types.CallbackQuery, state: FSMContext):
 async def send_confirmation(call: types.CallbackQuery, state: FSMContext):
     try:
         confession_id = int(call.data.split('_')[2])
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         if not confession:
             await call.answer("❌ Ошибка: признание не найдено", show_alert=True)
             return
@@ -435,7 +442,7 @@ async def send_confirmation(call: types.CallbackQuery, state: FSMContext):
                 reply_markup=kb
             )
         if sent_message:
-            update_confession_message_id(confession_id, sent_message.message_id)
+            await update_confession_message_id(confession_id, sent_message.message_id)
         await call.message.edit_text("✅ Твоё признание отправлено!")
         await state.finish()
         await call.answer()
@@ -449,34 +456,36 @@ async def send_confirmation(call: types.CallbackQuery, state: FSMContext):
 
 @check_ban_decorator
 async def check_sub_callback(call: types.CallbackQuery):
-    is_subscribed = await check_subscription(call.from_user.id, call.bot)
+    is_subscribed = await check_subscription(call.from_user.id, call.bot, recheck_negative=True)
     if is_subscribed:
-        create_user(call.from_user.id, call.from_user.username, call.from_user.full_name)
+        await create_user(call.from_user.id, call.from_user.username, call.from_user.full_name)
         await call.message.edit_text("✅ Отлично! Ты подписался.\nТеперь можешь пользоваться ботом.")
     else:
         await call.answer("❌ Ты всё ещё не подписан.", show_alert=True)
 
 
+async def channel_member_handler(update: types.ChatMemberUpdated):
+    """Подписка или отписка от канала (приходит, если бот — админ канала)"""
+    subscription_cache.update(update.new_chat_member.user.id, update.new_chat_member.status)
+
+
 @check_ban_decorator
 async def profile_callback(call: types.CallbackQuery):
-    # Создаём пользователя, если его нет
-    create_user(call.from_user.id, call.from_user.username, call.from_user.full_name)
-
     user_id = call.from_user.id
-    user = get_user(user_id)
-    if not user:
-        await call.answer("❌ Пользователь не найден.", show_alert=True)
-        return
-    stats = get_user_stats(user_id)
-    user_vip = is_vip(user_id)
-    emoji = user[6] if user[6] else "💍"
+    user_ctx = await get_current_user_context(user_id)
+    # Создаём пользователя, если его нет
+    if not user_ctx.exists:
+        await create_user(user_id, call.from_user.username, call.from_user.full_name)
+    stats = await get_user_stats(user_id)
+    user_vip = user_ctx.is_vip
+    emoji = user_ctx.emoji or "💍"
     profile_text = (
         f"👤 <b>Профиль</b>\n\n"
         f"🆔 ID: {user_id}\n"
         f"👁️‍🗨️ Эмодзи: {emoji}\n"
     )
     if user_vip:
-        vip_until = format_time_left(user[5])
+        vip_until = format_time_left(user_ctx.vip_until)
         profile_text += f"⭐ VIP срок: {vip_until}\n\n"
     else:
         profile_text += f"❌ Нет VIP\n\n"
@@ -486,9 +495,8 @@ async def profile_callback(call: types.CallbackQuery):
         f"📤 Отправлено признаний: {stats['sent']}\n"
         f"🚩 Подано жалоб: {stats['reports']}\n"
     )
-    user_role = get_user_role(user_id)
-    if user_role:
-        profile_text += f"\n👮 <b>Статус: {user_role.upper()}</b>"
+    if user_ctx.role:
+        profile_text += f"\n👮 <b>Статус: {user_ctx.role.upper()}</b>"
     await call.message.edit_text(profile_text, reply_markup=get_profile_keyboard())
     await call.answer()
 
@@ -505,11 +513,10 @@ async def promo_callback(call: types.CallbackQuery):
 
 @check_ban_decorator
 async def vip_menu_callback(call: types.CallbackQuery):
-    user_id = call.from_user.id
-    user_vip = is_vip(user_id)
+    user_ctx = await get_current_user_context(call.from_user.id)
+    user_vip = user_ctx.is_vip
     if user_vip:
-        user = get_user(user_id)
-        vip_until = format_time_left(user[5])
+        vip_until = format_time_left(user_ctx.vip_until)
         text = (
             f"⭐ <b>VIP Статус</b>\n\n"
             f"Ваш VIP действует до: {vip_until}\n\n"
@@ -565,7 +572,7 @@ async def vip_info_callback(call: types.CallbackQuery):
 @check_ban_decorator
 async def change_emoji_callback(call: types.CallbackQuery):
     user_id = call.from_user.id
-    user_vip = is_vip(user_id)
+    user_vip = (await get_current_user_context(user_id)).is_vip
     await call.message.edit_text(
         "Выбери эмодзи для профиля:",
         reply_markup=get_emoji_keyboard(user_vip)
@@ -576,7 +583,7 @@ async def change_emoji_callback(call: types.CallbackQuery):
 async def select_emoji_callback(call: types.CallbackQuery):
     user_id = call.from_user.id
     emoji = call.data.split('_')[1]
-    user_vip = is_vip(user_id)
+    user_vip = (await get_current_user_context(user_id)).is_vip
     if emoji.startswith('locked'):
         actual_emoji = emoji.replace('locked_', '')
         if actual_emoji in VIP_EMOJIS:
@@ -590,7 +597,8 @@ async def select_emoji_callback(call: types.CallbackQuery):
     if emoji not in BASE_EMOJIS and emoji not in VIP_EMOJIS:
         await call.answer("❌ Неизвестный эмодзи", show_alert=True)
         return
-    db_exec("UPDATE users SET emoji = ? WHERE id = ?", (emoji, user_id))
+    await db_exec("UPDATE users SET emoji = ? WHERE id = ?", (emoji, user_id))
+    update_current_user_context(emoji=emoji)
     await call.answer(f"✅ Эмодзи изменен на {emoji}")
     await profile_callback(call)
 
@@ -603,10 +611,10 @@ async def cancel_emoji_callback(call: types.CallbackQuery):
 @check_ban_decorator
 async def back_to_menu_callback(call: types.CallbackQuery):
     user_id = call.from_user.id
-    user_vip = is_vip(user_id)
-    whois_enabled = is_whois_enabled()
-    battle_enabled = is_battle_enabled()
-    link = f"https://t.me/{(await call.bot.get_me()).username}?start=ref_{user_id}"
+    user_vip = (await get_current_user_context(user_id)).is_vip
+    whois_enabled = await is_whois_enabled()
+    battle_enabled = await is_battle_enabled()
+    link = ref_link(user_id)
     username = call.from_user.username
     full_name = call.from_user.full_name
     display_name = f"@{username}" if username else full_name
@@ -629,7 +637,7 @@ async def back_to_menu_callback(call: types.CallbackQuery):
 async def reveal_request_callback(call: types.CallbackQuery):
     try:
         confession_id = int(call.data.replace("reveal_", ""))
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         if not confession:
             await call.answer("Сообщение не найдено", show_alert=True)
             return
@@ -637,7 +645,7 @@ async def reveal_request_callback(call: types.CallbackQuery):
         if status != 0:
             await call.answer("Запрос уже сделан.", show_alert=True)
             return
-        update_reveal_status(confession_id, 1)
+        await update_reveal_status(confession_id, 1)
         kb = get_reveal_request_keyboard(confession_id)
         try:
             await call.bot.send_message(
@@ -659,7 +667,7 @@ async def reveal_request_callback(call: types.CallbackQuery):
 async def reveal_allow_callback(call: types.CallbackQuery):
     try:
         confession_id = int(call.data.replace("reveal_allow_", ""))
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         if not confession:
             await call.answer("Данные не найдены", show_alert=True)
             return
@@ -667,7 +675,7 @@ async def reveal_allow_callback(call: types.CallbackQuery):
         if call.from_user.id != from_user:
             await call.answer("Это не ваше признание.", show_alert=True)
             return
-        update_reveal_status(confession_id, 2)
+        await update_reveal_status(confession_id, 2)
         username = call.from_user.username
         if username:
             await call.bot.send_message(to_user, f"✅ Автор согласился раскрыть себя: @{username}")
@@ -684,7 +692,7 @@ async def reveal_allow_callback(call: types.CallbackQuery):
 async def reveal_deny_callback(call: types.CallbackQuery):
     try:
         confession_id = int(call.data.replace("reveal_deny_", ""))
-        confession = get_confession(confession_id)
+        confession = await get_confession(confession_id)
         if not confession:
             await call.answer("Данные не найдены", show_alert=True)
             return
@@ -692,7 +700,7 @@ async def reveal_deny_callback(call: types.CallbackQuery):
         if call.from_user.id != from_user:
             await call.answer("Это не ваше признание.", show_alert=True)
             return
-        update_reveal_status(confession_id, 3)
+        await update_reveal_status(confession_id, 3)
         await call.bot.send_message(to_user, "❌ Автор отказался раскрывать себя.")
         await call.message.edit_text("❌ Вы отказались раскрывать себя.", reply_markup=None)
         await call.answer("Вы отказались раскрывать себя.", show_alert=True)
@@ -705,12 +713,12 @@ async def reveal_deny_callback(call: types.CallbackQuery):
 async def report_callback(call: types.CallbackQuery):
     confession_id = int(call.data.split("_")[1])
     reporter_id = call.from_user.id
-    confession = get_confession(confession_id)
+    confession = await get_confession(confession_id)
     if not confession:
         await call.answer("Ошибка: сообщение не найдено", show_alert=True)
         return
     from_user, to_user, text = confession[1], confession[2], confession[4]
-    report_id = create_report(confession_id, reporter_id)
+    report_id = await create_report(confession_id, reporter_id)
     kb = InlineKeyboardMarkup()
     kb.add(
         InlineKeyboardButton("🚫 Забанить автора", callback_data=f"banuser_{from_user}_{report_id}"),
@@ -730,13 +738,11 @@ async def report_callback(call: types.CallbackQuery):
         )
         await call.answer("Жалоба отправлена модераторам.", show_alert=True)
         if NOTIFY_REPORT:
-            admins = get_all_admins()
-            for admin_id, role in admins:
-                if role in ["owner", "admin", "moderator"]:
-                    try:
-                        await call.bot.send_message(admin_id, f"🚩 Новая жалоба #{report_id}")
-                    except:
-                        pass
+            admins = await get_all_admins()
+            await notify_many(
+                [admin_id for admin_id, role in admins if role in ["owner", "admin", "moderator"]],
+                "report", f"🚩 Новая жалоба #{report_id}"
+            )
     except Exception as e:
         logger.error(f"Ошибка отправки жалобы: {e}")
         await call.answer("Ошибка при отправке жалобы.", show_alert=True)
@@ -750,9 +756,9 @@ async def vip_sender_info_callback(call: types.CallbackQuery):
 @check_ban_decorator
 async def cancel_action_callback(call: types.CallbackQuery, state: FSMContext):
     await state.finish()
-    user_vip = is_vip(call.from_user.id)
-    whois_enabled = is_whois_enabled()
-    battle_enabled = is_battle_enabled()
+    user_vip = (await get_current_user_context(call.from_user.id)).is_vip
+    whois_enabled = await is_whois_enabled()
+    battle_enabled = await is_battle_enabled()
     await call.message.edit_text(
         "❌ Действие отменено.",
         reply_markup=get_main_menu_keyboard(user_vip, whois_enabled, battle_enabled)
@@ -767,9 +773,9 @@ async def process_promo_code(message: types.Message, state: FSMContext):
     if not code:
         await message.answer("❌ Промокод не может быть пустым.")
         return
-    vip_days = activate_promo_code(message.from_user.id, code)
+    vip_days = await activate_promo_code(message.from_user.id, code)
     if vip_days:
-        add_vip_days(message.from_user.id, vip_days)
+        await add_vip_days(message.from_user.id, vip_days)
         await message.answer(
             f"✅ Промокод активирован!\n"
             f"⭐ VIP подписка продлена на {vip_days} дней."
@@ -782,9 +788,9 @@ async def process_promo_code(message: types.Message, state: FSMContext):
 @check_ban_decorator
 async def cancel_promo(message: types.Message, state: FSMContext):
     await state.finish()
-    user_vip = is_vip(message.from_user.id)
-    whois_enabled = is_whois_enabled()
-    battle_enabled = is_battle_enabled()
+    user_vip = (await get_current_user_context(message.from_user.id)).is_vip
+    whois_enabled = await is_whois_enabled()
+    battle_enabled = await is_battle_enabled()
     await message.answer(
         "❌ Активация промокода отменена.",
         reply_markup=get_main_menu_keyboard(user_vip, whois_enabled, battle_enabled)
@@ -797,8 +803,9 @@ async def cancel_promo(message: types.Message, state: FSMContext):
 async def my_achievements_callback(call: types.CallbackQuery):
     user_id = call.from_user.id
     # Создаём пользователя, если его нет (на всякий случай)
-    create_user(user_id, call.from_user.username, call.from_user.full_name)
-    achievements = get_user_achievements(user_id)
+    if not (await get_current_user_context(user_id)).exists:
+        await create_user(user_id, call.from_user.username, call.from_user.full_name)
+    achievements = await get_user_achievements(user_id)
     if not achievements:
         text = "🏅 У вас пока нет достижений."
     else:
@@ -812,7 +819,7 @@ async def my_achievements_callback(call: types.CallbackQuery):
 
 @check_ban_decorator
 async def cmd_whois_menu(message: types.Message):
-    if not is_whois_enabled():
+    if not await is_whois_enabled():
         await message.answer("🎭 Режим 'Кто я?' сейчас не активен.")
         return
     await message.answer(
@@ -825,17 +832,16 @@ async def cmd_whois_menu(message: types.Message):
 
 @check_ban_decorator
 async def whois_create_callback(call: types.CallbackQuery):
-    if not is_whois_enabled():
+    if not await is_whois_enabled():
         await call.answer("Режим не активен", show_alert=True)
         return
     user_id = call.from_user.id
-    existing = get_whois_game_by_creator(user_id, 'waiting')
+    existing = await get_whois_game_by_creator(user_id, 'waiting')
     if existing:
         await call.answer("У вас уже есть ожидающая игра.", show_alert=True)
         return
-    game_id = create_whois_game(user_id)
-    bot_username = (await call.bot.get_me()).username
-    link = f"https://t.me/{bot_username}?start=whois_{game_id}"
+    game_id = await create_whois_game(user_id)
+    link = whois_link(game_id)
     await call.message.edit_text(
         f"🎭 Ваша игра создана!\n\nСсылка для друга:\n{link}\n\n"
         f"Как только кто-то перейдёт по ней, вы получите уведомление.",
@@ -850,7 +856,7 @@ async def whois_question_cmd(message: types.Message, state: FSMContext):
     data = await state.get_data()
     game_id = data.get('whois_game_id')
     if not game_id:
-        game = get_whois_game_by_creator(user_id, 'active')
+        game = await get_whois_game_by_creator(user_id, 'active')
         if not game:
             await message.answer("❌ У вас нет активной игры.")
             return
@@ -860,7 +866,7 @@ async def whois_question_cmd(message: types.Message, state: FSMContext):
         if data.get('role') != 'creator':
             await message.answer("❌ Вы не автор этой игры.")
             return
-        game = get_whois_game(game_id)
+        game = await get_whois_game(game_id)
         if not game or game[3] != 'active':
             await message.answer("❌ Игра не активна.")
             return
@@ -870,7 +876,7 @@ async def whois_question_cmd(message: types.Message, state: FSMContext):
         return
     if game[4] >= 3:  # questions_asked
         await message.answer("❌ Вы уже задали 3 вопроса. Игра завершена.")
-        complete_whois_game(game_id, game[2])  # opponent_id
+        await complete_whois_game(game_id, game[2])  # opponent_id
         await state.finish()
         return
     opponent_id = game[2]
@@ -879,7 +885,7 @@ async def whois_question_cmd(message: types.Message, state: FSMContext):
             opponent_id,
             f"❓ Вопрос от автора: {text}\n\nОтветьте текстом."
         )
-        increment_questions_asked(game_id)
+        await increment_questions_asked(game_id)
         await message.answer("✅ Вопрос отправлен. Ожидайте ответ.")
     except Exception as e:
         logger.error(f"Не удалось отправить вопрос оппоненту {opponent_id}: {e}")
@@ -894,7 +900,7 @@ async def whois_answer_handler(message: types.Message, state: FSMContext):
         await message.answer("❌ Ошибка: игра не найдена.")
         await state.finish()
         return
-    game = get_whois_game(game_id)
+    game = await get_whois_game(game_id)
     if not game or game[3] != 'active':
         await message.answer("❌ Игра не активна.")
         await state.finish()
@@ -920,7 +926,7 @@ async def whois_guess_cmd(message: types.Message, state: FSMContext):
     data = await state.get_data()
     game_id = data.get('whois_game_id')
     if not game_id:
-        game = get_whois_game_by_creator(user_id, 'active')
+        game = await get_whois_game_by_creator(user_id, 'active')
         if not game:
             await message.answer("❌ У вас нет активной игры.")
             return
@@ -930,7 +936,7 @@ async def whois_guess_cmd(message: types.Message, state: FSMContext):
         if data.get('role') != 'creator':
             await message.answer("❌ Вы не автор этой игры.")
             return
-    game = get_whois_game(game_id)
+    game = await get_whois_game(game_id)
     if not game or game[3] != 'active':
         await message.answer("❌ Игра не активна.")
         return
@@ -939,14 +945,14 @@ async def whois_guess_cmd(message: types.Message, state: FSMContext):
         await message.answer("❌ Введите имя или username для угадывания. Пример: /угадать @username")
         return
     opponent_id = game[2]
-    opponent = get_user(opponent_id)
+    opponent = await get_user(opponent_id)
     if not opponent:
         await message.answer("❌ Ошибка: оппонент не найден.")
         return
     correct_username = opponent[1].lower() if opponent[1] else ""
     correct_name = opponent[2].lower() if opponent[2] else ""
     if guess == correct_username or guess in correct_name or guess == correct_name:
-        complete_whois_game(game_id, user_id)
+        await complete_whois_game(game_id, user_id)
         await message.answer("✅ Поздравляю! Вы угадали. Вы победили!")
         try:
             await message.bot.send_message(opponent_id, "😢 Вы проиграли. Автор угадал вашу личность.")
@@ -955,7 +961,7 @@ async def whois_guess_cmd(message: types.Message, state: FSMContext):
         await state.finish()
     else:
         if game[4] >= 3:
-            complete_whois_game(game_id, opponent_id)
+            await complete_whois_game(game_id, opponent_id)
             await message.answer("❌ Вы не угадали и исчерпали все вопросы. Вы проиграли.")
             try:
                 await message.bot.send_message(opponent_id, "🎉 Вы победили! Автор не смог угадать.")
@@ -970,10 +976,10 @@ async def whois_guess_cmd(message: types.Message, state: FSMContext):
 
 @check_ban_decorator
 async def cmd_battle_menu(message: types.Message):
-    if not is_battle_enabled():
+    if not await is_battle_enabled():
         await message.answer("⚔ Анонимный батл сейчас не активен.")
         return
-    participants = get_battle_participants()
+    participants = await get_battle_participants()
     count = len(participants)
     text = (
         f"⚔ <b>Анонимный батл</b>\n\n"
@@ -985,13 +991,13 @@ async def cmd_battle_menu(message: types.Message):
 
 @check_ban_decorator
 async def battle_join_callback(call: types.CallbackQuery):
-    if not is_battle_enabled():
+    if not await is_battle_enabled():
         await call.answer("Батл не активен", show_alert=True)
         return
     user_id = call.from_user.id
-    if add_battle_participant(user_id):
+    if await add_battle_participant(user_id):
         await call.answer("✅ Вы присоединились к батлу!", show_alert=True)
-        participants = get_battle_participants()
+        participants = await get_battle_participants()
         count = len(participants)
         await call.message.edit_text(
             f"⚔ Вы в батле! Участников: {count}",
@@ -1004,9 +1010,9 @@ async def battle_join_callback(call: types.CallbackQuery):
 @check_ban_decorator
 async def battle_leave_callback(call: types.CallbackQuery):
     user_id = call.from_user.id
-    remove_battle_participant(user_id)
+    await remove_battle_participant(user_id)
     await call.answer("❌ Вы покинули батл", show_alert=True)
-    participants = get_battle_participants()
+    participants = await get_battle_participants()
     count = len(participants)
     await call.message.edit_text(
         f"⚔ Вы покинули батл. Участников: {count}",
@@ -1016,13 +1022,13 @@ async def battle_leave_callback(call: types.CallbackQuery):
 
 @check_ban_decorator
 async def battle_stats_callback(call: types.CallbackQuery):
-    participants = get_battle_participants()
+    participants = await get_battle_participants()
     if not participants:
         await call.answer("Участников пока нет", show_alert=True)
         return
     text = "⚔ Участники батла:\n\n"
     for uid in participants:
-        user = get_user(uid)
+        user = await get_user(uid)
         name = format_user_name(user)
         text += f"• {name}\n"
     await call.message.edit_text(text, reply_markup=get_battle_menu_keyboard())
@@ -1047,6 +1053,7 @@ def register_user_handlers(dp: Dispatcher):
     dp.register_message_handler(cancel_promo, commands=['cancel'], state=PromoForm.waiting_for_code)
     dp.register_message_handler(whois_answer_handler, state=WhoIsGuessForm.waiting_for_answer, content_types=ContentType.TEXT)
 
+    dp.register_chat_member_handler(channel_member_handler, lambda u: is_channel(u.chat))
     dp.register_callback_query_handler(check_sub_callback, lambda c: c.data == 'check_sub')
     dp.register_callback_query_handler(profile_callback, lambda c: c.data == 'profile')
     dp.register_callback_query_handler(top_callback, lambda c: c.data == 'top_users')
@@ -144,14 +144,15 @@ def get_admin_main_keyboard(user_role):
     keyboard.add(InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu"))
     return keyboard
 
-def get_feed_keyboard(page: int, total_pages: int):
+def get_feed_keyboard(page: int, total_pages: int, first_id: int, last_id: int, has_prev: bool, has_next: bool):
+    # листание по курсору: id первого/последнего признания на странице
     kb = InlineKeyboardMarkup(row_width=3)
     buttons = []
-    if page > 1:
-        buttons.append(InlineKeyboardButton("◀️", callback_data=f"feed_page_{page-1}"))
+    if has_prev:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"feed_prev_{first_id}_{page-1}"))
     buttons.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="feed_current"))
-    if page < total_pages:
-        buttons.append(InlineKeyboardButton("▶️", callback_data=f"feed_page_{page+1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"feed_next_{last_id}_{page+1}"))
     kb.row(*buttons)
     kb.add(InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu"))
     return kb
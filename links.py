@@ -0,0 +1,57 @@
+"""Ссылки на бота вида t.me/<имя>?start=<параметр>.
+
+Имя бота запрашивается через get_me() один раз при запуске и затем
+обновляется раз в BOT_IDENTITY_REFRESH секунд, так что построение ссылки
+в обработчиках не ходит в сеть.
+"""
+import asyncio
+import logging
+
+from config import BOT_IDENTITY_REFRESH
+
+logger = logging.getLogger(__name__)
+
+_bot_id = None
+_bot_username = None
+
+
+async def load_bot_identity(bot):
+    """Запрашивает id и имя бота и запоминает их"""
+    global _bot_id, _bot_username
+    me = await bot.get_me()
+    if me.username != _bot_username:
+        logger.info(f"🤖 Бот @{me.username} (id {me.id})")
+    _bot_id, _bot_username = me.id, me.username
+
+
+async def bot_identity_refresher(bot):
+    while True:
+        await asyncio.sleep(BOT_IDENTITY_REFRESH)
+        try:
+            await load_bot_identity(bot)
+        except Exception as e:
+            logger.error(f"Ошибка обновления данных бота: {e}")
+
+
+def get_bot_id() -> int:
+    return _bot_id
+
+
+def get_bot_username() -> str:
+    if _bot_username is None:
+        raise RuntimeError("Данные бота ещё не загружены: load_bot_identity() вызывается в on_startup")
+    return _bot_username
+
+
+def start_link(payload: str) -> str:
+    return f"https://t.me/{get_bot_username()}?start={payload}"
+
+
+def ref_link(user_id: int) -> str:
+    """Ссылка для анонимных признаний пользователю"""
+    return start_link(f"ref_{user_id}")
+
+
+def whois_link(game_id: int) -> str:
+    """Приглашение в игру «Кто я?»"""
+    return start_link(f"whois_{game_id}")
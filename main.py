@@ -5,11 +5,19 @@ import logging
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
-from config import API_TOKEN, OWNER, LOG_PATH, BACKUP_PATH
-from database import init_db
-from middlewares import BanMiddleware, MaintenanceMiddleware, RoleMiddleware, AntiSpamMiddleware
+from config import API_TOKEN, OWNER, LOG_PATH, BACKUP_PATH, UPDATE_MODE, POLLING_SKIP_UPDATES
+import async_db
+from fsm_storage import SQLiteStorage
+from broadcast import resume_broadcasts, stop_broadcasts
+from notifier import notification_worker, notify_many
+from expiry import scheduler as expiry_scheduler
+from retention import retention_scheduler
+from backup import backup_scheduler, add_restore_hook
+from activity import activity_tracker
+from links import load_bot_identity, bot_identity_refresher
+from updates import OrderedDispatcher, update_scheduler, drain_pending_updates, start_webhook
+from middlewares import DuplicateUpdateMiddleware, RateLimitMiddleware, ActivityMiddleware, UserContextMiddleware, BanMiddleware, MaintenanceMiddleware, RoleMiddleware
 from handlers.user import register_user_handlers
 from handlers.admin import register_admin_handlers
 import utils
@@ -32,21 +40,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# chat_member не приходит без явного запроса; нужен для кеша подписки
+ALLOWED_UPDATES = types.AllowedUpdates.MESSAGE + types.AllowedUpdates.CALLBACK_QUERY + types.AllowedUpdates.CHAT_MEMBER
+
 # Планировщики
-async def auto_delete_scheduler():
-    while True:
-        await asyncio.sleep(86400)
-        from database import db_exec
-        deleted = db_exec("DELETE FROM confessions WHERE created_at < datetime('now', '-3 days')")
-        logger.info(f"🧹 Автоудаление: удалено {deleted} признаний")
+_background_tasks = []  # фоновые задачи, которые останавливаются до закрытия БД
 
 async def rating_cache_scheduler():
     while True:
+        try:
+            await async_db.refresh_rating_cache()
+        except Exception as e:
+            logger.error(f"Ошибка обновления кеша рейтинга: {e}")
         await asyncio.sleep(300)
-        pass
+
+def _register_restore_hooks(dp: Dispatcher):
+    # перед заменой базы всё из памяти записывается в неё, после — читается заново
+    add_restore_hook(before=activity_tracker.flush, after=activity_tracker.forget_saved)
+    add_restore_hook(before=dp.storage.flush, after=dp.storage.reset)
+    add_restore_hook(after=expiry_scheduler.reload)
+    add_restore_hook(before=stop_broadcasts, after=lambda: resume_broadcasts(dp.bot))
 
 async def on_startup(dp: Dispatcher):
-    init_db()
+    await async_db.init_db()
+    update_scheduler.start(dp)
+    _register_restore_hooks(dp)
+    await load_bot_identity(dp.bot)
     await dp.bot.set_my_commands([
         types.BotCommand("start", "Запустить бота"),
         types.BotCommand("profile", "Профиль"),
@@ -54,18 +73,34 @@ async def on_startup(dp: Dispatcher):
         types.BotCommand("promo", "Активировать промокод"),
         types.BotCommand("help", "Помощь"),
     ])
-    asyncio.create_task(auto_delete_scheduler())
-    asyncio.create_task(rating_cache_scheduler())
-    for owner in OWNER:
-        try:
-            await dp.bot.send_message(owner, f"✅ Бот запущен {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        except:
-            pass
+    _background_tasks.extend([
+        asyncio.create_task(retention_scheduler()),
+        asyncio.create_task(backup_scheduler()),
+        asyncio.create_task(rating_cache_scheduler()),
+        asyncio.create_task(bot_identity_refresher(dp.bot)),
+    ])
+    await resume_broadcasts(dp.bot)
+    _background_tasks.append(asyncio.create_task(notification_worker(dp.bot)))
+    expiry_scheduler.start()
+    if UPDATE_MODE == "polling" and not POLLING_SKIP_UPDATES:
+        await drain_pending_updates(dp, ALLOWED_UPDATES)
+    await notify_many(OWNER, "startup", f"✅ Бот запущен {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("🚀 Бот запущен")
 
 async def on_shutdown(dp: Dispatcher):
+    await update_scheduler.stop()
+    # Всё, что ходит в БД, останавливается до async_db.shutdown(): иначе
+    # следующий запрос упадёт на закрытом пуле потоков или закрытом соединении
+    await stop_broadcasts()
+    for task in reversed(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await expiry_scheduler.stop()
     await dp.storage.close()
     await dp.storage.wait_closed()
+    await activity_tracker.close()
+    async_db.shutdown()
     for owner in OWNER:
         try:
             await dp.bot.send_message(owner, "🛑 Бот остановлен")
@@ -75,21 +110,29 @@ async def on_shutdown(dp: Dispatcher):
 
 def main():
     bot = Bot(token=API_TOKEN, parse_mode="HTML")
-    storage = MemoryStorage()
-    dp = Dispatcher(bot, storage=storage)
+    storage = SQLiteStorage()
+    dp = OrderedDispatcher(bot, storage=storage)
 
+    dp.middleware.setup(DuplicateUpdateMiddleware())
+    dp.middleware.setup(RateLimitMiddleware())
+    dp.middleware.setup(ActivityMiddleware())
+    dp.middleware.setup(UserContextMiddleware())
     dp.middleware.setup(BanMiddleware())
     dp.middleware.setup(MaintenanceMiddleware())
     dp.middleware.setup(RoleMiddleware())
-    dp.middleware.setup(AntiSpamMiddleware())
 
     register_user_handlers(dp)
     register_admin_handlers(dp)
 
+    if UPDATE_MODE == "webhook":
+        start_webhook(dp, ALLOWED_UPDATES, on_startup, on_shutdown)
+        return
+
     from aiogram import executor
     executor.start_polling(
         dp,
-        skip_updates=True,
+        skip_updates=POLLING_SKIP_UPDATES,
+        allowed_updates=ALLOWED_UPDATES,
         on_startup=on_startup,
         on_shutdown=on_shutdown
     )
@@ -1,62 +1,157 @@
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.handler import CancelHandler
-from aiogram.types import Message, CallbackQuery
-from datetime import datetime, timedelta
-from database import is_banned, get_user_role, get_admin_settings
+from aiogram.types import Message, CallbackQuery, Update
+from async_db import get_user_context, get_admin_settings, set_user_blocked_bot
+from ratelimit import user_limiter
+from activity import activity_tracker
+from config import UPDATE_DEDUP_SIZE
 import logging
+import math
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+class DuplicateUpdateMiddleware(BaseMiddleware):
+    """Отбрасывает уже обработанные update_id: Telegram может доставить
+    обновление повторно (вебхук, смена режима получения)"""
+
+    def __init__(self, max_size: int = UPDATE_DEDUP_SIZE):
+        super().__init__()
+        self.max_size = max_size
+        self._seen = OrderedDict()
+
+    async def on_pre_process_update(self, update: Update, data: dict):
+        if update.update_id in self._seen:
+            logger.debug(f"Повторное обновление {update.update_id} пропущено")
+            raise CancelHandler()
+        self._seen[update.update_id] = None
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+class UserContextMiddleware(BaseMiddleware):
+    """Загружает UserContext одним запросом до фильтров и кладёт в data["user_ctx"].
+    Остальные middleware, check_ban_decorator и хендлеры читают его оттуда."""
+    async def on_pre_process_message(self, message: Message, data: dict):
+        data["user_ctx"] = await get_user_context(message.from_user.id)
+        if data["user_ctx"].blocked_bot and message.chat.type == "private":
+            # пользователь снова пишет боту — значит, разблокировал его
+            await set_user_blocked_bot(message.from_user.id, False)
+            data["user_ctx"] = data["user_ctx"]._replace(blocked_bot=False)
+
+    async def on_pre_process_callback_query(self, call: CallbackQuery, data: dict):
+        data["user_ctx"] = await get_user_context(call.from_user.id)
+
+class ActivityMiddleware(BaseMiddleware):
+    """Отмечает активность и актуальные имя/username пользователя (см. activity.py)"""
+    async def on_pre_process_message(self, message: Message, data: dict):
+        activity_tracker.record(message.from_user)
+
+    async def on_pre_process_callback_query(self, call: CallbackQuery, data: dict):
+        activity_tracker.record(call.from_user)
+
+async def _check_ban(data: dict) -> bool:
+    # истёкший бан не действует сразу, а снимает его планировщик сроков
+    return data["user_ctx"].is_banned
+
 class BanMiddleware(BaseMiddleware):
     async def on_process_message(self, message: Message, data: dict):
-        if is_banned(message.from_user.id):
+        if await _check_ban(data):
             await message.answer("🚫 Вы забанены и не можете использовать бота.")
             raise CancelHandler()
 
     async def on_process_callback_query(self, call: CallbackQuery, data: dict):
-        if is_banned(call.from_user.id):
+        if await _check_ban(data):
             await call.answer("🚫 Вы забанены.", show_alert=True)
             raise CancelHandler()
 
 class MaintenanceMiddleware(BaseMiddleware):
     async def on_process_message(self, message: Message, data: dict):
-        if get_admin_settings("maintenance_enabled") == "1":
-            role = get_user_role(message.from_user.id)
+        if await get_admin_settings("maintenance_enabled") == "1":
+            role = data["user_ctx"].role
             if role not in ["owner", "admin", "moderator"]:
-                reason = get_admin_settings("maintenance_reason") or "ведутся техработы"
+                reason = await get_admin_settings("maintenance_reason") or "ведутся техработы"
                 await message.answer(f"🛠 Ведутся технические работы.\nПричина: {reason}")
                 raise CancelHandler()
 
     async def on_process_callback_query(self, call: CallbackQuery, data: dict):
-        if get_admin_settings("maintenance_enabled") == "1":
-            role = get_user_role(call.from_user.id)
+        if await get_admin_settings("maintenance_enabled") == "1":
+            role = data["user_ctx"].role
             if role not in ["owner", "admin", "moderator"]:
-                reason = get_admin_settings("maintenance_reason") or "ведутся техработы"
+                reason = await get_admin_settings("maintenance_reason") or "ведутся техработы"
                 await call.answer(f"🛠 Техработы: {reason}", show_alert=True)
                 raise CancelHandler()
 
 class RoleMiddleware(BaseMiddleware):
     async def on_process_message(self, message: Message, data: dict):
-        data["user_role"] = get_user_role(message.from_user.id)
+        data["user_role"] = data["user_ctx"].role
 
     async def on_process_callback_query(self, call: CallbackQuery, data: dict):
-        data["user_role"] = get_user_role(call.from_user.id)
+        data["user_role"] = data["user_ctx"].role
 
-class AntiSpamMiddleware(BaseMiddleware):
-    def __init__(self):
-        self.user_actions = {}  # user_id -> list of timestamps
-        super().__init__()
+# Действия с отдельной квотой в RATE_LIMITS, по префиксу callback_data
+CALLBACK_ACTIONS = (
+    ("send_confession_", "confession"),
+    ("report_", "report"),
+    ("reveal_allow_", None),
+    ("reveal_deny_", None),
+    ("reveal_", "reveal"),
+)
+
+def _message_action(message: Message, data: dict):
+    if message.is_command() and message.get_command(pure=True) == "start":
+        args = message.get_args()
+        if args and (args.startswith("ref_") or args.isdigit()):
+            return "ref_link"
+    if data.get("raw_state") == "PromoForm:waiting_for_code" and not message.is_command():
+        return "promo"
+    return None
+
+def _callback_action(call: CallbackQuery):
+    for prefix, action in CALLBACK_ACTIONS:
+        if call.data and call.data.startswith(prefix):
+            return action
+    return None
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Квоты на действия пользователя (см. RATE_LIMITS в config).
+    Общая квота "any" проверяется до загрузки контекста из БД, поэтому флуд
+    отсекается дёшево; квоты отдельных действий — после фильтров хендлера."""
+
+    def _throttled(self, user_id: int, action: str) -> float:
+        wait = user_limiter.hit(user_id, action)
+        if wait:
+            logger.debug(f"Лимит {action} для {user_id}, ждать {wait:.1f} с")
+        return wait
+
+    async def _reject_message(self, message: Message, wait: float):
+        if not user_limiter.hit(message.from_user.id, "throttle_notice"):
+            await message.answer(f"⏳ Слишком часто. Попробуйте через {math.ceil(wait)} сек.")
+        raise CancelHandler()
+
+    async def _reject_callback(self, call: CallbackQuery, wait: float):
+        await call.answer(f"⏳ Слишком часто. Попробуйте через {math.ceil(wait)} сек.")
+        raise CancelHandler()
+
+    async def on_pre_process_message(self, message: Message, data: dict):
+        wait = self._throttled(message.from_user.id, "any")
+        if wait:
+            await self._reject_message(message, wait)
+
+    async def on_pre_process_callback_query(self, call: CallbackQuery, data: dict):
+        wait = self._throttled(call.from_user.id, "any")
+        if wait:
+            await self._reject_callback(call, wait)
 
     async def on_process_message(self, message: Message, data: dict):
-        if message.text and message.text.startswith("/start"):
-            args = message.get_args()
-            if args and (args.startswith("ref_") or args.isdigit()):
-                user_id = message.from_user.id
-                now = datetime.now()
-                timestamps = self.user_actions.get(user_id, [])
-                timestamps = [t for t in timestamps if (now - t).seconds < 60]
-                if len(timestamps) >= 2:
-                    await message.answer("⏳ Слишком частые отправки. Подождите минуту.")
-                    raise CancelHandler()
-                timestamps.append(now)
-                self.user_actions[user_id] = timestamps
\ No newline at end of file
+        action = _message_action(message, data)
+        if action:
+            wait = self._throttled(message.from_user.id, action)
+            if wait:
+                await self._reject_message(message, wait)
+
+    async def on_process_callback_query(self, call: CallbackQuery, data: dict):
+        action = _callback_action(call)
+        if action:
+            wait = self._throttled(call.from_user.id, action)
+            if wait:
+                await self._reject_callback(call, wait)
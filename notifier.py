@@ -0,0 +1,140 @@
+"""Очередь уведомлений.
+
+Уведомления пишутся в таблицу notifications (outbox) и доставляются
+фоновыми воркерами пачками через общий лимитер Telegram. Временные
+ошибки повторяются с нарастающей задержкой до NOTIFY_MAX_ATTEMPTS раз.
+Массовые системные сообщения (техработы и т.п.) ставятся одним заданием
+notification_jobs: администратор сразу получает id задания, а по
+завершении — итог.
+"""
+import asyncio
+import logging
+
+from aiogram import Bot
+
+from config import (
+    NOTIFY_BATCH_SIZE, NOTIFY_CONCURRENCY, NOTIFY_IDLE_DELAY, NOTIFY_WORKERS, NOTIFY_LEASE_SECONDS,
+    NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BASE_DELAY, NOTIFY_RETRY_MAX_DELAY
+)
+from async_db import (
+    add_notification, add_notifications, claim_notifications, complete_notifications,
+    reap_notification_leases, create_notification_job, get_notification_job_status, finish_notification_jobs
+)
+from broadcast import deliver, DELIVERY_SENT, DELIVERY_BLOCKED, DELIVERY_FAILED, DELIVERY_RETRY
+
+logger = logging.getLogger(__name__)
+
+_wakeup = None  # событие создаётся лениво, внутри работающего цикла событий
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+async def notify(user_id: int, type: str, message: str):
+    """Ставит одно уведомление в очередь"""
+    await add_notification(user_id, type, message)
+    _get_wakeup().set()
+
+
+async def notify_many(user_ids, type: str, message: str):
+    await add_notifications([(uid, type, message) for uid in user_ids])
+    _get_wakeup().set()
+
+
+async def notify_everyone(type: str, message: str, admin_id: int = None, chat_id: int = None) -> tuple:
+    """Системное сообщение всем пользователям. Возвращает (job_id, число получателей)."""
+    job_id, total = await create_notification_job(type, message, admin_id, chat_id)
+    _get_wakeup().set()
+    return job_id, total
+
+
+async def get_job_status_text(job_id: int):
+    status = await get_notification_job_status(job_id)
+    if not status:
+        return None
+    type, total, pending, sent, failed, finished_at = status
+    title = f"✅ Задание #{job_id} ({type}) завершено {finished_at}" if finished_at else f"📨 Задание #{job_id} ({type}) выполняется"
+    return (
+        f"{title}\n"
+        f"Всего: {total}\n"
+        f"В очереди: {pending}\n"
+        f"Доставлено: {sent}\n"
+        f"Не доставлено: {failed}"
+    )
+
+
+def _retry_delay(attempts: int) -> int:
+    return min(NOTIFY_RETRY_BASE_DELAY * 2 ** attempts, NOTIFY_RETRY_MAX_DELAY)
+
+
+async def _process_batch(bot: Bot, batch):
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+    async def send_one(user_id: int, message: str) -> str:
+        async with semaphore:
+            return await deliver(bot, user_id, message)
+
+    results = await asyncio.gather(*(send_one(user_id, message) for _, user_id, _, message, _, _ in batch))
+    sent_ids, failed, retry, blocked_users = [], [], [], []
+    for (nid, user_id, _, _, _, attempts), result in zip(batch, results):
+        if result == DELIVERY_SENT:
+            sent_ids.append(nid)
+        elif result == DELIVERY_BLOCKED:
+            failed.append((nid, "бот заблокирован"))
+            blocked_users.append(user_id)
+        elif result == DELIVERY_RETRY and attempts + 1 < NOTIFY_MAX_ATTEMPTS:
+            retry.append((nid, "временная ошибка", _retry_delay(attempts)))
+        else:
+            failed.append((nid, "отклонено Telegram" if result == DELIVERY_FAILED else "превышено число попыток"))
+    await complete_notifications(sent_ids, failed, retry, blocked_users)
+    job_ids = {row[4] for row in batch if row[4] is not None}
+    for job_id, admin_id, chat_id in await finish_notification_jobs(job_ids):
+        if chat_id:
+            await notify(chat_id, "job_done", await get_job_status_text(job_id))
+
+
+async def _worker(bot: Bot, wakeup: asyncio.Event):
+    errors = 0
+    while True:
+        try:
+            wakeup.clear()
+            batch = await claim_notifications(NOTIFY_BATCH_SIZE, NOTIFY_LEASE_SECONDS)
+            if batch:
+                await _process_batch(bot, batch)
+                errors = 0
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Строки остаются в аренде и вернутся в очередь после её истечения
+            errors += 1
+            logger.exception("Ошибка обработки очереди уведомлений")
+            await asyncio.sleep(min(NOTIFY_IDLE_DELAY * 2 ** errors, NOTIFY_RETRY_MAX_DELAY))
+            continue
+        try:
+            await asyncio.wait_for(wakeup.wait(), NOTIFY_IDLE_DELAY)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _lease_reaper():
+    while True:
+        try:
+            reaped = await reap_notification_leases()
+            if reaped:
+                logger.warning(f"📨 Возвращено в очередь уведомлений с истёкшей арендой: {reaped}")
+        except Exception:
+            logger.exception("Ошибка возврата просроченных уведомлений")
+        await asyncio.sleep(NOTIFY_LEASE_SECONDS)
+
+
+async def notification_worker(bot: Bot):
+    """Фоновая задача: NOTIFY_WORKERS воркеров разбирают очередь notifications, пока бот работает.
+    Пачки берутся в аренду, поэтому воркеры не мешают друг другу, а после падения
+    или перезапуска неотправленные строки возвращаются в очередь."""
+    wakeup = _get_wakeup()
+    await asyncio.gather(_lease_reaper(), *(_worker(bot, wakeup) for _ in range(NOTIFY_WORKERS)))
@@ -0,0 +1,126 @@
+"""Ограничение скорости.
+
+Исходящие запросы: Telegram допускает около 30 сообщений в секунду на бота
+и примерно одно сообщение в секунду в один чат. Все массовые отправки
+(рассылки, уведомления) проходят через общий telegram_limiter, чтобы вместе
+не выйти за эти лимиты.
+
+Входящие действия пользователей: user_limiter (GCRA) с квотами RATE_LIMITS
+на каждое действие, используется в RateLimitMiddleware.
+"""
+import asyncio
+import time
+from collections import Counter, OrderedDict
+
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_INTERVAL, RATE_LIMITS, RATE_LIMIT_MAX_KEYS
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None  # создаётся лениво, внутри работающего цикла событий
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (например, после RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class TelegramRateLimiter:
+    """Общий лимит на бота плюс минимальный интервал между сообщениями в один чат"""
+
+    def __init__(self, global_rate: float, per_chat_interval: float, max_chats: int = 10000):
+        self.bucket = TokenBucket(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_chats = max_chats
+        self._next_slot = OrderedDict()  # chat_id -> время, раньше которого писать нельзя
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next_slot.pop(chat_id, 0.0))
+        self._next_slot[chat_id] = slot + self.per_chat_interval
+        while len(self._next_slot) > self.max_chats:
+            self._next_slot.popitem(last=False)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        await self.bucket.acquire()
+
+    def retry_after(self, seconds: float):
+        self.bucket.pause(seconds)
+
+
+class GCRALimiter:
+    """Квоты «count действий за period секунд» на пользователя по алгоритму GCRA.
+    На ключ (пользователь, действие) хранится одно число — теоретическое время
+    следующего запроса (TAT), проверка O(1). Ключи лежат в порядке последнего
+    обращения, всего хранится не больше max_keys."""
+
+    def __init__(self, limits: dict, max_keys: int):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._tat = OrderedDict()  # (user_id, action) -> TAT
+        self.allowed = Counter()
+        self.throttled = Counter()
+
+    def hit(self, user_id: int, action: str) -> float:
+        """Учитывает действие. Возвращает 0, если оно разрешено, иначе сколько секунд ждать."""
+        count, period = self.limits[action]
+        interval = period / count
+        now = time.monotonic()
+        key = (user_id, action)
+        tat = max(self._tat.pop(key, now), now)
+        wait = tat - now - (period - interval)
+        if wait > 0:
+            self._tat[key] = tat
+            self.throttled[action] += 1
+            return wait
+        self._tat[key] = tat + interval
+        self.allowed[action] += 1
+        self._evict()
+        return 0.0
+
+    def _evict(self):
+        # Вытесняется ключ, к которому дольше всех не обращались. При разумном
+        # max_keys его TAT давно в прошлом, и вытеснение ничего не меняет.
+        while len(self._tat) > self.max_keys:
+            self._tat.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._tat),
+            "allowed": dict(self.allowed),
+            "throttled": dict(self.throttled),
+        }
+
+
+telegram_limiter = TelegramRateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_INTERVAL)
+user_limiter = GCRALimiter(RATE_LIMITS, RATE_LIMIT_MAX_KEYS)
+
+
+def get_throttle_stats() -> dict:
+    return user_limiter.stats()
@@ -0,0 +1,84 @@
+"""Очистка старых данных.
+
+Признания и жалобы удаляются пачками по RETENTION_BATCH_SIZE строк: каждая
+пачка — отдельная короткая транзакция по индексу created_at, а между пачками
+очередь записи успевает обслужить остальные запросы. Вместе с признанием
+удаляются жалобы на него, счётчики user_stats уменьшаются в той же
+транзакции. Освободившиеся страницы возвращаются ОС через
+PRAGMA incremental_vacuum, тоже по частям, если база в режиме
+auto_vacuum = INCREMENTAL (новые базы создаются в нём, старые переводятся
+командой /vacuum).
+"""
+import asyncio
+import logging
+
+from config import (
+    AUTO_DELETE_CONFESSIONS_AGE, RETENTION_INTERVAL, RETENTION_BATCH_SIZE,
+    RETENTION_BATCH_PAUSE, RETENTION_VACUUM_PAGES
+)
+from async_db import (
+    delete_old_confessions_batch, delete_old_reports_batch, delete_orphan_reports_batch,
+    incremental_vacuum, checkpoint_wal, get_page_size
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_confessions(age: str) -> tuple:
+    """Возвращает (удалено признаний, удалено жалоб на них)"""
+    confessions = reports = 0
+    while True:
+        deleted, cascaded = await delete_old_confessions_batch(age, RETENTION_BATCH_SIZE)
+        confessions += deleted
+        reports += cascaded
+        if deleted < RETENTION_BATCH_SIZE:
+            return confessions, reports
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+
+async def _purge_rows(delete_batch, *args) -> int:
+    total = 0
+    while True:
+        deleted = await delete_batch(*args, RETENTION_BATCH_SIZE)
+        total += deleted
+        if deleted < RETENTION_BATCH_SIZE:
+            return total
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+
+async def reclaim_space() -> int:
+    """Возвращает ОС свободные страницы. Возвращает число освобождённых байт."""
+    pages = 0
+    while True:
+        freed = await incremental_vacuum(RETENTION_VACUUM_PAGES)
+        pages += freed
+        if freed < RETENTION_VACUUM_PAGES:
+            break
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+    if pages:
+        await checkpoint_wal()
+    return pages * await get_page_size()
+
+
+async def run_retention(confessions_age: str, reports_age: str = None) -> tuple:
+    """Удаляет признания старше confessions_age (с жалобами), жалобы старше reports_age
+    и жалобы на уже удалённые признания. Возвращает (признаний, жалоб, освобождено байт)."""
+    confessions, reports = await purge_confessions(confessions_age)
+    if reports_age:
+        reports += await _purge_rows(delete_old_reports_batch, reports_age)
+    reports += await _purge_rows(delete_orphan_reports_batch)
+    freed = await reclaim_space()
+    return confessions, reports, freed
+
+
+async def retention_scheduler():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        try:
+            confessions, reports, freed = await run_retention(AUTO_DELETE_CONFESSIONS_AGE)
+            logger.info(
+                f"🧹 Автоудаление: удалено {confessions} признаний, {reports} жалоб, "
+                f"освобождено {freed / 1024 / 1024:.1f} МБ"
+            )
+        except Exception:
+            logger.exception("Ошибка автоудаления")
@@ -0,0 +1,85 @@
+"""Замер: автомат Ахо — Корасик (BlacklistMatcher) против прежнего цикла по словам.
+
+Прежний check_text_blacklist для каждого слова списка делал проверку
+`word in text.lower()`, то есть O(слов × длина текста) на сообщение (плюс
+перечитывание таблицы, которое здесь не учитывается). Скрипт строит список
+из случайных кириллических слов (по умолчанию 10 000) и сравнивает оба
+способа на текстах длиной MAX_TEXT_LENGTH. Совпадения автомата сверяются
+с простым поиском подстрок по нормализованному тексту.
+
+    python scripts/bench_blacklist.py [--words 10000] [--texts 50]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blacklist import BlacklistMatcher, normalize  # noqa: E402
+from config import MAX_TEXT_LENGTH  # noqa: E402
+
+ALPHABET = "абвгдежзийклмнопрстуфхцчшщъыьэюя"
+
+
+def random_word(rng: random.Random, low: int = 5, high: int = 10) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def random_text(rng: random.Random, words: list) -> str:
+    parts, length = [], 0
+    while length < MAX_TEXT_LENGTH:
+        # изредка вставляем слово из списка, чтобы были и совпадения
+        word = rng.choice(words) if rng.random() < 0.002 else random_word(rng, 2, 9)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)[:MAX_TEXT_LENGTH]
+
+
+def old_check(words: list, text: str) -> list:
+    text_lower = text.lower()
+    return [word for word in words if word in text_lower]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=10_000)
+    parser.add_argument("--texts", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = list({random_word(rng) for _ in range(args.words)})
+    texts = [random_text(rng, words) for _ in range(args.texts)]
+
+    started = time.perf_counter()
+    matcher = BlacklistMatcher(words)
+    built = time.perf_counter() - started
+
+    started = time.perf_counter()
+    new_results = [matcher.find(text) for text in texts]
+    new_time = (time.perf_counter() - started) / len(texts)
+
+    started = time.perf_counter()
+    for text in texts:
+        old_check(words, text)
+    old_time = (time.perf_counter() - started) / len(texts)
+
+    mismatches = 0
+    for text, found in zip(texts, new_results):
+        normalized = normalize(text)
+        expected = {word for word in words if normalize(word) in normalized}
+        if set(found) != expected:
+            mismatches += 1
+
+    print(f"слов: {len(words)}, текстов: {len(texts)} по {MAX_TEXT_LENGTH} символов")
+    print(f"сборка автомата: {built:.2f} с")
+    print(f"Ахо — Корасик:   {new_time * 1000:.1f} мс на текст")
+    print(f"цикл по словам:  {old_time * 1000:.1f} мс на текст ({old_time / new_time:.0f}x)")
+    print(f"расхождений с поиском подстрок: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Замер: постоянные соединения db_* против открытия соединения на каждый запрос.
+
+Создаёт во временном каталоге базу через init_db, заполняет confessions
+(по умолчанию 1 000 000 строк) и выполняет одинаковые выборки по первичному
+ключу двумя способами:
+
+- connect-per-query — как было раньше: sqlite3.connect, запрос, close;
+- pooled — database.db_fetch_one с постоянным соединением потока.
+
+    python scripts/bench_connections.py [--rows 1000000] [--queries 20000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+QUERY = "SELECT id, from_user, to_user, text FROM confessions WHERE id = ?"
+
+
+def fill_confessions(rows: int):
+    conn = database.get_connection()
+    with conn:
+        conn.execute(
+            """WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+               INSERT INTO confessions (from_user, to_user, text)
+               SELECT abs(random()) % 100000, abs(random()) % 100000, 'признание ' || i FROM n""",
+            (rows,)
+        )
+
+
+def connect_per_query(ids: list):
+    for confession_id in ids:
+        conn = sqlite3.connect(database.DB_PATH)
+        cur = conn.cursor()
+        cur.execute(QUERY, (confession_id,))
+        cur.fetchone()
+        conn.close()
+
+
+def pooled(ids: list):
+    for confession_id in ids:
+        database.db_fetch_one(QUERY, (confession_id,))
+
+
+def measure(func, ids: list) -> float:
+    started = time.perf_counter()
+    func(ids)
+    return len(ids) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_connections_") as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.init_db()
+        started = time.perf_counter()
+        fill_confessions(args.rows)
+        print(f"confessions: {args.rows} строк за {time.perf_counter() - started:.1f} с")
+
+        ids = [random.randint(1, args.rows) for _ in range(args.queries)]
+        pooled(ids[:1000])  # прогрев страничного кеша для обоих способов
+        before = measure(connect_per_query, ids)
+        after = measure(pooled, ids)
+        database.close_connections()
+
+    print(f"connect-per-query: {before:,.0f} запросов/с")
+    print(f"pooled:            {after:,.0f} запросов/с ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Проверка нормализации и поиска BlacklistMatcher на характерных случаях.
+
+    python scripts/check_blacklist.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blacklist import BlacklistMatcher  # noqa: E402
+
+# (слова списка, текст, ожидаемые совпадения)
+CASES = [
+    (["спам"], "это спамер", ["спам"]),                        # внутри слова
+    (["ёлка"], "ЕЛКА", ["ёлка"]),                               # ё → е, регистр
+    (["спам"], "купи cпaм тут", ["спам"]),                      # латинские c и a среди кириллицы
+    (["рор"], "pop music", []),                                 # латинский текст не становится кириллицей
+    (["сор", "хук"], "cop hook xyk", []),
+    (["нет"], "net ten", []),
+    (["spam"], "no spam here", ["spam"]),                       # латинские слова списка работают как раньше
+    (["spam"], "спам", []),
+    (["ｓｐａｍ"], "spam", ["ｓｐａｍ"]),                          # NFKC: полноширинные буквы
+    (["плохое слово"], "очень плохое слово", ["плохое слово"]),
+]
+
+
+def main():
+    failed = 0
+    for words, text, expected in CASES:
+        found = BlacklistMatcher(words).find(text)
+        if found != expected:
+            failed += 1
+            print(f"FAIL {words!r} в {text!r}: {found!r}, ожидалось {expected!r}")
+    print(f"Проверено случаев: {len(CASES)}, ошибок: {failed}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
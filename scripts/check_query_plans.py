@@ -0,0 +1,93 @@
+"""Проверка планов горячих запросов (EXPLAIN QUERY PLAN).
+
+Создаёт пустую базу во временном каталоге через init_db (со всеми
+миграциями), вызывает функции database.py и перехватывает выполненные ими
+запросы. Для каждого запроса проверяется, что в плане есть нужный индекс и
+нет полного прохода по таблице (SCAN без USING). Если после изменения
+схемы или запроса индекс перестал использоваться, скрипт завершается с
+кодом 1.
+
+    python scripts/check_query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+# (название, вызов, индекс, который должен быть в плане)
+HOT_QUERIES = [
+    ("признания пользователя", lambda: database.get_confessions_by_user(1), "idx_confessions_to_user"),
+    ("признания пользователя", lambda: database.get_confessions_by_user(1), "idx_confessions_from_user"),
+    ("лента: от пользователя", lambda: database.get_confession_feed({"from": 1}), "idx_confessions_from_user"),
+    ("лента: пользователю", lambda: database.get_confession_feed({"to": 1}), "idx_confessions_to_user"),
+    ("лента: VIP", lambda: database.get_confession_feed({"vip": True}), "idx_confessions_vip"),
+    ("лента: VIP, число", lambda: database.count_confession_feed({"vip": True}), "idx_confessions_vip"),
+    ("лента: медиа", lambda: database.get_confession_feed({"media": "photo"}), "idx_confessions_media"),
+    ("лента: период", lambda: database.get_confession_feed({"since": "2024-01-01"}), "idx_confessions_created_at"),
+    ("жалобы на признание", lambda: database.delete_confession(1), "idx_reports_confession_id"),
+    ("пользователь по username", lambda: database.get_user_by_username("user"), "idx_users_username"),
+    ("рассылка: активные", lambda: database.count_broadcast_recipients("active"), "idx_users_last_active"),
+    ("рассылка: неактивные", lambda: database.count_broadcast_recipients("inactive"), "idx_users_last_active"),
+    ("рассылка: VIP", lambda: database.count_broadcast_recipients("vip"), "idx_users_vip_until"),
+    ("топ за всё время", lambda: database.get_top_users(10), "idx_user_stats_received"),
+    ("уведомления: ожидающие", lambda: database.get_pending_notifications(100), "idx_notifications_due"),
+    ("уведомления: аренда", lambda: database.claim_notifications(100, 60), "idx_notifications_due"),
+    ("предупреждения", lambda: database.get_warns(1), "idx_warnings_user_id"),
+    ("активации промокода", lambda: database.get_promo_activations("CODE"), "idx_promo_activations_code"),
+    ("игра «Кто я?» автора", lambda: database.get_whois_game_by_creator(1, "waiting"), "idx_whois_games_creator"),
+    ("игра «Кто я?» соперника", lambda: database.get_whois_game_by_opponent(1, "active"), "idx_whois_games_opponent"),
+]
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+_PLANNED = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+def _plans(conn, statements: list) -> list:
+    plans = []
+    for sql in statements:
+        if sql.lstrip().split(None, 1)[0].upper() in _PLANNED:
+            details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            plans.append((" ".join(sql.split()), details))
+    return plans
+
+
+def check() -> list:
+    """Возвращает список ошибок; пустой — все запросы идут по индексам"""
+    errors = []
+    with tempfile.TemporaryDirectory(prefix="query_plans_") as tmp:
+        database.DB_PATH = os.path.join(tmp, "plans.db")
+        database.init_db()
+        conn = database.get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            for name, call, index in HOT_QUERIES:
+                statements.clear()
+                call()
+                plans = _plans(conn, statements)
+                if not any(index in detail for _, details in plans for detail in details):
+                    errors.append(f"{name}: не используется {index}")
+                for sql, details in plans:
+                    scans = [detail for detail in details if _FULL_SCAN.match(detail)]
+                    if scans:
+                        errors.append(f"{name}: {', '.join(scans)} в {sql[:100]}")
+        finally:
+            conn.set_trace_callback(None)
+            database.close_connections()
+    return errors
+
+
+def main():
+    errors = check()
+    for error in errors:
+        print(f"FAIL {error}")
+    print(f"Проверено запросов: {len(HOT_QUERIES)}, ошибок: {len(errors)}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Кеш подписки пользователей на канал CHANNEL_ID.
+
+get_chat_member вызывается только при промахе кеша: положительный ответ
+живёт SUBSCRIPTION_TTL секунд, отрицательный — SUBSCRIPTION_NEGATIVE_TTL.
+Одновременные проверки одного пользователя ждут один общий запрос. Если бот
+администратор канала, Telegram присылает апдейты chat_member, и записи
+обновляются по ним сразу, без запросов.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import CHANNEL_ID, SUBSCRIPTION_TTL, SUBSCRIPTION_NEGATIVE_TTL, SUBSCRIPTION_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+
+def is_channel(chat) -> bool:
+    """Тот ли это чат, что указан в CHANNEL_ID (@username или числовой id)"""
+    channel = str(CHANNEL_ID)
+    if channel.startswith("@"):
+        return bool(chat.username) and chat.username.lower() == channel[1:].lower()
+    return str(chat.id) == channel
+
+
+class SubscriptionCache:
+    def __init__(self, ttl: float = SUBSCRIPTION_TTL, negative_ttl: float = SUBSCRIPTION_NEGATIVE_TTL,
+                 max_size: int = SUBSCRIPTION_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (подписан, истекает, когда записано)
+        self._pending = {}             # user_id -> задача с запросом get_chat_member
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, user_id: int, subscribed: bool, stored_at: float):
+        entry = self._entries.get(user_id)
+        if entry and entry[2] > stored_at:
+            # пока шёл запрос, пришёл chat_member — он новее
+            return
+        ttl = self.ttl if subscribed else self.negative_ttl
+        self._entries[user_id] = (subscribed, stored_at + ttl, stored_at)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, user_id: int, bot) -> bool:
+        started = time.monotonic()
+        try:
+            member = await bot.get_chat_member(CHANNEL_ID, user_id)
+            subscribed = member.status in MEMBER_STATUSES
+        except Exception as e:
+            logger.warning(f"Не удалось проверить подписку {user_id}: {e}")
+            subscribed = False
+        self._store(user_id, subscribed, started)
+        return subscribed
+
+    async def check(self, user_id: int, bot, recheck_negative: bool = False) -> bool:
+        """Подписан ли пользователь. recheck_negative — не верить закешированному
+        «не подписан» (пользователь сам нажал «Проверить подписку»)."""
+        entry = self._entries.get(user_id)
+        if entry and entry[1] > time.monotonic() and (entry[0] or not recheck_negative):
+            self.hits += 1
+            return entry[0]
+        task = self._pending.get(user_id)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(user_id, bot))
+            self._pending[user_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    def update(self, user_id: int, status: str):
+        """Новый статус пользователя в канале из апдейта chat_member"""
+        self._store(user_id, status in MEMBER_STATUSES, time.monotonic())
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+subscription_cache = SubscriptionCache()
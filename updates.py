@@ -0,0 +1,284 @@
+"""Получение обновлений от Telegram.
+
+Режим выбирается UPDATE_MODE. В режиме webhook aiohttp-сервер принимает
+POST от Telegram, сверяет заголовок X-Telegram-Bot-Api-Secret-Token, сразу
+отвечает 200 и передаёт обновление в update_scheduler. Если в нём уже
+UPDATE_QUEUE_SIZE обновлений, Telegram получает 503 и повторит доставку
+позже. Пока бот выключен, Telegram копит
+обновления у себя и доставит их после запуска.
+
+В режиме polling при POLLING_SKIP_UPDATES = False накопившиеся за время
+простоя обновления вычитываются пачками и разбираются до начала обычного
+опроса. Сам опрос тоже идёт через update_scheduler (OrderedDispatcher) и
+не запрашивает новые обновления, пока очередь полна, так что обновления
+одного пользователя во всех режимах обрабатываются по порядку.
+"""
+import asyncio
+import hmac
+import logging
+import secrets
+import time
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+from aiohttp.helpers import sentinel
+from aiogram import Bot, Dispatcher, types
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS, WEBAPP_HOST, WEBAPP_PORT,
+    UPDATE_QUEUE_SIZE, UPDATE_CONCURRENCY, UPDATE_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _update_key(update: types.Update):
+    """Ключ очереди: id пользователя, от которого пришло обновление.
+    Обновления без пользователя ни с чем не упорядочиваются."""
+    for event in (update.message, update.edited_message, update.callback_query,
+                  update.chat_member, update.my_chat_member):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return ("update", update.update_id)
+
+
+class UpdateScheduler:
+    """Очереди обновлений по пользователям перед диспетчером.
+
+    Обновления одного пользователя обрабатываются строго по одному и по
+    порядку, поэтому двойное нажатие не проходит параллельно через
+    send_confirmation или activate_promo_code. Разных пользователей
+    обрабатывают параллельно, но одновременно выполняется не больше
+    UPDATE_CONCURRENCY обработчиков, а всего ждёт не больше
+    UPDATE_QUEUE_SIZE обновлений."""
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.dp = None
+        self._queues = {}  # ключ -> deque[(обновление, время постановки)]
+        self._tasks = {}   # ключ -> задача, разбирающая очередь этого ключа
+        self._pending = 0
+        self._semaphore = None  # события создаются в start(), внутри цикла событий
+        self._space = None
+        self._put_lock = None
+        self._idle = None
+        self.in_flight = 0
+        self.processed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self, dp: Dispatcher):
+        self.dp = dp
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._space = asyncio.Event()
+        self._space.set()
+        self._put_lock = asyncio.Lock()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _enqueue(self, update: types.Update):
+        key = _update_key(update)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._tasks[key] = asyncio.create_task(self._run(key, queue))
+        queue.append((update, time.monotonic()))
+        self._pending += 1
+        self._idle.clear()
+        if self._pending >= self.max_pending:
+            self._space.clear()
+
+    def offer(self, update: types.Update) -> bool:
+        """Ставит обновление в очередь без ожидания; False, если места нет"""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self._enqueue(update)
+        return True
+
+    async def put(self, updates: list):
+        """Ставит пачку обновлений в очередь, дожидаясь места. Пачки встают
+        в очередь целиком и в порядке вызова, так что порядок сохраняется."""
+        async with self._put_lock:
+            for update in updates:
+                await self.wait_for_space()
+                self._enqueue(update)
+
+    async def wait_for_space(self):
+        while self._pending >= self.max_pending:
+            await self._space.wait()
+
+    async def join(self):
+        await self._idle.wait()
+
+    async def _run(self, key, queue: deque):
+        Dispatcher.set_current(self.dp)
+        Bot.set_current(self.dp.bot)
+        try:
+            while queue:
+                update, enqueued_at = queue[0]
+                async with self._semaphore:
+                    wait = time.monotonic() - enqueued_at
+                    self._wait_total += wait
+                    self.wait_max = max(self.wait_max, wait)
+                    self.in_flight += 1
+                    try:
+                        # через updates_handler, чтобы сработали middleware уровня update
+                        await self.dp.updates_handler.notify(update)
+                    except Exception:
+                        logger.exception(f"Ошибка обработки обновления {update.update_id}")
+                    finally:
+                        self.in_flight -= 1
+                queue.popleft()
+                self.processed += 1
+                self._pending -= 1
+                self._space.set()
+                if not self._pending:
+                    self._idle.set()
+        finally:
+            # очередь пуста, и между проверкой и удалением нет await
+            del self._queues[key]
+            del self._tasks[key]
+
+    async def stop(self, timeout: float = UPDATE_DRAIN_TIMEOUT):
+        if self.dp is None:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не разобрано обновлений при остановке: {self._pending}")
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        started = self.processed + self.in_flight
+        return {
+            "pending": self._pending,
+            "in_flight": self.in_flight,
+            "users": len(self._queues),
+            "max_user_depth": max(map(len, self._queues.values()), default=0),
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "wait_avg": self._wait_total / started if started else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+class OrderedDispatcher(Dispatcher):
+    """Dispatcher, у которого long polling передаёт обновления в update_scheduler.
+
+    Стандартный start_polling запускает каждую пачку отдельной задачей и сразу
+    запрашивает следующую, так что при медленной обработке задачи копятся без
+    ограничения. Здесь следующий getUpdates выполняется только после того, как
+    пачка встала в очередь и в ней есть место: в памяти не больше
+    UPDATE_QUEUE_SIZE обновлений плюс одна пачка, остальное ждёт у Telegram."""
+
+    async def start_polling(self, timeout=20, relax=0.1, limit=None, reset_webhook=None, fast: bool = True,
+                            error_sleep: int = 5, allowed_updates=None):
+        if self._polling:
+            raise RuntimeError("Polling already started")
+        Dispatcher.set_current(self)
+        Bot.set_current(self.bot)
+        if reset_webhook is None:
+            await self.reset_webhook(check=False)
+        if reset_webhook:
+            await self.reset_webhook(check=True)
+        self._polling = True
+        offset = None
+        request_timeout = None
+        if self.bot.timeout is not sentinel and timeout is not None:
+            request_timeout = aiohttp.ClientTimeout(total=self.bot.timeout.total + timeout or 1)
+        try:
+            while self._polling:
+                await update_scheduler.wait_for_space()
+                try:
+                    with self.bot.request_timeout(request_timeout):
+                        updates = await self.bot.get_updates(
+                            limit=limit, offset=offset, timeout=timeout, allowed_updates=allowed_updates
+                        )
+                except asyncio.CancelledError:
+                    break
+                except Exception:
+                    logger.exception("Ошибка получения обновлений")
+                    await asyncio.sleep(error_sleep)
+                    continue
+                if updates:
+                    offset = updates[-1].update_id + 1
+                    await update_scheduler.put(updates)
+                if relax:
+                    await asyncio.sleep(relax)
+        finally:
+            self._close_waiter.set_result(None)
+            logger.warning("Polling остановлен")
+
+
+update_scheduler = UpdateScheduler()
+
+
+def get_update_stats() -> dict:
+    return update_scheduler.stats()
+
+
+async def drain_pending_updates(dp: Dispatcher, allowed_updates: list) -> int:
+    """Разбирает обновления, накопившиеся у Telegram, пока бот был выключен.
+    Возвращает их число. Вызывается в on_startup перед обычным опросом."""
+    await dp.bot.delete_webhook()  # getUpdates не работает, пока установлен вебхук
+    offset, count = None, 0
+    while True:
+        updates = await dp.bot.get_updates(offset=offset, limit=100, timeout=0, allowed_updates=allowed_updates)
+        if not updates:
+            break
+        await update_scheduler.put(updates)
+        count += len(updates)
+        offset = updates[-1].update_id + 1
+    await update_scheduler.join()
+    if count:
+        logger.info(f"📥 Разобрано накопившихся обновлений: {count}")
+    return count
+
+
+def start_webhook(dp: Dispatcher, allowed_updates: list, on_startup, on_shutdown):
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    async def handle(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = types.Update(**await request.json())
+        except (ValueError, TypeError):
+            return web.Response(status=400)
+        if not update_scheduler.offer(update):
+            logger.warning("Очередь обновлений заполнена, Telegram повторит доставку")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def startup(app: web.Application):
+        Dispatcher.set_current(dp)
+        Bot.set_current(dp.bot)
+        await on_startup(dp)
+        await dp.bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=allowed_updates,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"🌐 Вебхук {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}, сервер {WEBAPP_HOST}:{WEBAPP_PORT}")
+
+    async def shutdown(app: web.Application):
+        # вебхук не снимаем: Telegram подержит новые обновления до следующего запуска
+        await on_shutdown(dp)
+        session = await dp.bot.get_session()
+        await session.close()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    app.on_startup.append(startup)
+    app.on_cleanup.append(shutdown)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT, access_log=None)
@@ -1,40 +1,59 @@
 import html
-import csv
 import functools
 import inspect
-from io import StringIO
-from datetime import datetime
+import time
 from aiogram import Bot, types
-from config import CHANNEL_ID
-from database import get_user, is_banned, unban_user
+from aiogram.dispatcher.handler import ctx_data
+from subscriptions import subscription_cache
+from async_db import get_user_context
 
-async def check_subscription(user_id: int, bot: Bot) -> bool:
-    try:
-        member = await bot.get_chat_member(CHANNEL_ID, user_id)
-        return member.status in ["member", "administrator", "creator"]
-    except:
-        return False
+async def get_current_user_context(user_id: int):
+    """UserContext, загруженный UserContextMiddleware для текущего апдейта.
+    Вне обработки апдейта (или для другого пользователя) читается из БД."""
+    data = ctx_data.get(None) or {}
+    user_ctx = data.get("user_ctx")
+    if user_ctx is None or user_ctx.id != user_id:
+        user_ctx = await get_user_context(user_id)
+    return user_ctx
 
-def format_time_left(vip_until_str):
-    if not vip_until_str:
+def update_current_user_context(**changes):
+    """Обновляет UserContext текущего апдейта после записи в БД"""
+    data = ctx_data.get(None)
+    if data and data.get("user_ctx") is not None:
+        data["user_ctx"] = data["user_ctx"]._replace(**changes)
+
+async def get_current_user_role(user_id: int):
+    return (await get_current_user_context(user_id)).role
+
+async def check_subscription(user_id: int, bot: Bot, recheck_negative: bool = False) -> bool:
+    return await subscription_cache.check(user_id, bot, recheck_negative)
+
+def _format_duration(seconds: float, days_unit: str = "дн.", hours_unit: str = "час.", minutes_unit: str = "мин.") -> str:
+    seconds = int(seconds)
+    if seconds >= 86400:
+        return f"{seconds // 86400} {days_unit}"
+    elif seconds >= 3600:
+        return f"{seconds // 3600} {hours_unit}"
+    else:
+        return f"{seconds // 60} {minutes_unit}"
+
+def format_time_left(until):
+    """Сколько осталось до срока (epoch)"""
+    if not until:
         return "Нет"
-    try:
-        if isinstance(vip_until_str, str):
-            vip_until = datetime.strptime(vip_until_str, '%Y-%m-%d %H:%M:%S')
-        else:
-            vip_until = vip_until_str
-        now = datetime.now()
-        if vip_until < now:
-            return "Истекла"
-        delta = vip_until - now
-        if delta.days > 0:
-            return f"{delta.days} дн."
-        elif delta.seconds // 3600 > 0:
-            return f"{delta.seconds // 3600} час."
-        else:
-            return f"{delta.seconds // 60} мин."
-    except:
-        return "Ошибка"
+    left = until - time.time()
+    if left < 0:
+        return "Истекла"
+    return _format_duration(left)
+
+def format_bar_chart(series, width: int = 16) -> str:
+    """Текстовая диаграмма: series — пары (подпись, число)"""
+    peak = max((value for _, value in series), default=0)
+    lines = []
+    for label, value in series:
+        bar = "█" * round(value / peak * width) if peak else ""
+        lines.append(f"{label} {bar} {value}")
+    return "\n".join(lines)
 
 def format_user_name(user_info):
     if not user_info:
@@ -51,13 +70,6 @@ def format_user_name(user_info):
 def html_escape(text: str) -> str:
     return html.escape(text)
 
-def generate_csv(data, headers):
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(headers)
-    writer.writerows(data)
-    return output.getvalue().encode('utf-8')
-
 # Декоратор для обратной совместимости (используется в старом коде)
 def check_ban_decorator(func):
     @functools.wraps(func)
@@ -77,35 +89,16 @@ def check_ban_decorator(func):
             user_id = call.from_user.id
         else:
             return await func(*args, **kwargs)
-        if is_banned(user_id):
-            user = get_user(user_id)
-            if user and len(user) > 8:
-                ban_until = user[4]
-                ban_reason = user[8]
-                if ban_until:
-                    try:
-                        if isinstance(ban_until, str):
-                            ban_until_dt = datetime.strptime(ban_until, '%Y-%m-%d %H:%M:%S')
-                            time_left = ban_until_dt - datetime.now()
-                            days = time_left.days
-                            if days > 0:
-                                ban_text = f"{days} дней"
-                            else:
-                                hours = time_left.seconds // 3600
-                                if hours > 0:
-                                    ban_text = f"{hours} часов"
-                                else:
-                                    ban_text = f"{time_left.seconds // 60} минут"
-                        else:
-                            ban_text = "навсегда"
-                    except:
-                        ban_text = "навсегда"
-                else:
-                    ban_text = "навсегда"
+        user_ctx = await get_current_user_context(user_id)
+        if user_ctx.is_banned:
+            if user_ctx.exists:
+                ban_text = "навсегда"
+                if user_ctx.ban_until:
+                    ban_text = _format_duration(user_ctx.ban_until - time.time(), "дней", "часов", "минут")
                 if message:
-                    await message.answer(f"🚫 Вы забанены на {ban_text}\nПричина: {ban_reason}")
+                    await message.answer(f"🚫 Вы забанены на {ban_text}\nПричина: {user_ctx.ban_reason}")
                 elif call:
-                    await call.answer(f"🚫 Вы забанены на {ban_text}\nПричина: {ban_reason}", show_alert=True)
+                    await call.answer(f"🚫 Вы забанены на {ban_text}\nПричина: {user_ctx.ban_reason}", show_alert=True)
             else:
                 if message:
                     await message.answer("🚫 Вы заблокированы администрацией.")